@@ -0,0 +1,101 @@
+"""This module contains a throughput benchmark of the broker backends:
+KinesisBroker, sending to FakeKinesis with a configurable call latency,
+and FileBroker, appending to a memory-mapped segment log in a temporary
+directory, which is also read back to measure consumer throughput.
+
+Run from the project root:
+    python -m benchmarks.bench_brokers [--articles N] [--batch-size N]
+        [--kinesis-latency-ms MS]
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from benchmarks.bench_pipeline import offline
+from benchmarks.fake_guardian import build_articles
+from src.brokers import FileBroker, KinesisBroker
+from src.format_article import format_articles
+
+STREAM = 'benchmark-stream'
+
+
+def _rate(count, size, seconds):
+    return {'records': count, 'seconds': seconds,
+            'records_per_s': count / seconds if seconds else float('inf'),
+            'mib_per_s': size / 2 ** 20 / seconds if seconds
+            else float('inf')}
+
+
+def publish(broker, records, batch_size):
+    """
+    Times publishing records in batches, a record per article.
+
+    Returns:
+        float: The seconds taken.
+    """
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        broker.publish_batch(records[start:start + batch_size])
+    broker.flush()
+    return time.perf_counter() - started
+
+
+def run(articles=5000, batch_size=500, kinesis_latency=0.005):
+    """
+    Publishes the same records through each backend.
+
+    Args:
+        articles (int, optional): The articles to publish.
+        Defaults to 5000.
+        batch_size (int, optional): The articles per publish call.
+        Defaults to 500.
+        kinesis_latency (float, optional): Seconds per FakeKinesis call,
+        standing in for the network round trip. Defaults to 0.005.
+
+    Returns:
+        dict: 'records', 'seconds', 'records_per_s' and 'mib_per_s' for
+        'kinesis' and 'file' publishing and 'file_read'.
+    """
+    raw = build_articles(articles)
+    records = format_articles(raw)
+    size = sum(len(record.to_json_bytes()) for record in records)
+    results = {}
+
+    with offline(raw, kinesis_latency=kinesis_latency):
+        seconds = publish(KinesisBroker(STREAM), records, batch_size)
+    results['kinesis'] = _rate(len(records), size, seconds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        broker = FileBroker(directory)
+        results['file'] = _rate(
+            len(records), size, publish(broker, records, batch_size))
+
+        started = time.perf_counter()
+        read = sum(len(broker.read(partition))
+                   for partition in range(broker.partitions))
+        results['file_read'] = _rate(
+            read, size, time.perf_counter() - started)
+        broker.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--kinesis-latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    results = run(args.articles, args.batch_size,
+                  args.kinesis_latency_ms / 1000)
+    print(f"{'backend':>10} {'records':>8} {'seconds':>8} {'records/s':>10} "
+          f"{'MiB/s':>8}")
+    for name, row in results.items():
+        print(f"{name:>10} {row['records']:>8} {row['seconds']:>8.3f} "
+              f"{row['records_per_s']:>10.0f} {row['mib_per_s']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
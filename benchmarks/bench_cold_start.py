@@ -0,0 +1,99 @@
+"""This module contains a benchmark of Lambda cold-start cost: the time
+to import the handler, and the time for the first and a warm call to
+warm_up(), each measured in a fresh interpreter.
+
+Run from the project root:
+    python -m benchmarks.bench_cold_start [--runs N] [--max-import-ms MS]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess  # nosec B404
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in each fresh interpreter and prints its timings as JSON.
+_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import src.handler
+imported = time.perf_counter()
+src.handler.warm_up()
+cold = time.perf_counter()
+src.handler.warm_up()
+warm = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_warm_up_ms": (cold - imported) * 1000,
+    "warm_warm_up_ms": (warm - cold) * 1000,
+    "modules": len(sys.modules),
+}))
+'''
+
+# warm_up() only builds clients, so placeholder settings are enough and
+# nothing is sent over the network.
+_ENV = {
+    'Guardian_API_Key': 'benchmark',
+    'AWS_DEFAULT_REGION': 'eu-west-2',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+}
+
+
+def measure_once():
+    """
+    Measures one cold start in a fresh interpreter.
+
+    Returns:
+        dict: 'import_ms', 'first_warm_up_ms', 'warm_warm_up_ms' and the
+        number of 'modules' loaded.
+    """
+    output = subprocess.run(  # nosec B603
+        [sys.executable, '-c', _PROBE], capture_output=True, text=True,
+        check=True, cwd=ROOT, env={**os.environ, **_ENV}).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs=10):
+    """
+    Measures several cold starts.
+
+    Args:
+        runs (int, optional): The fresh interpreters to start.
+        Defaults to 10.
+
+    Returns:
+        dict: The median and minimum of each timing, keyed by name.
+    """
+    samples = [measure_once() for _ in range(runs)]
+    return {
+        name: {'median': statistics.median(s[name] for s in samples),
+               'min': min(s[name] for s in samples)}
+        for name in samples[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10,
+                        help='fresh interpreters to start')
+    parser.add_argument('--max-import-ms', type=float, default=None,
+                        help='fail if the median handler import is slower')
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print(f"{'measure':>18} {'median':>10} {'min':>10}")
+    for name, row in results.items():
+        print(f"{name:>18} {row['median']:>10.1f} {row['min']:>10.1f}")
+
+    if args.max_import_ms is not None and \
+            results['import_ms']['median'] > args.max_import_ms:
+        print(f"Handler import exceeded {args.max_import_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""This module contains the offline benchmark suite for the whole
+pipeline: api_interaction(), format_article(), send_to_kinesis() and
+main(), run against FakeGuardianSession and FakeKinesis.
+
+For each stage and fixture size it reports latency percentiles,
+throughput and peak memory, and can save the results as JSON and
+compare them with a saved baseline, failing when a stage has slowed
+down by more than the tolerance.
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline [--sizes small,medium,large]
+        [--iterations N] [--output FILE] [--compare BASELINE]
+        [--tolerance 0.2] [--min-delta-ms MS] [--guardian-latency-ms MS]
+        [--kinesis-latency-ms MS] [--throttle-rate RATE]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from unittest import mock
+from benchmarks.fake_guardian import SIZES, FakeGuardianSession, \
+    build_articles, load_articles
+from benchmarks.fake_kinesis import FakeKinesis
+from src.api_interaction import api_interaction
+from src.format_article import format_article, format_articles, \
+    format_articles_parallel
+from src.main import main as run_main
+from src.rate_limiter import RateLimiter, set_rate_limiter
+from src.send_to_kinesis import send_to_kinesis, send_batch_to_kinesis
+
+STREAM = 'benchmark-stream'
+QUERY = 'machine learning'
+
+# The metric compared against a baseline.
+GATE_METRIC = 'p50_ms'
+
+
+@contextlib.contextmanager
+def offline(articles, guardian_latency=0.0, kinesis_latency=0.0,
+            throttle_rate=0.0):
+    """
+    Points the pipeline at the fakes for the duration of the block.
+
+    Args:
+        articles (list): The articles FakeGuardianSession serves.
+        guardian_latency (float, optional): Seconds per API request.
+        Defaults to 0.
+        kinesis_latency (float, optional): Seconds per Kinesis call.
+        Defaults to 0.
+        throttle_rate (float, optional): The share of records Kinesis
+        throttles. Defaults to 0.
+
+    Yields:
+        tuple: The FakeGuardianSession and FakeKinesis in use.
+    """
+    session = FakeGuardianSession(articles, latency=guardian_latency)
+    kinesis = FakeKinesis(latency=kinesis_latency,
+                          throttle_rate=throttle_rate)
+    set_rate_limiter(RateLimiter(per_second=1e9, per_day=None, burst=1e9))
+    try:
+        with mock.patch.dict(os.environ, {'Guardian_API_Key': 'benchmark'}), \
+                mock.patch('src.api_interaction.get_session',
+                           return_value=session), \
+                mock.patch('src.send_to_kinesis.get_kinesis_client',
+                           return_value=kinesis):
+            yield session, kinesis
+    finally:
+        set_rate_limiter(None)
+
+
+def percentile(samples, fraction):
+    """Returns the nearest-rank percentile of sorted samples."""
+    index = max(0, min(len(samples) - 1,
+                       round(fraction * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def measure(call, items, iterations):
+    """
+    Times a call and measures its peak memory.
+
+    The call is made once to warm up, `iterations` times to time it,
+    and once more under tracemalloc, which slows it down too much to
+    time at the same pass.
+
+    Args:
+        call (callable): The work to measure.
+        items (int): The articles handled per call, for throughput.
+        iterations (int): The timed calls.
+
+    Returns:
+        dict: 'iterations', 'items', latency percentiles and mean in
+        milliseconds, 'items_per_s' and 'peak_kib'.
+    """
+    call()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    mean = sum(samples) / len(samples)
+    return {
+        'iterations': iterations,
+        'items': items,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p90_ms': percentile(samples, 0.90) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'mean_ms': mean * 1000,
+        'items_per_s': items / mean if mean else float('inf'),
+        'peak_kib': peak / 1024,
+    }
+
+
+def stages(articles, count):
+    """
+    Returns the calls to benchmark for one fixture size.
+
+    Args:
+        articles (list): The articles being served.
+        count (int): The articles per call.
+
+    Returns:
+        dict: Callables keyed by stage name.
+    """
+    raw = articles[:count]
+    records = format_articles(raw)
+    return {
+        'api_interaction': lambda: api_interaction(
+            QUERY, page=1, page_size=count),
+        'format_article': lambda: [format_article(item) for item in raw],
+        'format_articles': lambda: format_articles(raw),
+        'format_articles_parallel': lambda: format_articles_parallel(
+            raw, min_articles=0),
+        'send_to_kinesis': lambda: send_to_kinesis(records, STREAM),
+        'send_batch_to_kinesis': lambda: send_batch_to_kinesis(
+            records, STREAM, base_delay=0.001),
+        'main': lambda: run_main(QUERY, STREAM, max_articles=count),
+    }
+
+
+def run(sizes=('small', 'medium', 'large'), iterations=20, articles=None,
+        guardian_latency=0.0, kinesis_latency=0.0, throttle_rate=0.0):
+    """
+    Runs every stage at every fixture size.
+
+    Args:
+        sizes (iterable, optional): Names from SIZES, or article counts.
+        Defaults to all of SIZES.
+        iterations (int, optional): The timed calls per stage.
+        Defaults to 20.
+        articles (list, optional): The articles to serve. Defaults to
+        build_articles() of the largest size.
+        guardian_latency (float, optional): Seconds per API request.
+        Defaults to 0.
+        kinesis_latency (float, optional): Seconds per Kinesis call.
+        Defaults to 0.
+        throttle_rate (float, optional): The share of records Kinesis
+        throttles. Defaults to 0.
+
+    Returns:
+        dict: The run's 'meta'data and its 'results', keyed by
+        'stage/size'.
+    """
+    counts = {str(size): SIZES.get(size) or int(size) for size in sizes}
+    articles = articles or build_articles(max(counts.values()))
+    results = {}
+    with offline(articles, guardian_latency, kinesis_latency,
+                 throttle_rate):
+        for size, count in counts.items():
+            count = min(count, len(articles))
+            for stage, call in stages(articles, count).items():
+                results[f'{stage}/{size}'] = measure(call, count, iterations)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': iterations,
+            'guardian_latency': guardian_latency,
+            'kinesis_latency': kinesis_latency,
+            'throttle_rate': throttle_rate,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_delta_ms=0.5,
+            metric=GATE_METRIC):
+    """
+    Finds the stages that have slowed down since a baseline run.
+
+    Args:
+        current (dict): The results of run().
+        baseline (dict): Saved results of an earlier run().
+        tolerance (float, optional): The allowed slowdown, as a fraction
+        of the baseline. Defaults to 0.2.
+        min_delta_ms (float, optional): Slowdowns smaller than this are
+        ignored, as timer noise dominates the fastest stages.
+        Defaults to 0.5.
+        metric (str, optional): The latency to compare.
+        Defaults to GATE_METRIC.
+
+    Returns:
+        list: A description of each regression, empty if none.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before or not before[metric]:
+            continue
+        change = result[metric] / before[metric] - 1
+        if change > tolerance and \
+                result[metric] - before[metric] > min_delta_ms:
+            regressions.append(
+                f'{name}: {metric} {before[metric]:.3f} -> '
+                f'{result[metric]:.3f} (+{change:.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium,large',
+                        help='comma separated fixture sizes or counts')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='timed calls per stage')
+    parser.add_argument('--articles', default=None,
+                        help='a /search response captured from the API')
+    parser.add_argument('--guardian-latency-ms', type=float, default=0.0)
+    parser.add_argument('--kinesis-latency-ms', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None,
+                        help='a baseline JSON file to check against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    report = run(
+        sizes=args.sizes.split(','), iterations=args.iterations,
+        articles=load_articles(args.articles) if args.articles else None,
+        guardian_latency=args.guardian_latency_ms / 1000,
+        kinesis_latency=args.kinesis_latency_ms / 1000,
+        throttle_rate=args.throttle_rate)
+
+    print(f"{'stage/size':>30} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'items/s':>10} {'peak KiB':>9}")
+    for name, row in report['results'].items():
+        print(f"{name:>30} {row['p50_ms']:>9.3f} {row['p90_ms']:>9.3f} "
+              f"{row['p99_ms']:>9.3f} {row['items_per_s']:>10.0f} "
+              f"{row['peak_kib']:>9.1f}")
+
+    if args.output:
+        directory = os.path.dirname(os.path.abspath(args.output))
+        os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, args.tolerance,
+                              args.min_delta_ms)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""This module contains a benchmark comparing extract_preview() with
+the raw 1000 character slice it replaced in format_article().
+
+Run from the project root:
+    python -m benchmarks.bench_preview [--bodies FILE] [--number N]
+"""
+
+import argparse
+import json
+import os
+import timeit
+from src.preview import extract_preview
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'guardian_bodies.json')
+
+
+def load_bodies(path=FIXTURE):
+    """
+    Loads article bodies from a JSON fixture.
+
+    Args:
+        path (str, optional): A JSON file holding either a list of bodies
+        or an object with a 'bodies' list. Defaults to FIXTURE.
+
+    Returns:
+        list: The article bodies.
+    """
+    with open(path, 'r', encoding='utf-8') as fixture:
+        data = json.load(fixture)
+    return data['bodies'] if isinstance(data, dict) else data
+
+
+def run(bodies, number=2000):
+    """
+    Times the slice and extract_preview() on each body.
+
+    Args:
+        bodies (list): The article bodies to benchmark.
+        number (int, optional): The calls timed per body. Defaults to 2000.
+
+    Returns:
+        list: One dict per body with its size and the microseconds per
+        call for each approach.
+    """
+    results = []
+    for body in bodies:
+        sliced = timeit.timeit(lambda: body[:1000], number=number)
+        extracted = timeit.timeit(
+            lambda: extract_preview(body, 1000), number=number)
+        results.append({
+            'body_chars': len(body),
+            'slice_us': sliced / number * 1e6,
+            'extract_preview_us': extracted / number * 1e6,
+            'preview_markup_chars': body[:1000].count('<'),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bodies', default=FIXTURE,
+                        help='JSON file of article bodies')
+    parser.add_argument('--number', type=int, default=2000,
+                        help='calls timed per body')
+    args = parser.parse_args()
+
+    print(f"{'body chars':>10} {'slice us':>10} {'extract us':>11} "
+          f"{'tags in slice':>14}")
+    for row in run(load_bodies(args.bodies), args.number):
+        print(f"{row['body_chars']:>10} {row['slice_us']:>10.2f} "
+              f"{row['extract_preview_us']:>11.2f} "
+              f"{row['preview_markup_chars']:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""This module contains FakeGuardianSession, an in-process stand-in for
+the requests.Session used to call the Guardian content API, and the
+fixtures it serves.
+
+Search responses are built from the recorded-style article bodies in
+fixtures/guardian_bodies.json, in the same JSON shape as the live
+/search endpoint, so every part of the client (paging, streaming
+parsing and formatting) does its real work. A response captured from
+the live API can be served instead with load_articles().
+"""
+
+import json
+import math
+import time
+from benchmarks.bench_preview import load_bodies
+
+# Articles per response for each fixture size. 200 is the largest page
+# the Guardian API returns.
+SIZES = {'small': 10, 'medium': 50, 'large': 200}
+
+
+def build_articles(count, bodies=None):
+    """
+    Builds Guardian search results with the recorded-style bodies.
+
+    Args:
+        count (int): The number of articles.
+        bodies (list, optional): The article bodies to cycle through.
+        Defaults to the bodies fixture.
+
+    Returns:
+        list: Article dicts as found in a response's 'results', newest
+        first.
+    """
+    bodies = bodies or load_bodies()
+    articles = []
+    for index in range(count):
+        day = 28 - index % 28
+        slug = f'benchmark-article-{index}'
+        body = bodies[index % len(bodies)]
+        articles.append({
+            'id': f'technology/2024/jan/{day:02d}/{slug}',
+            'type': 'article',
+            'sectionId': 'technology',
+            'sectionName': 'Technology',
+            'webPublicationDate': f'2024-01-{day:02d}T{index % 24:02d}:00:00Z',  # noqa
+            'webTitle': f'Benchmark article {index} on machine learning',
+            'webUrl': f'https://www.theguardian.com/technology/2024/jan/{day:02d}/{slug}',  # noqa
+            'apiUrl': f'https://content.guardianapis.com/technology/2024/jan/{day:02d}/{slug}',  # noqa
+            'fields': {'trailText': body[:160], 'body': body},
+            'isHosted': False,
+            'pillarId': 'pillar/news',
+            'pillarName': 'News',
+        })
+    return articles
+
+
+def load_articles(path):
+    """
+    Loads the articles from a search response captured from the API.
+
+    Args:
+        path (str): A JSON file holding a full /search response.
+
+    Returns:
+        list: The response's 'results'.
+    """
+    with open(path, 'r', encoding='utf-8') as fixture:
+        return json.load(fixture)['response']['results']
+
+
+def build_response(articles, page=1, page_size=10):
+    """
+    Builds one page of a /search response.
+
+    Args:
+        articles (list): Every article matching the search.
+        page (int, optional): The page number. Defaults to 1.
+        page_size (int, optional): The articles per page. Defaults to 10.
+
+    Returns:
+        dict: The response, as returned by the API.
+    """
+    start = (page - 1) * page_size
+    return {'response': {
+        'status': 'ok',
+        'userTier': 'developer',
+        'total': len(articles),
+        'startIndex': start + 1,
+        'pageSize': page_size,
+        'currentPage': page,
+        'pages': max(1, math.ceil(len(articles) / page_size)),
+        'orderBy': 'newest',
+        'results': articles[start:start + page_size],
+    }}
+
+
+class FakeResponse:
+    """A requests.Response stand-in holding a JSON body."""
+
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(
+                f'{self.status_code} Error', response=self)
+
+    def close(self):
+        pass
+
+
+class FakeGuardianSession:
+    """
+    Serves /search pages from a list of articles.
+
+    Each page is encoded to JSON once and then reused, so the session
+    adds no more than `latency` to what it is measuring.
+
+    Args:
+        articles (list): Every article matching any search.
+        latency (float, optional): Seconds added to every request.
+        Defaults to 0.
+    """
+
+    def __init__(self, articles, latency=0.0):
+        self.articles = articles
+        self.latency = latency
+        self.requests = 0
+        self._pages = {}
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        params = params or {}
+        page = int(params.get('page', 1))
+        page_size = int(params.get('page-size', 10))
+        key = (page, page_size)
+        if key not in self._pages:
+            self._pages[key] = json.dumps(build_response(
+                self.articles, page, page_size)).encode('utf-8')
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(self._pages[key])
+
+    def close(self):
+        pass
@@ -0,0 +1,244 @@
+"""This module contains FakeKinesis, an in-process stand-in for a boto3
+Kinesis client, used to benchmark and test producers and consumers
+without AWS.
+
+It implements the calls this project makes (put_record, put_records,
+list_shards, get_shard_iterator and get_records) with the same request
+and response shapes, routes records to shards by hash key, and can add
+latency to every call and throttle a share of the records it is sent.
+"""
+
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# The whole 128-bit hash key space.
+MAX_HASH_KEY = 2 ** 128 - 1
+
+THROTTLED = 'ProvisionedThroughputExceededException'
+
+
+def _hash_key(partition_key, explicit_hash_key=None):
+    if explicit_hash_key is not None:
+        return int(explicit_hash_key)
+    digest = hashlib.md5(partition_key.encode('utf-8'), usedforsecurity=False)  # noqa
+    return int.from_bytes(digest.digest(), 'big')
+
+
+class _Shard:
+    def __init__(self, shard_id, start, end, parent=None):
+        self.shard_id = shard_id
+        self.start = start
+        self.end = end
+        self.parent = parent
+        self.records = []
+        self.first_sequence = None
+        self.closed_at = None
+
+    def describe(self):
+        sequence_range = {'StartingSequenceNumber': self.first_sequence
+                          or '0'}
+        if self.closed_at is not None:
+            sequence_range['EndingSequenceNumber'] = self.closed_at
+        description = {
+            'ShardId': self.shard_id,
+            'HashKeyRange': {'StartingHashKey': str(self.start),
+                             'EndingHashKey': str(self.end)},
+            'SequenceNumberRange': sequence_range,
+        }
+        if self.parent is not None:
+            description['ParentShardId'] = self.parent
+        return description
+
+
+class FakeKinesis:
+    """
+    An in-memory Kinesis stream with a boto3-like client interface.
+
+    Args:
+        shard_count (int, optional): The number of shards, splitting the
+        hash key space evenly. Defaults to 4.
+        latency (float, optional): Seconds added to every call.
+        Defaults to 0.
+        throttle_rate (float, optional): The share of records rejected
+        with ProvisionedThroughputExceededException. Defaults to 0.
+        seed (int, optional): Seeds the throttling, so runs are
+        repeatable. Defaults to 0.
+        page_size (int, optional): The shards per list_shards page.
+        Defaults to 100.
+    """
+
+    def __init__(self, shard_count=4, latency=0.0, throttle_rate=0.0,
+                 seed=0, page_size=100):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.calls = {}
+        self._random = random.Random(seed)  # nosec B311
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._shards = []
+        width = (MAX_HASH_KEY + 1) // shard_count
+        for index in range(shard_count):
+            end = MAX_HASH_KEY if index == shard_count - 1 \
+                else (index + 1) * width - 1
+            self._shards.append(_Shard(
+                self._shard_id(index), index * width, end))
+
+    @staticmethod
+    def _shard_id(index):
+        return f'shardId-{index:012d}'
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _error(self, code, message, operation):
+        from botocore.exceptions import ClientError
+        return ClientError(
+            {'Error': {'Code': code, 'Message': message}}, operation)
+
+    def _shard(self, shard_id, operation):
+        for shard in self._shards:
+            if shard.shard_id == shard_id:
+                return shard
+        raise self._error('ResourceNotFoundException',
+                          f'Shard {shard_id} not found', operation)
+
+    def _append(self, data, partition_key, explicit_hash_key=None):
+        """Stores a record on its shard and returns the result entry."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        hash_key = _hash_key(partition_key, explicit_hash_key)
+        with self._lock:
+            shard = next(shard for shard in self._shards
+                         if shard.closed_at is None
+                         and shard.start <= hash_key <= shard.end)
+            self._sequence += 1
+            sequence = f'{self._sequence:056d}'
+            if shard.first_sequence is None:
+                shard.first_sequence = sequence
+            shard.records.append({
+                'SequenceNumber': sequence,
+                'ApproximateArrivalTimestamp': datetime.now(timezone.utc),
+                'Data': bytes(data),
+                'PartitionKey': partition_key,
+            })
+        return {'ShardId': shard.shard_id, 'SequenceNumber': sequence}
+
+    def _throttled(self):
+        return self.throttle_rate and \
+            self._random.random() < self.throttle_rate
+
+    def put_record(self, StreamName, Data, PartitionKey,
+                   ExplicitHashKey=None):
+        self._call('put_record')
+        if self._throttled():
+            raise self._error(THROTTLED, 'Rate exceeded for shard',
+                              'PutRecord')
+        return self._append(Data, PartitionKey, ExplicitHashKey)
+
+    def put_records(self, StreamName, Records):
+        self._call('put_records')
+        results = []
+        failed = 0
+        for record in Records:
+            if self._throttled():
+                failed += 1
+                results.append({'ErrorCode': THROTTLED,
+                                'ErrorMessage': 'Rate exceeded for shard'})
+            else:
+                results.append(self._append(
+                    record['Data'], record['PartitionKey'],
+                    record.get('ExplicitHashKey')))
+        return {'FailedRecordCount': failed, 'Records': results}
+
+    def list_shards(self, StreamName=None, NextToken=None):
+        self._call('list_shards')
+        start = int(NextToken) if NextToken else 0
+        with self._lock:
+            page = [shard.describe() for shard in
+                    self._shards[start:start + self.page_size]]
+            more = start + self.page_size < len(self._shards)
+        response = {'Shards': page}
+        if more:
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+    def get_shard_iterator(self, StreamName, ShardId, ShardIteratorType,
+                           StartingSequenceNumber=None):
+        self._call('get_shard_iterator')
+        shard = self._shard(ShardId, 'GetShardIterator')
+        with self._lock:
+            if ShardIteratorType == 'TRIM_HORIZON':
+                position = 0
+            elif ShardIteratorType == 'LATEST':
+                position = len(shard.records)
+            else:
+                sequences = [record['SequenceNumber']
+                             for record in shard.records]
+                position = next(
+                    (index for index, sequence in enumerate(sequences)
+                     if int(sequence) >= int(StartingSequenceNumber)),
+                    len(sequences))
+                if ShardIteratorType == 'AFTER_SEQUENCE_NUMBER' and \
+                        position < len(sequences) and \
+                        sequences[position] == StartingSequenceNumber:
+                    position += 1
+        return {'ShardIterator': f'{ShardId}:{position}'}
+
+    def get_records(self, ShardIterator, Limit=10000):
+        self._call('get_records')
+        shard_id, position = ShardIterator.rsplit(':', 1)
+        shard = self._shard(shard_id, 'GetRecords')
+        position = int(position)
+        with self._lock:
+            records = shard.records[position:position + Limit]
+            position += len(records)
+            behind = len(shard.records) - position
+            finished = shard.closed_at is not None and not behind
+        return {
+            'Records': [dict(record) for record in records],
+            'NextShardIterator': None if finished
+            else f'{shard_id}:{position}',
+            'MillisBehindLatest': 0 if not behind else 1000,
+        }
+
+    def split_shard(self, shard_id):
+        """
+        Splits an open shard in two at the midpoint of its hash range.
+
+        The parent shard is closed: it keeps its records, accepts no new
+        ones, and its children are listed with it as ParentShardId.
+
+        Args:
+            shard_id (str): The shard to split.
+
+        Returns:
+            list: The two child shard ids.
+        """
+        parent = self._shard(shard_id, 'SplitShard')
+        with self._lock:
+            parent.closed_at = f'{self._sequence:056d}'
+            middle = (parent.start + parent.end) // 2
+            children = [
+                _Shard(self._shard_id(len(self._shards)), parent.start,
+                       middle, parent=shard_id),
+                _Shard(self._shard_id(len(self._shards) + 1), middle + 1,
+                       parent.end, parent=shard_id),
+            ]
+            self._shards.extend(children)
+        return [child.shard_id for child in children]
+
+    def records(self):
+        """list: Every stored record, in the order they were written."""
+        with self._lock:
+            stored = [record for shard in self._shards
+                      for record in shard.records]
+        return sorted(stored, key=lambda record: record['SequenceNumber'])
+
+    def close(self):
+        """Does nothing; boto3 clients have close() as well."""
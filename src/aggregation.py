@@ -0,0 +1,344 @@
+"""This module contains the definitions for packing many user records
+into one Kinesis record in the Kinesis Producer Library (KPL)
+aggregated record format, and for unpacking them again.
+
+An aggregated record is the KPL magic number, an AggregatedRecord
+protobuf message and the MD5 digest of that message:
+
+    message AggregatedRecord {
+        repeated string partition_key_table = 1;
+        repeated string explicit_hash_key_table = 2;
+        repeated Record records = 3;
+    }
+    message Record {
+        required uint64 partition_key_index = 1;
+        optional uint64 explicit_hash_key_index = 2;
+        required bytes data = 3;
+        repeated Tag tags = 4;
+    }
+
+so the records can be read by the KCL, the Lambda event source and
+the aws-kinesis-agg libraries as well as by deaggregate().
+"""
+
+import bisect
+import hashlib
+
+MAGIC = b'\xf3\x89\x9a\xc2'
+DIGEST_LENGTH = 16
+
+# The Kinesis limit on data plus partition key for one record.
+MAX_AGGREGATED_BYTES = 1024 * 1024
+
+_PARTITION_KEY_TABLE = 1
+_EXPLICIT_HASH_KEY_TABLE = 2
+_RECORDS = 3
+_PARTITION_KEY_INDEX = 1
+_EXPLICIT_HASH_KEY_INDEX = 2
+_DATA = 3
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number, payload):
+    """Encodes a length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError('Truncated protobuf varint!')
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(data):
+    """Yields (field number, value) pairs from a protobuf message."""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            if pos + length > len(data):
+                raise ValueError('Truncated protobuf field!')
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}!')
+        yield number, value
+
+
+def hash_key_for(partition_key):
+    """
+    Returns the 128-bit hash key Kinesis assigns to a partition key.
+
+    Args:
+        partition_key (str): The partition key.
+
+    Returns:
+        int: The MD5 of the key as an integer.
+    """
+    digest = hashlib.md5(partition_key.encode('utf-8'), usedforsecurity=False)  # noqa
+    return int.from_bytes(digest.digest(), 'big')
+
+
+class Aggregator:
+    """
+    Packs user records into KPL aggregated records of up to `max_bytes`.
+
+    Args:
+        max_bytes (int, optional): The maximum size of an aggregated
+        record including its partition key. Defaults to
+        MAX_AGGREGATED_BYTES.
+    """
+
+    def __init__(self, max_bytes=MAX_AGGREGATED_BYTES):
+        self.max_bytes = max_bytes
+        self._reset()
+
+    def _reset(self):
+        self._partition_keys = {}
+        self._explicit_hash_keys = {}
+        self._body = bytearray()
+        self._first = None
+        self._size = len(MAGIC) + DIGEST_LENGTH
+        self.count = 0
+
+    def _encode_record(self, partition_key, data, explicit_hash_key):
+        """Returns the encoded record and the bytes its keys add."""
+        added = 0
+        pk_index = self._partition_keys.get(partition_key)
+        if pk_index is None:
+            pk_index = len(self._partition_keys)
+            added += len(_field(
+                _PARTITION_KEY_TABLE, partition_key.encode('utf-8')))
+        record = _varint(_PARTITION_KEY_INDEX << 3) + _varint(pk_index)
+
+        if explicit_hash_key is not None:
+            ehk_index = self._explicit_hash_keys.get(explicit_hash_key)
+            if ehk_index is None:
+                ehk_index = len(self._explicit_hash_keys)
+                added += len(_field(
+                    _EXPLICIT_HASH_KEY_TABLE,
+                    explicit_hash_key.encode('utf-8')))
+            record += _varint(_EXPLICIT_HASH_KEY_INDEX << 3) + \
+                _varint(ehk_index)
+
+        record += _field(_DATA, data)
+        return _field(_RECORDS, record), added
+
+    def add(self, partition_key, data, explicit_hash_key=None):
+        """
+        Adds a user record, flushing first if it would not fit.
+
+        Args:
+            partition_key (str): The user record's partition key.
+            data (bytes): The user record's data.
+            explicit_hash_key (str, optional): The user record's explicit
+            hash key. Defaults to None.
+
+        Returns:
+            dict: A finished PutRecords entry if adding the record
+            flushed the previous aggregate, otherwise None.
+
+        Raises:
+            ValueError: If the record cannot fit in an empty aggregate.
+        """
+        flushed = None
+        encoded, added = self._encode_record(
+            partition_key, data, explicit_hash_key)
+        outer_key = (self._first or (partition_key,))[0]
+        projected = self._size + added + len(encoded) + \
+            len(outer_key.encode('utf-8'))
+        if self.count and projected > self.max_bytes:
+            flushed = self.flush()
+            encoded, added = self._encode_record(
+                partition_key, data, explicit_hash_key)
+            projected = self._size + added + len(encoded) + \
+                len(partition_key.encode('utf-8'))
+        if projected > self.max_bytes:
+            raise ValueError(
+                f'User record of {len(data)} bytes is too large to '
+                f'aggregate within {self.max_bytes} bytes!')
+
+        if partition_key not in self._partition_keys:
+            self._partition_keys[partition_key] = len(self._partition_keys)
+        if explicit_hash_key is not None \
+                and explicit_hash_key not in self._explicit_hash_keys:
+            self._explicit_hash_keys[explicit_hash_key] = len(
+                self._explicit_hash_keys)
+        if self._first is None:
+            self._first = (partition_key, explicit_hash_key)
+        self._body += encoded
+        self._size += added + len(encoded)
+        self.count += 1
+        return flushed
+
+    def flush(self):
+        """
+        Finishes the current aggregate.
+
+        The aggregated record takes the partition key and explicit hash
+        key of its first user record, so it is routed to the same shard
+        that record would have been.
+
+        Returns:
+            dict: A PutRecords entry, or None if nothing was added.
+        """
+        if not self.count:
+            return None
+        message = b''.join(
+            _field(_PARTITION_KEY_TABLE, key.encode('utf-8'))
+            for key in self._partition_keys)
+        message += b''.join(
+            _field(_EXPLICIT_HASH_KEY_TABLE, key.encode('utf-8'))
+            for key in self._explicit_hash_keys)
+        message += bytes(self._body)
+        digest = hashlib.md5(message, usedforsecurity=False).digest()
+
+        partition_key, explicit_hash_key = self._first
+        entry = {
+            'PartitionKey': partition_key,
+            'Data': MAGIC + message + digest
+        }
+        if explicit_hash_key is not None:
+            entry['ExplicitHashKey'] = explicit_hash_key
+        self._reset()
+        return entry
+
+
+def aggregate_entries(entries, shard_ranges=None,
+                      max_bytes=MAX_AGGREGATED_BYTES):
+    """
+    Packs PutRecords entries into aggregated records.
+
+    When the stream's shard hash key ranges are given, entries are
+    grouped by the shard their ExplicitHashKey (or the hash of their
+    PartitionKey) falls in, so each aggregated record only holds user
+    records that belong on the shard it is sent to. Without them, all
+    entries are packed in order and routed by the first record of each
+    aggregate.
+
+    Args:
+        entries (iterable): PutRecords entries with 'Data',
+        'PartitionKey' and optionally 'ExplicitHashKey'.
+        shard_ranges (list, optional): (starting, ending) hash keys of
+        the open shards. Defaults to None.
+        max_bytes (int, optional): The maximum size of each aggregated
+        record. Defaults to MAX_AGGREGATED_BYTES.
+
+    Returns:
+        list: The aggregated PutRecords entries.
+    """
+    starts = None
+    if shard_ranges:
+        ranges = sorted((int(start), int(end)) for start, end in shard_ranges)
+        starts = [start for start, _ in ranges]
+
+    aggregators = {}
+    aggregated = []
+    for entry in entries:
+        group = None
+        if starts is not None:
+            explicit_hash_key = entry.get('ExplicitHashKey')
+            hash_key = int(explicit_hash_key) if explicit_hash_key \
+                else hash_key_for(entry['PartitionKey'])
+            group = bisect.bisect_right(starts, hash_key) - 1
+        aggregator = aggregators.get(group)
+        if aggregator is None:
+            aggregator = aggregators[group] = Aggregator(max_bytes)
+        flushed = aggregator.add(
+            entry['PartitionKey'], entry['Data'],
+            entry.get('ExplicitHashKey'))
+        if flushed is not None:
+            aggregated.append(flushed)
+
+    for aggregator in aggregators.values():
+        flushed = aggregator.flush()
+        if flushed is not None:
+            aggregated.append(flushed)
+    return aggregated
+
+
+def is_aggregated(data):
+    """Returns True if data is a valid KPL aggregated record."""
+    if not isinstance(data, (bytes, bytearray)) or \
+            len(data) < len(MAGIC) + DIGEST_LENGTH or \
+            not data.startswith(MAGIC):
+        return False
+    message = data[len(MAGIC):-DIGEST_LENGTH]
+    return hashlib.md5(message, usedforsecurity=False).digest() == \
+        data[-DIGEST_LENGTH:]
+
+
+def deaggregate(data, partition_key=None, explicit_hash_key=None):
+    """
+    Unpacks a Kinesis record into its user records.
+
+    Records that are not aggregated (no magic number or a digest
+    mismatch) are returned as a single user record, as the KCL does.
+
+    Args:
+        data (bytes): The Kinesis record data.
+        partition_key (str, optional): The Kinesis record's partition
+        key, used for a record that is not aggregated. Defaults to None.
+        explicit_hash_key (str, optional): The Kinesis record's explicit
+        hash key, likewise. Defaults to None.
+
+    Returns:
+        list: Dicts with 'PartitionKey', 'ExplicitHashKey' and 'Data'.
+
+    Raises:
+        ValueError: If an aggregated record's protobuf is malformed.
+    """
+    if not is_aggregated(data):
+        return [{'PartitionKey': partition_key,
+                 'ExplicitHashKey': explicit_hash_key,
+                 'Data': data}]
+
+    partition_keys = []
+    explicit_hash_keys = []
+    records = []
+    for number, value in _iter_fields(data[len(MAGIC):-DIGEST_LENGTH]):
+        if number == _PARTITION_KEY_TABLE:
+            partition_keys.append(value.decode('utf-8'))
+        elif number == _EXPLICIT_HASH_KEY_TABLE:
+            explicit_hash_keys.append(value.decode('utf-8'))
+        elif number == _RECORDS:
+            records.append(value)
+
+    user_records = []
+    for record in records:
+        fields = dict(_iter_fields(record))
+        try:
+            user_records.append({
+                'PartitionKey': partition_keys[fields[_PARTITION_KEY_INDEX]],
+                'ExplicitHashKey': explicit_hash_keys[
+                    fields[_EXPLICIT_HASH_KEY_INDEX]]
+                if _EXPLICIT_HASH_KEY_INDEX in fields else None,
+                'Data': fields[_DATA]
+            })
+        except (KeyError, IndexError):
+            raise ValueError('Malformed aggregated user record!') from None
+    return user_records
@@ -1,18 +1,240 @@
-"""This module contains the definition for api_interaction() function. """
+"""This module contains the definition for api_interaction() function.
+
+requests and python-dotenv are imported on first use rather than at
+import time, to keep Lambda cold starts short.
+"""
 
-import requests
 import os
 import logging
-from dotenv import load_dotenv
+import threading
+import time
+from src.metrics import count, get_collector, timer
+from src.rate_limiter import get_rate_limiter, parse_retry_after
+from src.stream_parser import iter_results
 
 url = 'https://content.guardianapis.com/search'
 
-load_dotenv()
+# Fields the formatter needs by default: the body for the preview and
+# trailText as a fallback.
+DEFAULT_SHOW_FIELDS = 'trailText,body'
+
+# The largest page size the Guardian API accepts.
+MAX_PAGE_SIZE = 200
+
+# Bytes read from the socket at a time when streaming a response.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (connect, read) timeouts in seconds for every Guardian request.
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# 429s are left to the rate limiter, which pauses every caller.
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# Times a single call waits out a 429 before giving up.
+MAX_THROTTLE_RETRIES = 3
+
+# Times a single call retries a 5xx response or a connection error or
+# timeout, after RETRY_BACKOFF seconds, doubling each time.
+MAX_SERVER_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+_session = None
+_session_pool_maxsize = 0
+_session_lock = threading.Lock()
+_dotenv_loaded = False
+
+
+def _mount_adapter(session, pool_maxsize):
+    """Mounts a non-retrying adapter with a pool of `pool_maxsize`."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=0, read=False, raise_on_status=False)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def get_session(pool_maxsize=10):
+    """
+    Returns the shared requests.Session used for Guardian API calls.
+
+    The session is created on first use and kept at module level, so
+    its pooled keep-alive connections are reused by later calls and
+    across warm Lambda invocations. Asking for a larger pool than the
+    session has mounts a larger adapter, so callers running more
+    threads each keep a pooled connection; requests already in flight
+    finish on the old one. The session itself never retries: 5xx
+    responses, connection errors and 429s are retried by
+    api_interaction(), each attempt through the shared rate limiter.
+
+    Args:
+        pool_maxsize (int, optional): The least number of pooled
+        connections to keep open to the API host. Defaults to 10.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session, _session_pool_maxsize
+    if _session is not None and pool_maxsize <= _session_pool_maxsize:
+        return _session
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+            _session_pool_maxsize = 0
+        if pool_maxsize > _session_pool_maxsize:
+            _mount_adapter(_session, pool_maxsize)
+            _session_pool_maxsize = pool_maxsize
+        return _session
+
+
+def close_session():
+    """
+    Closes the shared session and its pooled connections, if open.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_api_key():
+    """
+    Returns the Guardian API key from the 'Guardian_API_Key' environment
+    variable.
+
+    A .env file, if there is one, is loaded the first time the key is
+    needed rather than when the module is imported.
+
+    Returns:
+        str: The API key, or None if it is not set.
+    """
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+    return os.getenv('Guardian_API_Key')
+
+
+def build_params(query, date_from=None, page=None, page_size=None,
+                 order_by=None, show_fields=DEFAULT_SHOW_FIELDS,
+                 date_to=None):
+    """
+    Builds the query parameters for a Guardian search request.
 
-logging.basicConfig(level=logging.INFO)
+    Args:
+        query (str): The search query string to filter articles by.
+        date_from (str, optional): The earliest publication date,
+        formatted as 'YYYY-MM-DD'. Defaults to None.
+        page (int, optional): The page of results. Defaults to None.
+        page_size (int, optional): The results per page. Defaults to None.
+        order_by (str, optional): The result ordering. Defaults to None.
+        show_fields (str, optional): The extra fields to include with
+        each result. Defaults to DEFAULT_SHOW_FIELDS.
+        date_to (str, optional): The latest publication date, formatted
+        as 'YYYY-MM-DD'. Defaults to None.
 
+    Returns:
+        dict: The request parameters, including the API key.
 
-def api_interaction(query, date_from=None):
+    Raises:
+        ValueError: If the API key is not found in the environment variables.
+    """
+    key = get_api_key()
+    if not key:
+        raise ValueError(
+            'API key is missing. Please set the "Guardian_API_Key" environment variable')  # noqa
+
+    params = {
+        'q': query,
+        'api-key': key
+    }
+    if show_fields:
+        params['show-fields'] = show_fields
+    if date_from:
+        params['from-date'] = date_from
+    if date_to:
+        params['to-date'] = date_to
+    if page:
+        params['page'] = page
+    if page_size:
+        params['page-size'] = page_size
+    if order_by:
+        params['order-by'] = order_by
+    return params
+
+
+def _send_request(params, session=None, timeout=DEFAULT_TIMEOUT,
+                  rate_limiter=None, stream=False):
+    """
+    Sends a search request, retrying 429s, 5xx responses and connection
+    errors, with every attempt taking a token from the rate limiter.
+
+    Returns:
+        requests.Response: The successful response.
+
+    Raises:
+        requests.exceptions.HTTPError: For an unsuccessful status code.
+        requests.exceptions.ConnectionError: If the connection still
+        fails after MAX_SERVER_RETRIES retries.
+        requests.exceptions.Timeout: If the request still times out
+        after MAX_SERVER_RETRIES retries.
+    """
+    import requests
+
+    limiter = rate_limiter or get_rate_limiter()
+    session = session or get_session()
+    extra = {'stream': True} if stream else {}
+    throttles = 0
+    failures = 0
+    while True:
+        with timer('rate_limit_wait'):
+            limiter.acquire()
+        try:
+            with timer('http_request'):
+                response = session.get(
+                    url, params=params, timeout=timeout, **extra)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as request_err:
+            count('http_requests')
+            if failures >= MAX_SERVER_RETRIES:
+                raise
+            logging.warning(f'Retrying Guardian request: {request_err}')
+        else:
+            count('http_requests')
+            if response.status_code == 429:
+                count('api_throttles')
+                if throttles >= MAX_THROTTLE_RETRIES:
+                    break
+                throttles += 1
+                response.close()
+                limiter.throttled(parse_retry_after(
+                    response.headers.get('Retry-After')))
+                continue
+            limiter.succeeded()
+            if response.status_code not in RETRY_STATUS_CODES or \
+                    failures >= MAX_SERVER_RETRIES:
+                break
+            response.close()
+        count('api_retries')
+        with timer('retry_backoff'):
+            time.sleep(RETRY_BACKOFF * 2 ** failures)
+        failures += 1
+    response.raise_for_status()
+    return response
+
+
+def api_interaction(query, date_from=None, page=None, page_size=None,
+                    order_by=None, show_fields=DEFAULT_SHOW_FIELDS,
+                    session=None, timeout=DEFAULT_TIMEOUT, cache=None,
+                    rate_limiter=None, date_to=None):
     """
     Fetches articles from The Guardian API based on a search query
     and optional date filter. Includes trailText for a content
@@ -28,6 +250,28 @@ def api_interaction(query, date_from=None):
         date_from (str, optional): A string representing the earliest
         publication date to filter articles, formatted as 'YYYY-MM-DD'.
         Defaults to None.
+        page (int, optional): The page of results to request, starting
+        at 1. Defaults to None (the API's first page).
+        page_size (int, optional): The number of results per page.
+        Defaults to None (the API's default of 10).
+        order_by (str, optional): The result ordering, one of 'newest',
+        'oldest' or 'relevance'. Defaults to None (the API's default).
+        show_fields (str, optional): The comma separated extra fields to
+        include with each result, or None for none. Asking only for the
+        fields that will be used keeps responses small, as 'body' holds
+        the full article HTML. Defaults to DEFAULT_SHOW_FIELDS.
+        session (requests.Session, optional): The session to send the
+        request with. Defaults to the shared session from get_session().
+        timeout (float or tuple, optional): The request timeout in
+        seconds, or a (connect, read) tuple. Defaults to DEFAULT_TIMEOUT.
+        cache (ResponseCache, optional): A cache to serve the response
+        from without a network round trip, and to store it in on a
+        miss. Defaults to None (no caching).
+        rate_limiter (RateLimiter, optional): The limiter every request
+        waits on. Cache hits do not use it. Defaults to the
+        process-wide limiter from get_rate_limiter().
+        date_to (str, optional): The latest publication date to include,
+        formatted as 'YYYY-MM-DD'. Defaults to None.
 
     Returns:
         dict: A JSON response containing the search results from
@@ -36,10 +280,12 @@ def api_interaction(query, date_from=None):
 
     Raises:
         ValueError: If the API key is not found in the environment variables.
+        RateLimitExceeded: If the daily request budget has been used.
         requests.exceptions.HTTPError:
         If the HTTP request returned an unsuccessful status code.
         requests.exceptions.RequestException:
-        For network-related errors during the request.
+        For network-related errors during the request, including
+        timeouts and exhausted retries.
         Exception:
         For any other unexpected errors.
 
@@ -48,23 +294,27 @@ def api_interaction(query, date_from=None):
         environment variable with the name 'Guardian_API_Key'.
         You can load it via a `.env` file using `python-dotenv`.
     """
-    key = os.getenv('Guardian_API_Key')
-    if not key:
-        raise ValueError(
-            'API key is missing. Please set the "Guardian_API_Key" environment variable')  # noqa
+    import requests
 
-    params = {
-        'q': query,
-        'api-key': key,
-        'show-fields': 'trailText, body'
-    }
-    if date_from:
-        params['from-date'] = date_from
+    params = build_params(query, date_from, page, page_size, order_by,
+                          show_fields, date_to)
+
+    if cache is not None:
+        cached = cache.get(params)
+        if cached is not None:
+            count('cache_hits')
+            return cached
+        count('cache_misses')
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status
-        return response.json()
+        response = _send_request(params, session, timeout, rate_limiter)
+        with timer('json_parse'):
+            data = response.json()
+        if get_collector() is not None:
+            count('response_bytes', len(response.content))
+        if cache is not None:
+            cache.set(params, data)
+        return data
 
     except requests.exceptions.HTTPError as http_err:
         logging.error(f'HTTP Error has occurred: {http_err}!')
@@ -75,3 +325,156 @@ def api_interaction(query, date_from=None):
     except Exception as err:
         logging.error(f'Unexpected Error has occurred: {err}')
         raise
+
+
+def _counted(chunks):
+    """Passes chunks through, counting their bytes as response_bytes."""
+    for chunk in chunks:
+        count('response_bytes', len(chunk))
+        yield chunk
+
+
+def iter_article_stream(query, date_from=None, page=None, page_size=None,
+                        order_by=None, show_fields=DEFAULT_SHOW_FIELDS,
+                        max_body_chars=None, meta=None, session=None,
+                        timeout=DEFAULT_TIMEOUT, rate_limiter=None,
+                        date_to=None):
+    """
+    Fetches one page of articles and yields them as they are parsed.
+
+    Unlike api_interaction(), the response is never built in full: the
+    body is read from the socket in chunks and fed to an incremental
+    parser, so peak memory is proportional to one article rather than
+    one page. Responses are not cached in this mode.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        date_from (str, optional): The earliest publication date to
+        filter articles, formatted as 'YYYY-MM-DD'. Defaults to None.
+        page (int, optional): The page of results. Defaults to None.
+        page_size (int, optional): The results per page. Defaults to None.
+        order_by (str, optional): The result ordering. Defaults to None.
+        show_fields (str, optional): The extra fields to include with
+        each result. Defaults to DEFAULT_SHOW_FIELDS.
+        max_body_chars (int, optional): Truncates 'fields.body' to this
+        many characters once each article has been decoded, so it bounds
+        what is handed on, not the memory used while parsing, which is
+        one whole article. Defaults to None.
+        meta (dict, optional): A dict to fill with the other fields of
+        the response, such as 'pages'. Defaults to None.
+        session (requests.Session, optional): The session to send the
+        request with. Defaults to the shared session from get_session().
+        timeout (float or tuple, optional): The request timeout.
+        Defaults to DEFAULT_TIMEOUT.
+        rate_limiter (RateLimiter, optional): The limiter to wait on.
+        Defaults to the process-wide limiter.
+        date_to (str, optional): The latest publication date to include,
+        formatted as 'YYYY-MM-DD'. Defaults to None.
+
+    Yields:
+        dict: One article at a time.
+
+    Raises:
+        The same exceptions as api_interaction(), and ValueError if the
+        response is malformed or truncated.
+    """
+    import requests
+
+    params = build_params(query, date_from, page, page_size, order_by,
+                          show_fields, date_to)
+    try:
+        response = _send_request(
+            params, session, timeout, rate_limiter, stream=True)
+        try:
+            yield from iter_results(
+                _counted(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)),
+                max_body_chars=max_body_chars, meta=meta)
+        finally:
+            response.close()
+
+    except requests.exceptions.HTTPError as http_err:
+        logging.error(f'HTTP Error has occurred: {http_err}!')
+        raise
+    except requests.exceptions.RequestException as request_err:
+        logging.error(f'Error during request: {request_err}!')
+        raise
+
+
+def iter_articles(query, date_from=None, page_size=10, max_articles=None,
+                  order_by=None, show_fields=DEFAULT_SHOW_FIELDS, cache=None,
+                  stream=False, max_body_chars=None, date_to=None):
+    """
+    Lazily yields articles from The Guardian API, one page at a time.
+
+    Pages are only requested when the caller has consumed every article
+    from the previous page, so stopping iteration early (or setting
+    `max_articles`) stops any further requests being made. Paging ends
+    when the API reports no further pages or returns an empty page.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        date_from (str, optional): The earliest publication date to
+        filter articles, formatted as 'YYYY-MM-DD'. Defaults to None.
+        page_size (int, optional): The number of results to request per
+        page. Defaults to 10.
+        max_articles (int, optional): The maximum number of articles to
+        yield. Defaults to None (every available article).
+        order_by (str, optional): The result ordering passed through to
+        api_interaction(). Defaults to None.
+        show_fields (str, optional): The extra fields passed through to
+        api_interaction(). Defaults to DEFAULT_SHOW_FIELDS.
+        cache (ResponseCache, optional): A cache passed through to
+        api_interaction(). Ignored when streaming. Defaults to None.
+        stream (bool, optional): Parse each page incrementally with
+        iter_article_stream() rather than building it in memory.
+        Defaults to False.
+        max_body_chars (int, optional): When streaming, truncates each
+        article body to this many characters once the article has been
+        decoded. Parsing still holds one whole article, body included,
+        in memory. Defaults to None.
+        date_to (str, optional): The latest publication date to include,
+        formatted as 'YYYY-MM-DD'. Defaults to None.
+
+    Yields:
+        dict: A single article from the 'results' list of a page.
+
+    Raises:
+        Any exception raised by api_interaction().
+    """
+    if max_articles is not None and max_articles <= 0:
+        return
+
+    if max_articles is not None:
+        page_size = min(page_size, max_articles)
+
+    page = 1
+    count = 0
+    while True:
+        if stream:
+            response = {}
+            results = iter_article_stream(
+                query, date_from, page=page, page_size=page_size,
+                order_by=order_by, show_fields=show_fields,
+                max_body_chars=max_body_chars, meta=response,
+                date_to=date_to)
+        else:
+            raw_data = api_interaction(
+                query, date_from, page=page, page_size=page_size,
+                order_by=order_by, show_fields=show_fields, cache=cache,
+                date_to=date_to)
+            response = (raw_data or {}).get('response', {})
+            results = response.get('results') or []
+
+        page_count = 0
+        for article in results:
+            yield article
+            page_count += 1
+            count += 1
+            if max_articles is not None and count >= max_articles:
+                if stream:
+                    results.close()
+                return
+
+        if not page_count or page >= response.get('pages', 1):
+            return
+        page += 1
@@ -0,0 +1,231 @@
+"""This module contains the definitions for historical backfill: the
+split_windows() helper, the BackfillCheckpoint store and the
+backfill() function."""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import islice
+from src.api_interaction import iter_articles, DEFAULT_SHOW_FIELDS, \
+    MAX_PAGE_SIZE
+from src.format_article import format_articles, format_articles_parallel
+from src.send_to_kinesis import send_batch_to_kinesis
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(
+    tempfile.gettempdir(), 'guardian_backfill.json')
+
+
+def split_windows(date_from, date_to, window_days=30):
+    """
+    Splits an inclusive date range into consecutive windows.
+
+    Args:
+        date_from (str): The first date, formatted as 'YYYY-MM-DD'.
+        date_to (str): The last date, formatted as 'YYYY-MM-DD'.
+        window_days (int, optional): The days per window. Defaults to 30.
+
+    Returns:
+        list: (from, to) date string pairs, each inclusive, covering the
+        range without gaps or overlaps.
+
+    Raises:
+        ValueError: If a date is malformed, the range is reversed or
+        window_days is not positive.
+    """
+    if window_days < 1:
+        raise ValueError('window_days must be at least 1!')
+    start = date.fromisoformat(date_from)
+    end = date.fromisoformat(date_to)
+    if start > end:
+        raise ValueError(f'date_from {date_from} is after date_to {date_to}!')
+
+    windows = []
+    step = timedelta(days=window_days)
+    while start <= end:
+        window_end = min(start + step - timedelta(days=1), end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+class BackfillCheckpoint:
+    """
+    Records which windows of a backfill have been sent, in a JSON file.
+
+    Each backfill job (a query, date range and window size) has its own
+    entry, so the file can hold several jobs. The file is replaced
+    atomically after every window, so a run that is killed part way
+    through resumes from its last completed window.
+
+    Args:
+        path (str, optional): The JSON file to read and write.
+        Defaults to DEFAULT_CHECKPOINT_PATH.
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_key(query, date_from, date_to, window_days):
+        """Returns the key a backfill job is stored under."""
+        return f'{query}|{date_from}|{date_to}|{window_days}'
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as json_err:
+            logging.error(f'Ignoring corrupt checkpoint file: {json_err}')
+            return {}
+
+    def completed(self, job):
+        """
+        Returns the windows of a job that have already been sent.
+
+        Args:
+            job (str): The job key, see job_key().
+
+        Returns:
+            set: (from, to) date string pairs.
+        """
+        return {tuple(window) for window in self._load().get(job, [])}
+
+    def mark_done(self, job, window):
+        """
+        Records a window as sent, replacing the file atomically.
+
+        Args:
+            job (str): The job key, see job_key().
+            window (tuple): The (from, to) date strings of the window.
+        """
+        with self._lock:
+            state = self._load()
+            windows = state.setdefault(job, [])
+            if list(window) not in windows:
+                windows.append(list(window))
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+                json.dump(state, tmp_file)
+            os.replace(tmp_path, self.path)
+
+
+def backfill(query, broker_id, date_from, date_to, window_days=30,
+             max_workers=4, checkpoint=None, page_size=MAX_PAGE_SIZE,
+             batch_size=500, show_fields=DEFAULT_SHOW_FIELDS, deadline=None,
+             relevance=None, format_workers=None, **send_kwargs):
+    """
+    Sends every article for a query published in a date range.
+
+    The range is split into windows of `window_days`, which are fetched
+    oldest first on a thread pool. All requests go through the
+    process-wide rate limiter, so the workers share the Guardian rate
+    limit rather than multiplying it. Each window's articles are
+    formatted and sent in batches with send_batch_to_kinesis(), and the
+    window is checkpointed once all of it has been sent. Windows already
+    in the checkpoint are skipped, so rerunning the same backfill after
+    a timeout or crash resumes where it stopped. A window interrupted
+    part way through is sent again in full on the next run.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        broker_id (str): The name of the Kinesis stream to send to.
+        date_from (str): The first publication date, 'YYYY-MM-DD'.
+        date_to (str): The last publication date, 'YYYY-MM-DD'.
+        window_days (int, optional): The days per window. Defaults to 30.
+        max_workers (int, optional): The windows fetched at once.
+        Defaults to 4.
+        checkpoint (BackfillCheckpoint, optional): Where progress is
+        recorded. Defaults to a BackfillCheckpoint at
+        DEFAULT_CHECKPOINT_PATH.
+        page_size (int, optional): The results per API page.
+        Defaults to MAX_PAGE_SIZE.
+        batch_size (int, optional): The articles per send.
+        Defaults to 500.
+        show_fields (str, optional): The extra fields to request.
+        Defaults to DEFAULT_SHOW_FIELDS.
+        deadline (float, optional): A time.monotonic() time after which
+        no new window is started, such as from
+        pipeline.deadline_from_context(). Defaults to None.
+        relevance (RelevanceFilter, optional): Drops articles that are
+        not relevant before they are sent. Defaults to None.
+        format_workers (int, optional): Format each batch on this many
+        worker processes, shared by all windows, see
+        format_articles_parallel(). Defaults to None (in process).
+        **send_kwargs: Passed through to send_batch_to_kinesis(), such as
+        partitioner, serializer or aggregate.
+
+    Returns:
+        dict: The number of 'windows' in the range, those 'skipped' as
+        already done, those 'completed' by this run, those 'remaining',
+        and the 'articles' sent.
+
+    Raises:
+        ValueError: If the date range is invalid.
+        Exception: The first window's error, once the other windows have
+        finished and been checkpointed.
+    """
+    checkpoint = checkpoint or BackfillCheckpoint()
+    windows = split_windows(date_from, date_to, window_days)
+    job = BackfillCheckpoint.job_key(query, date_from, date_to, window_days)
+    done = checkpoint.completed(job)
+    pending = [window for window in windows if window not in done]
+    summary = {'windows': len(windows), 'skipped': len(windows) - len(pending),
+               'completed': 0, 'remaining': 0, 'articles': 0}
+    lock = threading.Lock()
+
+    def run_window(window):
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        articles = iter_articles(
+            query, window[0], page_size=page_size, order_by='oldest',
+            show_fields=show_fields, date_to=window[1])
+        sent = 0
+        while True:
+            batch = list(islice(articles, batch_size))
+            if not batch:
+                break
+            if format_workers:
+                records = format_articles_parallel(
+                    batch, max_workers=format_workers)
+            else:
+                records = format_articles(batch)
+            if relevance is not None:
+                records = relevance.filter_records(batch, records)
+            if records:
+                send_batch_to_kinesis(records, broker_id, **send_kwargs)
+            sent += len(records)
+        checkpoint.mark_done(job, window)
+        with lock:
+            summary['completed'] += 1
+            summary['articles'] += sent
+        logging.info(
+            f'Backfilled {sent} articles for {query} from {window[0]} '
+            f'to {window[1]}')
+        return True
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(window, executor.submit(run_window, window))
+                   for window in pending]
+        for window, future in futures:
+            try:
+                future.result()
+            except Exception as err:
+                logging.error(
+                    f'Backfill window {window[0]} to {window[1]} failed: '
+                    f'{err}')
+                errors.append(err)
+
+    summary['remaining'] = len(pending) - summary['completed']
+    if errors:
+        raise errors[0]
+    return summary
@@ -0,0 +1,515 @@
+"""This module contains the broker backends that main() publishes
+through, and get_broker(), which picks one from a URI:
+
+    * KinesisBroker ('my-stream' or 'kinesis://my-stream') sends to an
+      Amazon Kinesis stream with send_to_kinesis().
+    * FileBroker ('file:///var/tmp/guardian-log?partitions=4') appends
+      to a partitioned log of memory-mapped segment files on local
+      disk, which other processes can read and tail by offset, so runs,
+      load tests and replays need neither AWS nor mocks.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from urllib.parse import parse_qs, urlsplit
+from src.partitioning import by_article, fixed
+from src.send_to_kinesis import send_batch_to_kinesis, send_to_kinesis
+from src.serializers import encode_json, encode_payload
+
+DEFAULT_PARTITIONS = 4
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SUFFIX = '.log'
+META_FILE = 'broker.json'
+
+# Each frame is its length and CRC-32, then the message. A length of 0
+# is unwritten space; _ROLL means the log continues in the next segment.
+_FRAME = struct.Struct('>II')
+_ROLL = 0xFFFFFFFF
+
+
+def _encode(data, serializer, compression):
+    """Encodes a message as send_to_kinesis() would, as bytes."""
+    if serializer == 'json' and compression is None:
+        data = encode_json(data)
+        return data.encode('utf-8') if isinstance(data, str) else data
+    return encode_payload(data, serializer, compression)
+
+
+def _segment_path(directory, base_offset):
+    return os.path.join(directory, f'{base_offset:020d}{SEGMENT_SUFFIX}')
+
+
+def _segments(directory):
+    """Returns the base offsets of a partition's segments, in order."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names
+                  if name.endswith(SEGMENT_SUFFIX))
+
+
+def _map(path, writable=False):
+    with open(path, 'r+b' if writable else 'rb') as segment:
+        return mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_WRITE
+                         if writable else mmap.ACCESS_READ)
+
+
+def _frame_at(segment, pos):
+    """
+    Reads the frame at a position in a mapped segment.
+
+    Returns:
+        tuple: The message, or None at the end of what has been written
+        or _ROLL at the end of the segment, and the next position.
+    """
+    if pos + _FRAME.size > len(segment):
+        return None, pos
+    length, crc = _FRAME.unpack_from(segment, pos)
+    if length == _ROLL:
+        return _ROLL, pos
+    end = pos + _FRAME.size + length
+    if not length or end > len(segment):
+        return None, pos
+    message = segment[pos + _FRAME.size:end]
+    if zlib.crc32(message) != crc:
+        # A frame still being written by another process.
+        return None, pos
+    return message, end
+
+
+class PartitionLog:
+    """
+    The writer of one partition: an append-only sequence of segment
+    files, each preallocated and memory-mapped, named after the offset
+    of their first message.
+
+    Messages are written straight into the mapping, the message before
+    its header, so a reader in another process never sees a partial
+    message. Reopening a partition carries on after its last complete
+    message. Only one process may write to a partition at a time.
+
+    Args:
+        directory (str): The partition's directory.
+        segment_bytes (int, optional): The size of each segment file.
+        Defaults to DEFAULT_SEGMENT_BYTES.
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        segments = _segments(directory)
+        if not segments:
+            self._open_segment(0)
+            return
+        self._segment = _map(_segment_path(directory, segments[-1]), True)
+        self._pos = 0
+        self.next_offset = segments[-1]
+        while True:
+            message, pos = _frame_at(self._segment, self._pos)
+            if message is None:
+                break
+            if message is _ROLL:
+                self._segment.close()
+                self._open_segment(self.next_offset)
+                break
+            self._pos = pos
+            self.next_offset += 1
+
+    def _open_segment(self, base_offset, size=None):
+        path = _segment_path(self.directory, base_offset)
+        # Readers only ever see a segment at its full size.
+        with open(path + '.tmp', 'wb') as segment:
+            segment.truncate(size or self.segment_bytes)
+        os.replace(path + '.tmp', path)
+        self._segment = _map(path, True)
+        self._pos = 0
+        self.next_offset = base_offset
+
+    def append(self, message):
+        """
+        Appends a message.
+
+        Args:
+            message (bytes): The message, which must not be empty.
+
+        Returns:
+            int: The message's offset in the partition.
+
+        Raises:
+            ValueError: If the message is empty.
+        """
+        if not message:
+            raise ValueError('Cannot append an empty message!')
+        size = _FRAME.size + len(message)
+        with self._lock:
+            # Always leave room for the roll marker.
+            if self._pos + size + _FRAME.size > len(self._segment):
+                _FRAME.pack_into(self._segment, self._pos, _ROLL, 0)
+                self._segment.close()
+                self._open_segment(self.next_offset, max(
+                    self.segment_bytes, size + _FRAME.size))
+            pos = self._pos
+            self._segment[pos + _FRAME.size:pos + size] = message
+            _FRAME.pack_into(self._segment, pos, len(message),
+                             zlib.crc32(message))
+            self._pos = pos + size
+            offset = self.next_offset
+            self.next_offset += 1
+        return offset
+
+    def flush(self):
+        """Writes the mapped pages of the current segment to disk."""
+        with self._lock:
+            self._segment.flush()
+
+    def close(self):
+        """Flushes and unmaps the current segment."""
+        with self._lock:
+            if not self._segment.closed:
+                self._segment.flush()
+                self._segment.close()
+
+
+class PartitionReader:
+    """
+    Reads one partition of a FileBroker log from an offset, following
+    new messages as they are written, from this or another process.
+
+    Args:
+        directory (str): The partition's directory.
+        offset (int, optional): The first offset to read. Defaults to 0.
+    """
+
+    def __init__(self, directory, offset=0):
+        self.directory = directory
+        self.offset = offset
+        self._segment = None
+        self._pos = 0
+        self._next = None
+
+    def _open(self, base_offset):
+        path = _segment_path(self.directory, base_offset)
+        if not os.path.exists(path):
+            return False
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = _map(path)
+        self._pos = 0
+        self._next = base_offset
+        return True
+
+    def poll(self, max_messages=None):
+        """
+        Returns the messages written since the last call.
+
+        Args:
+            max_messages (int, optional): The most messages to return.
+            Defaults to None (all of them).
+
+        Returns:
+            list: (offset, message) pairs, in order.
+        """
+        if self._segment is None:
+            bases = [base for base in _segments(self.directory)
+                     if base <= self.offset]
+            if not bases or not self._open(bases[-1]):
+                return []
+        messages = []
+        while max_messages is None or len(messages) < max_messages:
+            message, pos = _frame_at(self._segment, self._pos)
+            if message is None:
+                break
+            if message is _ROLL:
+                if not self._open(self._next):
+                    break
+                continue
+            if self._next >= self.offset:
+                messages.append((self._next, message))
+                self.offset = self._next + 1
+            self._pos = pos
+            self._next += 1
+        return messages
+
+    def close(self):
+        """Unmaps the segment being read."""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+class FileBroker:
+    """
+    A broker backed by a partitioned, append-only log on local disk.
+
+    Each partition is a directory of memory-mapped segment files, see
+    PartitionLog. Messages are routed to a partition by a CRC-32 of
+    their partition key and numbered by offset within it. Writes go to
+    the page cache, so publishing runs at memory speed; flush() or
+    close() makes them durable. Readers, in any process, use read(),
+    tail() or a PartitionReader.
+
+    Args:
+        directory (str): The log's directory, created if need be.
+        partitions (int, optional): The number of partitions of a new
+        log. An existing log keeps the number it was created with.
+        Defaults to DEFAULT_PARTITIONS.
+        segment_bytes (int, optional): The size of each segment file.
+        Defaults to DEFAULT_SEGMENT_BYTES.
+        serializer (str, optional): The message format, see
+        src.serializers. Defaults to 'json'.
+        compression (str, optional): The message compression.
+        Defaults to None.
+    """
+
+    def __init__(self, directory, partitions=DEFAULT_PARTITIONS,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES, serializer='json',
+                 compression=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.serializer = serializer
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as meta_file:
+                partitions = json.load(meta_file)['partitions']
+        except FileNotFoundError:
+            with open(meta_path, 'w', encoding='utf-8') as meta_file:
+                json.dump({'partitions': partitions}, meta_file)
+        self.partitions = partitions
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def _partition_dir(self, partition):
+        return os.path.join(self.directory, f'{partition:04d}')
+
+    def _log(self, partition):
+        log = self._logs.get(partition)
+        if log is None:
+            with self._lock:
+                log = self._logs.get(partition)
+                if log is None:
+                    log = self._logs[partition] = PartitionLog(
+                        self._partition_dir(partition), self.segment_bytes)
+        return log
+
+    def partition_for(self, partition_key):
+        """Returns the partition a partition key is routed to."""
+        return zlib.crc32(partition_key.encode('utf-8')) % self.partitions
+
+    def publish(self, data, partition_key='guardian_content'):
+        """
+        Appends a list of articles as one message, as send_to_kinesis()
+        sends them as one record.
+
+        Args:
+            data (list): The formatted articles.
+            partition_key (str or callable, optional): Picks the
+            partition, or a partitioning strategy from src.partitioning
+            called with the first article. Defaults to 'guardian_content'.
+
+        Returns:
+            tuple: The message's partition and offset, or None if there
+            was no data.
+        """
+        if not data:
+            logging.info("No data to publish")
+            return None
+        if callable(partition_key):
+            partition_key = partition_key(data[0])['PartitionKey']
+        partition = self.partition_for(partition_key)
+        offset = self._log(partition).append(
+            _encode(data, self.serializer, self.compression))
+        logging.info(f"Data appended to partition {partition} at {offset}")
+        return partition, offset
+
+    def publish_batch(self, data, partitioner=None):
+        """
+        Appends each article as its own message, as
+        send_batch_to_kinesis() sends one record per article.
+
+        Args:
+            data (list): The formatted articles.
+            partitioner (callable or str, optional): The partitioning
+            strategy from src.partitioning, or a fixed partition key.
+            Defaults to by_article.
+
+        Returns:
+            dict: The number of 'user_records' and 'records' written.
+        """
+        if partitioner is None:
+            partitioner = by_article
+        elif isinstance(partitioner, str):
+            partitioner = fixed(partitioner)
+        for article in data:
+            key = partitioner(article)['PartitionKey']
+            self._log(self.partition_for(key)).append(
+                encode_payload(article, self.serializer, self.compression))
+        return {'user_records': len(data), 'records': len(data)}
+
+    def reader(self, partition, offset=0):
+        """Returns a PartitionReader for a partition."""
+        return PartitionReader(self._partition_dir(partition), offset)
+
+    def read(self, partition, offset=0):
+        """
+        Reads the messages of a partition written so far.
+
+        Args:
+            partition (int): The partition.
+            offset (int, optional): The first offset. Defaults to 0.
+
+        Returns:
+            list: (offset, message) pairs, in order.
+        """
+        reader = self.reader(partition, offset)
+        try:
+            return reader.poll()
+        finally:
+            reader.close()
+
+    def tail(self, partition, offset=0, poll_interval=0.1, stop=None):
+        """
+        Yields the messages of a partition as they are written, until
+        `stop` is set.
+
+        Args:
+            partition (int): The partition.
+            offset (int, optional): The first offset. Defaults to 0.
+            poll_interval (float, optional): Seconds to wait when there
+            is nothing new. Defaults to 0.1.
+            stop (threading.Event, optional): Set to stop tailing.
+            Defaults to None (tail forever).
+
+        Yields:
+            tuple: (offset, message) pairs, in order.
+        """
+        stop = stop or threading.Event()
+        reader = self.reader(partition, offset)
+        try:
+            while not stop.is_set():
+                messages = reader.poll()
+                yield from messages
+                if not messages:
+                    stop.wait(poll_interval)
+        finally:
+            reader.close()
+
+    def flush(self):
+        """Writes everything appended so far to disk."""
+        for log in list(self._logs.values()):
+            log.flush()
+
+    def close(self):
+        """Flushes and closes every partition."""
+        with self._lock:
+            for log in self._logs.values():
+                log.close()
+            self._logs = {}
+
+
+class KinesisBroker:
+    """
+    A broker that sends to an Amazon Kinesis stream.
+
+    Args:
+        stream_name (str): The stream.
+        spool (Spool, optional): Where to keep records that cannot be
+        sent, see send_to_kinesis(). Defaults to None.
+        **options: Passed through to send_to_kinesis() and
+        send_batch_to_kinesis(), such as serializer or compression.
+    """
+
+    def __init__(self, stream_name, spool=None, **options):
+        self.stream_name = stream_name
+        self.spool = spool
+        self.options = options
+
+    def publish(self, data, partition_key=None):
+        """
+        Sends a list of articles as one record, see send_to_kinesis().
+
+        Args:
+            data (list): The formatted articles.
+            partition_key (str or callable, optional): The record's
+            partition key or partitioning strategy. Defaults to None,
+            the send_to_kinesis() default.
+
+        Returns:
+            dict: The number of Kinesis 'records' sent and 'spooled'.
+        """
+        options = dict(self.options)
+        if partition_key is not None:
+            options['partition_key'] = partition_key
+        return send_to_kinesis(data, self.stream_name, spool=self.spool,
+                               **options)
+
+    def publish_batch(self, data, partitioner=None):
+        """Sends a record per article, see send_batch_to_kinesis()."""
+        return send_batch_to_kinesis(
+            data, self.stream_name, partitioner=partitioner,
+            spool=self.spool, **self.options)
+
+    def flush(self):
+        """Does nothing; records are sent as they are published."""
+
+    def close(self):
+        """Does nothing; the Kinesis client is shared and kept."""
+
+
+def broker_scheme(target):
+    """
+    Returns the scheme of a broker target without creating the broker,
+    so callers can tell which backend get_broker() would pick.
+
+    Args:
+        target (str): A Kinesis stream name or broker URI.
+
+    Returns:
+        str: 'kinesis' for a plain stream name, otherwise the URI scheme.
+    """
+    return urlsplit(target).scheme if '://' in target else 'kinesis'
+
+
+def get_broker(target, spool=None, **options):
+    """
+    Returns the broker for a Kinesis stream name or broker URI.
+
+    Args:
+        target (str or broker): A Kinesis stream name, a URI such as
+        'kinesis://my-stream' or 'file:///var/tmp/guardian-log', with
+        FileBroker options such as '?partitions=8' as query parameters,
+        or a broker, which is returned as it is.
+        spool (Spool, optional): The spool for a KinesisBroker.
+        Defaults to None.
+        **options: Passed to the broker.
+
+    Returns:
+        KinesisBroker or FileBroker: The broker.
+
+    Raises:
+        ValueError: If the URI scheme is not recognised.
+    """
+    if not isinstance(target, str):
+        return target
+    if '://' not in target:
+        return KinesisBroker(target, spool=spool, **options)
+    parts = urlsplit(target)
+    if parts.scheme == 'kinesis':
+        return KinesisBroker(parts.netloc + parts.path, spool=spool,
+                             **options)
+    if parts.scheme == 'file':
+        for name, values in parse_qs(parts.query).items():
+            value = values[-1]
+            options.setdefault(
+                name, int(value) if value.isdigit() else value)
+        return FileBroker(parts.netloc + parts.path, **options)
+    raise ValueError(f'Unknown broker scheme {parts.scheme!r}!')
@@ -0,0 +1,365 @@
+"""This module contains the Kinesis consumer: consume() reads every shard
+of a stream in parallel and hands the decoded articles to a callback,
+checkpointing its position in each shard in a ShardCheckpoint so a
+restarted consumer carries on where it stopped.
+"""
+
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+from collections import namedtuple
+from src.aggregation import deaggregate
+from src.metrics import count, timer
+from src.partitioning import list_all_shards
+from src.send_to_kinesis import get_kinesis_client
+from src.serializers import decode_payload
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(
+    tempfile.gettempdir(), 'guardian_consumer.json')
+
+# The most records GetRecords returns per call.
+MAX_RECORDS_PER_CALL = 10000
+
+# The errors after which a GetRecords call is retried after a pause.
+RETRYABLE_ERRORS = ('ProvisionedThroughputExceededException',
+                    'KMSThrottlingException', 'LimitExceededException')
+
+ConsumedRecord = namedtuple(
+    'ConsumedRecord',
+    ['shard_id', 'sequence_number', 'partition_key', 'arrival', 'article'])
+
+
+class ShardCheckpoint:
+    """
+    Records how far a consumer has read each shard, in a JSON file.
+
+    For each stream, the file holds the last sequence number handled in
+    every shard and the shards that have been read to their end. It is
+    replaced atomically on every save, so a consumer killed part way
+    through resumes after the last batch it handled.
+
+    Args:
+        path (str, optional): The JSON file to read and write.
+        Defaults to DEFAULT_CHECKPOINT_PATH.
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as json_err:
+            logging.error(f'Ignoring corrupt checkpoint file: {json_err}')
+            return {}
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(self._state, tmp_file)
+        os.replace(tmp_path, self.path)
+
+    def _shard(self, stream_name, shard_id):
+        return self._state.get(stream_name, {}).get(shard_id, {})
+
+    def sequence(self, stream_name, shard_id):
+        """Returns the last sequence number handled in a shard, or None."""
+        with self._lock:
+            return self._shard(stream_name, shard_id).get('sequence')
+
+    def is_finished(self, stream_name, shard_id):
+        """Returns True if a closed shard has been read to its end."""
+        with self._lock:
+            return self._shard(stream_name, shard_id).get('finished', False)
+
+    def save(self, stream_name, shard_id, sequence=None, finished=False):
+        """
+        Records progress in a shard, replacing the file atomically.
+
+        Args:
+            stream_name (str): The stream.
+            shard_id (str): The shard.
+            sequence (str, optional): The last sequence number handled.
+            Defaults to None, keeping the one recorded.
+            finished (bool, optional): Whether the shard is closed and
+            has been read to its end. Defaults to False.
+        """
+        with self._lock:
+            shard = self._state.setdefault(stream_name, {}) \
+                .setdefault(shard_id, {})
+            if sequence is not None:
+                shard['sequence'] = sequence
+            if finished:
+                shard['finished'] = True
+            self._write()
+
+
+def decode_record(record):
+    """
+    Decodes a Kinesis record into the articles it holds.
+
+    Aggregated records are unpacked into their user records, and each
+    payload is decoded in whatever format the producer wrote it, see
+    serializers.decode_payload(). A payload holding a list of articles,
+    as send_to_kinesis() writes, yields each article.
+
+    Args:
+        record (dict): A record from GetRecords.
+
+    Returns:
+        list: The decoded articles.
+
+    Raises:
+        ValueError: If the record cannot be decoded.
+    """
+    articles = []
+    for user_record in deaggregate(record['Data'], record.get('PartitionKey')):
+        payload = decode_payload(user_record['Data'])
+        if isinstance(payload, list):
+            articles.extend(payload)
+        else:
+            articles.append(payload)
+    return articles
+
+
+def _parents(shard):
+    return [parent for parent in (shard.get('ParentShardId'),
+                                  shard.get('AdjacentParentShardId'))
+            if parent]
+
+
+def _error_code(err):
+    return getattr(err, 'response', {}).get('Error', {}).get('Code')
+
+
+class _ShardReader:
+    """Reads one shard from its checkpoint until it ends or is stopped."""
+
+    def __init__(self, consumer, shard, initial_position):
+        self.consumer = consumer
+        self.shard_id = shard['ShardId']
+        self.initial_position = initial_position
+
+    def _iterator(self, sequence):
+        consumer = self.consumer
+        if sequence is None:
+            kwargs = {'ShardIteratorType': self.initial_position}
+        else:
+            kwargs = {'ShardIteratorType': 'AFTER_SEQUENCE_NUMBER',
+                      'StartingSequenceNumber': sequence}
+        return consumer.client.get_shard_iterator(
+            StreamName=consumer.stream_name, ShardId=self.shard_id,
+            **kwargs)['ShardIterator']
+
+    def _get_records(self, iterator):
+        """Calls GetRecords, returning None to ask for a new iterator."""
+        from botocore.exceptions import ClientError
+
+        consumer = self.consumer
+        delay = consumer.poll_interval
+        while True:
+            try:
+                with timer('kinesis_get'):
+                    return consumer.client.get_records(
+                        ShardIterator=iterator, Limit=consumer.limit)
+            except ClientError as err:
+                code = _error_code(err)
+                if code == 'ExpiredIteratorException':
+                    return None
+                if code not in RETRYABLE_ERRORS:
+                    raise
+                count('kinesis_get_throttles')
+                if consumer.stop.wait(delay):
+                    return None
+                delay = min(delay * 2, 10.0)
+
+    def run(self):
+        consumer = self.consumer
+        stream_name = consumer.stream_name
+        checkpoint = consumer.checkpoint
+        sequence = checkpoint.sequence(stream_name, self.shard_id)
+        iterator = self._iterator(sequence)
+        while iterator and not consumer.stop.is_set():
+            response = self._get_records(iterator)
+            if response is None:
+                if consumer.stop.is_set():
+                    return
+                iterator = self._iterator(sequence)
+                continue
+            records = response['Records']
+            if records:
+                batch = [
+                    ConsumedRecord(
+                        self.shard_id, record['SequenceNumber'],
+                        record.get('PartitionKey'),
+                        record.get('ApproximateArrivalTimestamp'), article)
+                    for record in records
+                    for article in decode_record(record)]
+                consumer.handle(batch)
+                sequence = records[-1]['SequenceNumber']
+                checkpoint.save(stream_name, self.shard_id, sequence)
+                consumer.add(len(records), len(batch))
+            iterator = response.get('NextShardIterator')
+            if iterator is None:
+                checkpoint.save(stream_name, self.shard_id, finished=True)
+                logging.info(f'Finished reading closed shard {self.shard_id}')
+                return
+            if not records:
+                if consumer.until_caught_up and \
+                        not response.get('MillisBehindLatest'):
+                    return
+                consumer.stop.wait(consumer.poll_interval)
+
+
+class _Consumer:
+    """The state shared by the coordinator and the shard readers."""
+
+    def __init__(self, client, stream_name, handle, checkpoint,
+                 poll_interval, limit, until_caught_up, stop):
+        self.client = client
+        self.stream_name = stream_name
+        self.handle = handle
+        self.checkpoint = checkpoint
+        self.poll_interval = poll_interval
+        self.limit = limit
+        self.until_caught_up = until_caught_up
+        self.stop = stop
+        self.error = None
+        self._lock = threading.Lock()
+        self.stats = {'shards': 0, 'records': 0, 'articles': 0}
+
+    def add(self, records, articles):
+        with self._lock:
+            self.stats['records'] += records
+            self.stats['articles'] += articles
+        count('records_consumed', records)
+
+
+def consume(stream_name, handle, client=None, checkpoint=None,
+            initial_position='TRIM_HORIZON', poll_interval=1.0,
+            limit=MAX_RECORDS_PER_CALL, until_caught_up=False,
+            rediscover_interval=30.0, stop=None):
+    """
+    Reads every shard of a stream in parallel, with a thread per shard.
+
+    Each batch of records from a shard is decoded and passed to `handle`
+    as a list of ConsumedRecords, one per article, and the last sequence
+    number in the batch is checkpointed once `handle` returns. Records
+    are therefore delivered at least once: after a restart, reading
+    resumes after the last checkpointed batch, and a batch that was
+    being handled when the consumer stopped is delivered again.
+
+    Shards are listed again whenever a shard is read to its end and
+    every `rediscover_interval` seconds, so resharding is followed.
+    A child shard is only read once its parents have been read to their
+    end, which keeps each partition key's records in order.
+
+    Args:
+        stream_name (str): The stream to read.
+        handle (callable): Called with each non-empty batch of
+        ConsumedRecords, from the shard's own thread. An exception
+        stops the consumer and is re-raised.
+        client (optional): A boto3 Kinesis client. Defaults to the
+        shared client from get_kinesis_client().
+        checkpoint (ShardCheckpoint, optional): Where positions are
+        recorded. Defaults to a ShardCheckpoint at
+        DEFAULT_CHECKPOINT_PATH.
+        initial_position (str, optional): Where to start a shard that
+        has no checkpoint and no parent, 'TRIM_HORIZON' or 'LATEST'.
+        Defaults to 'TRIM_HORIZON'.
+        poll_interval (float, optional): Seconds to wait after an empty
+        GetRecords response. Defaults to 1.0.
+        limit (int, optional): The most records per GetRecords call.
+        Defaults to MAX_RECORDS_PER_CALL.
+        until_caught_up (bool, optional): Return once every shard has
+        been read to the tip of the stream, instead of waiting for new
+        records. Defaults to False.
+        rediscover_interval (float, optional): Seconds between shard
+        listings. Defaults to 30.
+        stop (threading.Event, optional): Set to stop reading.
+        Defaults to None.
+
+    Returns:
+        dict: The number of 'shards' read, Kinesis 'records' and
+        decoded 'articles'.
+
+    Raises:
+        ValueError: If a record cannot be decoded.
+        Exception: Any error raised by `handle` or the Kinesis client.
+    """
+    consumer = _Consumer(
+        client or get_kinesis_client(), stream_name, handle,
+        checkpoint or ShardCheckpoint(), poll_interval, limit,
+        until_caught_up, stop or threading.Event())
+    ended = queue.Queue()
+    readers = {}
+    done = set()
+
+    def run(reader):
+        try:
+            reader.run()
+        except BaseException as err:
+            if consumer.error is None:
+                consumer.error = err
+            consumer.stop.set()
+        finally:
+            ended.put(reader.shard_id)
+
+    try:
+        while not consumer.stop.is_set():
+            shards = list_all_shards(consumer.client, stream_name)
+            listed = {shard['ShardId'] for shard in shards}
+            for shard in shards:
+                shard_id = shard['ShardId']
+                if shard_id in readers or shard_id in done:
+                    continue
+                if consumer.checkpoint.is_finished(stream_name, shard_id):
+                    done.add(shard_id)
+                    continue
+                parents = [parent for parent in _parents(shard)
+                           if parent in listed]
+                if any(parent not in done for parent in parents):
+                    continue
+                reader = _ShardReader(
+                    consumer, shard,
+                    'TRIM_HORIZON' if _parents(shard) else initial_position)
+                readers[shard_id] = threading.Thread(
+                    target=run, args=(reader,), daemon=True,
+                    name=f'consumer-{shard_id}')
+                readers[shard_id].start()
+                consumer.stats['shards'] += 1
+
+            if not readers:
+                if until_caught_up:
+                    break
+                consumer.stop.wait(rediscover_interval)
+                continue
+            try:
+                shard_id = ended.get(timeout=rediscover_interval)
+            except queue.Empty:
+                continue
+            readers.pop(shard_id).join()
+            if consumer.checkpoint.is_finished(stream_name, shard_id) or \
+                    until_caught_up:
+                done.add(shard_id)
+    finally:
+        consumer.stop.set()
+        for thread in readers.values():
+            thread.join()
+
+    if consumer.error is not None:
+        logging.error(f'Consumer failed: {consumer.error}')
+        raise consumer.error
+    logging.info(
+        f"Consumed {consumer.stats['records']} records from "
+        f"{consumer.stats['shards']} shards of {stream_name}")
+    return consumer.stats
@@ -1,8 +1,66 @@
-"""This module contains the definition for the for_article() function."""
+"""This module contains the definitions for the format_article(),
+format_articles() and format_articles_parallel() functions and the
+ArticleRecord class."""
 
+import atexit
 import logging
+import os
+import threading
+from json.encoder import encode_basestring_ascii
+from src.metrics import count, timer
+from src.preview import extract_preview
 
-logging.basicConfig(level=logging.INFO)
+# The maximum length of content_preview, in characters.
+PREVIEW_LENGTH = 1000
+
+# Batches smaller than this are formatted in process by
+# format_articles_parallel(), as handing them to worker processes costs
+# more than formatting them (about 50 microseconds an article).
+PARALLEL_MIN_ARTICLES = 500
+
+# The smallest chunk of articles sent to a worker process at a time.
+MIN_CHUNK_SIZE = 50
+
+# Worker processes are started by a server process rather than forked
+# from this one, as the pool is started from worker threads, and a fork
+# taken while another thread holds a lock, such as the logging or
+# import lock, can deadlock the child.
+POOL_START_METHODS = ('forkserver', 'spawn')
+
+# The shared pools, by number of workers.
+_pools = {}
+_pool_lock = threading.Lock()
+
+# The Guardian 'show-fields' needed for each content_preview source.
+# 'body' is the full article HTML; 'trailText' is a short standfirst,
+# orders of magnitude smaller, for when a brief preview is enough.
+PREVIEW_FIELDS = {
+    'body': 'trailText,body',
+    'trailText': 'trailText'
+}
+
+
+def fields_for_preview(preview='body'):
+    """
+    Returns the Guardian 'show-fields' value that format_article() needs
+    to build a content preview from the given source.
+
+    Args:
+        preview (str, optional): The preview source, 'body' or
+        'trailText'. Defaults to 'body'.
+
+    Returns:
+        str: The comma separated fields to request.
+
+    Raises:
+        ValueError: If the preview source is not recognised.
+    """
+    try:
+        return PREVIEW_FIELDS[preview]
+    except KeyError:
+        raise ValueError(
+            f'Unknown preview source {preview!r}, expected one of '
+            f'{sorted(PREVIEW_FIELDS)}') from None
 
 
 def format_article(article):
@@ -30,7 +88,9 @@ def format_article(article):
             - 'webTitle' (str): The title of the article.
             - 'webUrl' (str): The URL of the article.
             - 'content_preview' (str): The first 1000 characters
-            of the article content.
+            of the article's visible text, with markup stripped and
+            entities decoded, taken from the body or, when the body was
+            not requested, the trailText, and then the title.
 
     Raises:
         TypeError: If the input is not a dictionary.
@@ -40,9 +100,10 @@ def format_article(article):
         if not isinstance(article, dict):
             raise TypeError("Expected a dictionary representing an article!")
 
-        content = article.get('fields', {}).get('body', '')
+        fields = article.get('fields', {})
+        content = fields.get('body') or fields.get('trailText', '')
 
-        content_preview = content[:1000] if content else article.get('webTitle', '')[:1000]  # noqa
+        content_preview = extract_preview(content, PREVIEW_LENGTH) if content else article.get('webTitle', '')[:PREVIEW_LENGTH]  # noqa
 
         return {
             "webPublicationDate": article.get("webPublicationDate"),
@@ -54,3 +115,295 @@ def format_article(article):
     except Exception as err:
         logging.error(f'Unexpected Error has occurred: {err}')
         raise
+
+
+# The fields of a formatted article, in output order.
+RECORD_FIELDS = ('webPublicationDate', 'webTitle', 'webUrl', 'content_preview')  # noqa
+
+# Matches the formatting of json.dumps() with its default separators.
+_RECORD_TEMPLATE = ('{"webPublicationDate": %s, "webTitle": %s, '
+                    '"webUrl": %s, "content_preview": %s}')
+
+
+def _encode(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+class ArticleRecord:
+    """
+    A compact formatted article.
+
+    Records hold the same four fields as the dict returned by
+    format_article() in __slots__, without a per-instance dict, and can
+    be read like that dict with record['webTitle'] or record.get().
+
+    Args:
+        webPublicationDate (str): The publication date of the article.
+        webTitle (str): The title of the article.
+        webUrl (str): The URL of the article.
+        content_preview (str): The content preview.
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, webPublicationDate, webTitle, webUrl,
+                 content_preview):
+        self.webPublicationDate = webPublicationDate
+        self.webTitle = webTitle
+        self.webUrl = webUrl
+        self.content_preview = content_preview
+
+    def __getitem__(self, name):
+        if name not in RECORD_FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        """Returns a field by name, or default if there is no such field."""
+        return getattr(self, name) if name in RECORD_FIELDS else default
+
+    def __eq__(self, other):
+        if isinstance(other, ArticleRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f'ArticleRecord({self.to_dict()!r})'
+
+    def to_dict(self):
+        """dict: The record as the dict format_article() returns."""
+        return {
+            'webPublicationDate': self.webPublicationDate,
+            'webTitle': self.webTitle,
+            'webUrl': self.webUrl,
+            'content_preview': self.content_preview
+        }
+
+    def to_json(self):
+        """str: The record as JSON, identical to json.dumps(to_dict())."""
+        return _RECORD_TEMPLATE % (
+            _encode(self.webPublicationDate), _encode(self.webTitle),
+            _encode(self.webUrl), _encode(self.content_preview))
+
+    def to_json_bytes(self):
+        """bytes: The record as ASCII JSON bytes."""
+        return self.to_json().encode('ascii')
+
+
+def _as_text(value):
+    """Returns value unless it is set to something other than a string."""
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def format_articles(articles, preview_length=PREVIEW_LENGTH):
+    """
+    Formats a batch of Guardian articles into ArticleRecords.
+
+    The whole batch is validated once up front, then every article is
+    formatted without per-article exception handling or logging. The
+    records hold the same values format_article() would return.
+
+    Args:
+        articles (iterable): Raw Guardian article dictionaries.
+        preview_length (int, optional): The maximum content_preview
+        length in characters. Defaults to PREVIEW_LENGTH.
+
+    Returns:
+        list: An ArticleRecord per article, in order.
+
+    Raises:
+        TypeError: If any item is not a dictionary.
+    """
+    articles = list(articles)
+    for index, article in enumerate(articles):
+        if not isinstance(article, dict):
+            raise TypeError(
+                f"Expected a dictionary representing an article at "
+                f"index {index}!")
+
+    records = []
+    append = records.append
+    with timer('format'):
+        for article in articles:
+            get = article.get
+            fields = get('fields') or {}
+            content = fields.get('body') or fields.get('trailText')
+            if content:
+                preview = extract_preview(content, preview_length)
+            else:
+                preview = (get('webTitle') or '')[:preview_length]
+            append(ArticleRecord(
+                _as_text(get('webPublicationDate')),
+                _as_text(get('webTitle')), _as_text(get('webUrl')), preview))
+    count('records_formatted', len(records))
+    return records
+
+
+def records_to_json_bytes(records):
+    """
+    Serializes a list of records to a JSON array.
+
+    Args:
+        records (list): ArticleRecords.
+
+    Returns:
+        bytes: The same bytes as json.dumps() of the records as dicts.
+    """
+    return ('[' + ', '.join(record.to_json() for record in records)
+            + ']').encode('ascii')
+
+
+def _previews(items, preview_length):
+    """
+    Builds the previews for a chunk of articles, in a worker process.
+
+    Args:
+        items (list): (content, title) pairs, where content is the body
+        or trailText, or None.
+        preview_length (int): The maximum preview length in characters.
+
+    Returns:
+        list: The previews, in order.
+    """
+    return [extract_preview(content, preview_length) if content
+            else (title or '')[:preview_length]
+            for content, title in items]
+
+
+def get_format_pool(max_workers=None):
+    """
+    Returns the shared process pool used by format_articles_parallel().
+
+    The pool is created on first use and kept, so its start-up cost is
+    paid once per process. Its workers are started with the first of
+    POOL_START_METHODS the platform supports, never by forking. A pool
+    is never replaced while other threads may be using it: asking for a
+    different number of workers returns a separate shared pool of that
+    size.
+
+    Args:
+        max_workers (int, optional): The worker processes. Defaults to
+        the number of CPUs.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with _pool_lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            available = multiprocessing.get_all_start_methods()
+            method = next(method for method in POOL_START_METHODS
+                          if method in available)
+            pool = _pools[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context(method))
+        return pool
+
+
+def _discard_format_pool(pool):
+    """Drops a broken shared pool, so the next call starts a new one."""
+    with _pool_lock:
+        for workers, shared in list(_pools.items()):
+            if shared is pool:
+                del _pools[workers]
+    pool.shutdown(wait=False)
+
+
+def shutdown_format_pool():
+    """Shuts down the shared process pools, if any were started."""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_format_pool)
+
+
+def format_articles_parallel(articles, max_workers=None, chunk_size=None,
+                             min_articles=PARALLEL_MIN_ARTICLES,
+                             preview_length=PREVIEW_LENGTH, executor=None):
+    """
+    Formats a batch of Guardian articles into ArticleRecords, building
+    the previews on a pool of worker processes.
+
+    Preview extraction is the CPU-bound part of formatting, so only the
+    body (or trailText) and title of each article are sent to the
+    workers, in chunks, and only the preview strings come back; the
+    records are assembled in this process. Chunks are collected in
+    submission order, so the records are in the same order, with the
+    same values, as format_articles() returns. Batches of fewer than
+    `min_articles`, and environments where worker processes cannot be
+    started, are formatted in process with format_articles().
+
+    Args:
+        articles (iterable): Raw Guardian article dictionaries.
+        max_workers (int, optional): The worker processes of the shared
+        pool, see get_format_pool(). Defaults to the number of CPUs.
+        chunk_size (int, optional): The articles per chunk. Defaults to
+        about four chunks per worker, and at least MIN_CHUNK_SIZE.
+        Without max_workers, a single CPU means formatting in process.
+        min_articles (int, optional): The smallest batch worth sending
+        to the pool. Defaults to PARALLEL_MIN_ARTICLES.
+        preview_length (int, optional): The maximum content_preview
+        length in characters. Defaults to PREVIEW_LENGTH.
+        executor (Executor, optional): The pool to use instead of the
+        shared one. Defaults to None.
+
+    Returns:
+        list: An ArticleRecord per article, in order.
+
+    Raises:
+        TypeError: If any item is not a dictionary.
+    """
+    articles = list(articles)
+    workers = max_workers or os.cpu_count() or 1
+    if len(articles) < max(min_articles, 1) or (
+            executor is None and workers == 1):
+        return format_articles(articles, preview_length)
+
+    for index, article in enumerate(articles):
+        if not isinstance(article, dict):
+            raise TypeError(
+                f"Expected a dictionary representing an article at "
+                f"index {index}!")
+
+    items = []
+    for article in articles:
+        fields = article.get('fields') or {}
+        content = fields.get('body') or fields.get('trailText')
+        items.append((content, None if content else article.get('webTitle')))
+    size = chunk_size or max(MIN_CHUNK_SIZE, -(-len(items) // (workers * 4)))
+    chunks = [items[start:start + size]
+              for start in range(0, len(items), size)]
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    with timer('format'):
+        pool = None
+        try:
+            pool = executor or get_format_pool(max_workers)
+            previews = [preview for chunk in pool.map(
+                _previews, chunks, [preview_length] * len(chunks))
+                for preview in chunk]
+        except (OSError, NotImplementedError, BrokenProcessPool) as pool_err:
+            logging.warning(
+                f'Formatting in process, as worker processes are not '
+                f'available: {pool_err}')
+            if executor is None and pool is not None and \
+                    isinstance(pool_err, BrokenProcessPool):
+                _discard_format_pool(pool)
+            previews = _previews(items, preview_length)
+        records = [
+            ArticleRecord(
+                _as_text(article.get('webPublicationDate')),
+                _as_text(article.get('webTitle')),
+                _as_text(article.get('webUrl')), preview)
+            for article, preview in zip(articles, previews)]
+    count('records_formatted', len(records))
+    return records
@@ -0,0 +1,135 @@
+"""This module contains the AWS Lambda entry point, handler()."""
+
+import logging
+import os
+from src.api_interaction import get_api_key, get_session
+from src.brokers import KinesisBroker, broker_scheme
+from src.main import main, main_multi
+from src.metrics import EmfEmitter, SamplingProfiler, get_collector, \
+    set_collector, timer
+from src.relevance_filter import RelevanceFilter
+from src.send_to_kinesis import get_kinesis_client
+
+# The Lambda runtime installs its own log handler; only the level is
+# set here, once per container.
+logging.getLogger().setLevel(logging.INFO)
+
+# The stream used when an event does not name one.
+STREAM_ENV_VAR = 'Kinesis_Stream_Name'
+
+# Set to 'off' to stop writing EMF metrics to the log.
+METRICS_ENV_VAR = 'Guardian_Metrics'
+
+# Seconds between profiler samples; the profiler runs only when set.
+PROFILE_ENV_VAR = 'Guardian_Profile_Interval'
+
+
+def _install_metrics():
+    """
+    Installs an EmfEmitter once per container, unless metrics are turned
+    off or a collector is already installed.
+
+    Returns:
+        MetricsCollector: The installed collector, or None.
+    """
+    if get_collector() is None and \
+            os.getenv(METRICS_ENV_VAR, '').lower() != 'off':
+        set_collector(EmfEmitter(dimensions={'Service': 'guardian-streaming'}))
+    return get_collector()
+
+
+def warm_up(broker_id=None):
+    """
+    Creates the HTTP session and Kinesis client and reads the API key.
+
+    Each is cached at module level, so this does the work once per
+    container: the first invocation pays for it and warm invocations
+    reuse them. The Kinesis client, and the boto3 import behind it, is
+    only created for a broker that sends to Kinesis.
+
+    Args:
+        broker_id (str or broker, optional): The broker the invocation
+        publishes to, see src.brokers.get_broker(). Defaults to None,
+        which warms the Kinesis client.
+
+    Raises:
+        ValueError: If the API key is not set.
+    """
+    if not get_api_key():
+        raise ValueError(
+            'API key is missing. Please set the "Guardian_API_Key" environment variable')  # noqa
+    get_session()
+    if broker_id is None or isinstance(broker_id, KinesisBroker) or (
+            isinstance(broker_id, str) and
+            broker_scheme(broker_id) == 'kinesis'):
+        get_kinesis_client()
+
+
+def handler(event, context):
+    """
+    Runs main() for the query in a Lambda event, or main_multi() for
+    a list of queries.
+
+    Args:
+        event (dict): The invocation event, with:
+            - 'query' (str) or 'queries' (list): What to search for.
+            - 'broker_id' (str, optional): The Kinesis stream. Defaults
+            to the Kinesis_Stream_Name environment variable.
+            - 'date_from' (str, optional): The earliest publication
+            date, 'YYYY-MM-DD'.
+            - 'max_articles' (int, optional): The articles per query.
+            Defaults to 10.
+            - 'include', 'exclude' (list, optional) and 'min_score'
+            (float, optional): Terms for a RelevanceFilter that drops
+            irrelevant articles before they are sent.
+        context: The Lambda context object.
+
+    Returns:
+        dict: 'statusCode' 200 and the queries that were run.
+
+    Stage timings and counters are written to the log as CloudWatch EMF
+    lines at the end of every invocation, unless the Guardian_Metrics
+    environment variable is 'off'. Setting Guardian_Profile_Interval
+    also runs the SamplingProfiler and logs where the time went.
+
+    Raises:
+        ValueError: If the event names no query or no stream, the API key
+        is missing, or no articles are found.
+        Exception: Any error raised by main().
+    """
+    queries = event.get('queries') or \
+        ([event['query']] if event.get('query') else [])
+    broker_id = event.get('broker_id') or os.getenv(STREAM_ENV_VAR)
+    if not queries:
+        raise ValueError('The event must include a "query" or "queries"!')
+    if not broker_id:
+        raise ValueError(
+            f'The event must include a "broker_id", or the '
+            f'"{STREAM_ENV_VAR}" environment variable must be set!')
+
+    collector = _install_metrics()
+    interval = os.getenv(PROFILE_ENV_VAR)
+    profiler = SamplingProfiler(float(interval)) if interval else None
+    if profiler:
+        profiler.start()
+    try:
+        with timer('invocation'):
+            warm_up(broker_id)
+
+            options = {'date_from': event.get('date_from'),
+                       'max_articles': event.get('max_articles', 10)}
+            if event.get('include') or event.get('exclude'):
+                options['relevance'] = RelevanceFilter(
+                    event.get('include'), event.get('exclude'),
+                    event.get('min_score', 1))
+            if event.get('queries'):
+                main_multi(queries, broker_id, **options)
+            else:
+                main(queries[0], broker_id, **options)
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.log_report()
+        if collector is not None:
+            collector.flush()
+    return {'statusCode': 200, 'queries': queries}
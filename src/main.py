@@ -1,27 +1,139 @@
 """This module contains the definition
 for the main() function.
 """
-from src.api_interaction import api_interaction
-from src.format_article import format_article
-from src.send_to_kinesis import send_to_kinesis
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from src.api_interaction import iter_articles, get_session, MAX_PAGE_SIZE
+from src.brokers import get_broker
+from src.format_article import format_articles, \
+    format_articles_parallel, fields_for_preview
+from src.partitioning import by_query
+from src.send_to_kinesis import replay_spool
+from src.watermark import iter_new_articles
 import logging
 
-logging.basicConfig(level=logging.INFO)
 
+def _spooled(result):
+    """Returns the number of records a publish left in the spool."""
+    if isinstance(result, dict):
+        return result.get('spooled') or 0
+    return 0
 
-def main(query, broker_id, date_from=None):
+
+def main(query, broker_id, date_from=None, max_articles=10, cache=None,
+         watermark_store=None, order_by='newest', preview='body',
+         stream=False, spool=None, relevance=None, format_workers=None):
+    """
+    Fetches, formats and publishes up to `max_articles` Guardian
+    articles to the given Kinesis stream or other broker.
+
+    The articles are sent as one record keyed by a hash of the query,
+    see src.partitioning.by_query(), so runs for different queries are
+    spread over the stream's shards.
+
+    Articles are streamed page by page from the API and formatted as
+    they arrive, so no more pages are requested than are needed to
+    reach `max_articles`. The request is shaped to match: the page size
+    is the result limit, up to the API's MAX_PAGE_SIZE, and only the
+    fields the preview needs are requested.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        broker_id (str): The name of the Kinesis stream to send to, a
+        broker URI such as 'file:///var/tmp/guardian-log', or a broker,
+        see src.brokers.get_broker().
+        date_from (str, optional): The earliest publication date to
+        filter articles, formatted as 'YYYY-MM-DD'. Defaults to None.
+        max_articles (int, optional): The maximum number of articles to
+        send. Defaults to 10.
+        cache (ResponseCache, optional): A cache for API responses, so
+        repeated runs of the same query are served without a network
+        round trip. Defaults to None.
+        watermark_store (WatermarkStore, optional): Enables incremental
+        mode. Only articles published since the query's stored
+        high-water mark are sent, `date_from` is ignored, and the mark
+        is advanced once the send succeeds. Defaults to None.
+        order_by (str, optional): The result ordering, so the default
+        sends the most recent articles. Ignored in incremental mode,
+        which sends the oldest new articles first, so a backlog of more
+        than `max_articles` is sent over several runs. Defaults to
+        'newest'.
+        preview (str, optional): The content_preview source, 'body' or
+        the much smaller 'trailText'. Defaults to 'body'.
+        stream (bool, optional): Parse API responses incrementally, one
+        article at a time, to bound memory use. Defaults to False.
+        spool (Spool, optional): Enables durable delivery. Records left
+        in the spool by earlier runs are replayed before anything is
+        fetched, and if the stream is still unavailable the run stops
+        there without calling the API. A record that cannot be sent is
+        spooled for the next run instead of being lost, and counts as
+        sent for the watermark. Defaults to None.
+        relevance (RelevanceFilter, optional): Drops formatted articles
+        that are not relevant before they are sent. Dropped articles
+        still advance the watermark. Defaults to None.
+        format_workers (int, optional): Format large batches on this
+        many worker processes, see format_articles_parallel().
+        Defaults to None (in process).
+
+    Raises:
+        ValueError: If no articles are found for the query and date.
+        Exception: Any error raised while fetching, formatting or sending.
+    """
+    broker = None
+    result = None
     try:
-        raw_data = api_interaction(query, date_from)
+        show_fields = fields_for_preview(preview)
+        page_size = min(max_articles, MAX_PAGE_SIZE)
+        broker = get_broker(broker_id, spool=spool)
+
+        if spool is not None:
+            replay_spool(spool)
+
+        if watermark_store is not None:
+            watermark = watermark_store.get(query)
+            articles = iter_new_articles(
+                query, watermark, page_size=page_size,
+                max_articles=max_articles, show_fields=show_fields,
+                cache=cache, stream=stream)
+        else:
+            articles = iter_articles(
+                query, date_from, page_size=page_size,
+                max_articles=max_articles, order_by=order_by,
+                show_fields=show_fields, cache=cache, stream=stream)
+
+        raw_articles = list(islice(articles, max_articles))
+
+        if not raw_articles:
+            if watermark_store is not None:
+                logging.info(f"No new articles found for {query}")
+                return
+            raise ValueError("No articles found for the given query and date!")  # noqa
 
-        if not raw_data or 'response' not in raw_data or not raw_data['response'].get(   # noqa
-                'results'):
-            raise ValueError("No articles found for the given query and date!")
+        if format_workers:
+            formatted_data = format_articles_parallel(
+                raw_articles, max_workers=format_workers)
+        else:
+            formatted_data = format_articles(raw_articles)
+        if relevance is not None:
+            formatted_data = relevance.filter_records(
+                raw_articles, formatted_data)
 
-        formatted_data = [format_article(
-            article) for article in raw_data['response']['results'][:10]]
+        if formatted_data:
+            result = broker.publish(
+                formatted_data, partition_key=by_query(query))
 
-        send_to_kinesis(formatted_data, broker_id)
+        if watermark_store is not None:
+            watermark.advance(raw_articles)
+            watermark_store.save(query, watermark)
 
+        if not formatted_data:
+            logging.info(f"No relevant articles found for {query}")
+            return
+        if _spooled(result):
+            logging.warning(
+                f"{_spooled(result)} record(s) could not be sent and were "
+                f"spooled for the next run")
+            return
         logging.info("Articles sent to Kinesis successfully!")
     except ValueError as ve:
         logging.error(f"Value Error: {ve}")
@@ -29,3 +141,152 @@ def main(query, broker_id, date_from=None):
     except Exception as e:
         logging.error(f"An unexpected error has occurred: {e}")
         raise
+    finally:
+        if broker is not None and broker is not broker_id:
+            broker.close()
+
+
+def article_key(article):
+    """Returns the identity used to spot an article found by two queries."""
+    return article.get('id') or article.get('webUrl')
+
+
+def merge_results(results):
+    """
+    Merges the articles found by several queries, dropping duplicates.
+
+    Each article is kept once, at its first position, with a 'queries'
+    list naming every query that found it. Articles keep the order of
+    `results` and, within a query, the order the API returned them in.
+
+    Args:
+        results (list): (query, articles) pairs.
+
+    Returns:
+        list: The merged article dicts.
+    """
+    merged = {}
+    for query, articles in results:
+        for article in articles:
+            key = article_key(article)
+            if key in merged:
+                if query not in merged[key]['queries']:
+                    merged[key]['queries'].append(query)
+            else:
+                merged[key] = {**article, 'queries': [query]}
+    return list(merged.values())
+
+
+def main_multi(queries, broker_id, date_from=None, max_articles=10,
+               cache=None, order_by='newest', preview='body', stream=False,
+               max_workers=8, relevance=None, format_workers=None):
+    """
+    Fetches up to `max_articles` Guardian articles for each of several
+    queries concurrently and publishes the merged results to Kinesis,
+    or another broker, as a single record.
+
+    Queries run on a thread pool sharing one HTTP session, sized so
+    each worker keeps its own pooled connection. The process-wide rate
+    limiter still applies, so the Guardian request rate, not the number
+    of queries, bounds how long a run takes. An article found by more
+    than one query is sent once, with a 'queries' list naming all of
+    them. A query that fails is logged and skipped. The record is keyed
+    by a hash of the queries, see src.partitioning.by_query().
+
+    Args:
+        queries (list): The search query strings.
+        broker_id (str): The name of the Kinesis stream to send to, a
+        broker URI or a broker, see src.brokers.get_broker().
+        date_from (str, optional): The earliest publication date to
+        filter articles, formatted as 'YYYY-MM-DD'. Defaults to None.
+        max_articles (int, optional): The maximum number of articles to
+        fetch per query. Defaults to 10.
+        cache (ResponseCache, optional): A cache for API responses.
+        Defaults to None.
+        order_by (str, optional): The result ordering within each query.
+        Defaults to 'newest'.
+        preview (str, optional): The content_preview source, 'body' or
+        'trailText'. Defaults to 'body'.
+        stream (bool, optional): Parse API responses incrementally.
+        Defaults to False.
+        max_workers (int, optional): The number of queries run at once.
+        Defaults to 8.
+        relevance (RelevanceFilter, optional): Drops merged articles that
+        are not relevant before they are sent. Defaults to None.
+        format_workers (int, optional): Format large merged batches on
+        this many worker processes, see format_articles_parallel().
+        Defaults to None (in process).
+
+    Raises:
+        ValueError: If no articles are found for any of the queries.
+        Exception: The first query's error if every query failed, or any
+        error raised while formatting or sending.
+    """
+    try:
+        show_fields = fields_for_preview(preview)
+        page_size = min(max_articles, MAX_PAGE_SIZE)
+        queries = list(dict.fromkeys(queries))
+        get_session(pool_maxsize=max(max_workers, 10))
+
+        def fetch(query):
+            articles = iter_articles(
+                query, date_from, page_size=page_size,
+                max_articles=max_articles, order_by=order_by,
+                show_fields=show_fields, cache=cache, stream=stream)
+            return list(islice(articles, max_articles))
+
+        results = []
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(query, executor.submit(fetch, query))
+                       for query in queries]
+            for query, future in futures:
+                try:
+                    results.append((query, future.result()))
+                except Exception as err:
+                    logging.error(f"Query {query!r} failed: {err}")
+                    errors.append(err)
+
+        if errors and not results:
+            raise errors[0]
+
+        merged = merge_results(results)
+        if not merged:
+            raise ValueError("No articles found for the given queries and date!")  # noqa
+
+        if format_workers:
+            records = format_articles_parallel(
+                merged, max_workers=format_workers)
+        else:
+            records = format_articles(merged)
+        if relevance is not None:
+            merged, records = relevance.apply(merged, records)
+            if not records:
+                logging.info("No relevant articles found for the queries")
+                return
+        formatted_data = [
+            {**record.to_dict(), 'queries': article['queries']}
+            for record, article in zip(records, merged)]
+
+        broker = get_broker(broker_id)
+        try:
+            result = broker.publish(
+                formatted_data, partition_key=by_query('\n'.join(queries)))
+        finally:
+            if broker is not broker_id:
+                broker.close()
+
+        if _spooled(result):
+            logging.warning(
+                f"{_spooled(result)} record(s) could not be sent and were "
+                f"spooled for the next run")
+            return
+        logging.info(
+            f"{len(formatted_data)} articles for {len(results)} queries "
+            f"sent to Kinesis successfully!")
+    except ValueError as ve:
+        logging.error(f"Value Error: {ve}")
+        raise
+    except Exception as e:
+        logging.error(f"An unexpected error has occurred: {e}")
+        raise
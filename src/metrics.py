@@ -0,0 +1,315 @@
+"""This module contains the instrumentation layer: the timer() and
+count() hooks used around each stage, the MetricsCollector and
+EmfEmitter that receive them, and an optional SamplingProfiler.
+
+The hooks do nothing until a collector is installed with
+set_collector(), so uninstrumented runs pay almost nothing for them.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+NAMESPACE = 'GuardianStreaming'
+
+# CloudWatch accepts at most 100 values per metric in one EMF record.
+MAX_EMF_VALUES = 100
+
+_collector = None
+_profiler = None
+
+# The stage each thread is in, for the profiler to attribute samples.
+_stages = {}
+
+
+def _summarise(timings, counters):
+    return {
+        'timings': {
+            name: {'count': len(values),
+                   'total_ms': sum(values),
+                   'max_ms': max(values)}
+            for name, values in timings.items()},
+        'counters': dict(counters),
+    }
+
+
+class MetricsCollector:
+    """
+    Collects stage timings and counters in process.
+
+    Thread-safe, so the pipeline and fan-out threads can share one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.counters = Counter()
+
+    def timing(self, name, milliseconds):
+        """Records one duration of a stage, in milliseconds."""
+        with self._lock:
+            self.timings.setdefault(name, []).append(milliseconds)
+
+    def count(self, name, value=1):
+        """Adds to a counter."""
+        with self._lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        """
+        Summarises what has been collected.
+
+        Returns:
+            dict: 'timings' with the 'count', 'total_ms' and 'max_ms' of
+            each stage, and 'counters'.
+        """
+        with self._lock:
+            return _summarise(self.timings, self.counters)
+
+    def _take(self):
+        """Returns the timings and counters and starts afresh."""
+        with self._lock:
+            taken = self.timings, self.counters
+            self.timings = {}
+            self.counters = Counter()
+        return taken
+
+    def reset(self):
+        """Forgets everything collected so far."""
+        self._take()
+
+    def flush(self):
+        """
+        Returns the snapshot and resets the collector.
+
+        Returns:
+            dict: See snapshot().
+        """
+        return _summarise(*self._take())
+
+
+def _unit(name):
+    if name.endswith('_bytes'):
+        return 'Bytes'
+    return 'Count'
+
+
+class EmfEmitter(MetricsCollector):
+    """
+    Collects metrics and writes them as CloudWatch Embedded Metric
+    Format (EMF) JSON lines.
+
+    On Lambda, lines written to stdout are turned into CloudWatch
+    metrics without any API calls. Call flush() at the end of each
+    invocation.
+
+    Args:
+        namespace (str, optional): The CloudWatch namespace.
+        Defaults to NAMESPACE.
+        dimensions (dict, optional): Dimension names and values added to
+        every metric. Defaults to None.
+        stream (file, optional): Where to write. Defaults to stdout.
+    """
+
+    def __init__(self, namespace=NAMESPACE, dimensions=None, stream=None):
+        super().__init__()
+        self.namespace = namespace
+        self.dimensions = dict(dimensions or {})
+        self.stream = stream
+
+    def to_emf(self, timings, counters):
+        """
+        Builds the EMF records for a set of timings and counters.
+
+        Stage timings are sent as arrays of values, up to 100 per
+        record, so CloudWatch keeps their full distribution.
+
+        Returns:
+            list: EMF records, as dicts.
+        """
+        records = []
+        longest = max([len(values) for values in timings.values()] + [1])
+        for start in range(0, longest, MAX_EMF_VALUES):
+            metrics = []
+            record = dict(self.dimensions)
+            for name, values in timings.items():
+                chunk = values[start:start + MAX_EMF_VALUES]
+                if chunk:
+                    metrics.append({'Name': f'{name}_ms',
+                                    'Unit': 'Milliseconds'})
+                    record[f'{name}_ms'] = chunk
+            if not start:
+                for name, value in counters.items():
+                    metrics.append({'Name': name, 'Unit': _unit(name)})
+                    record[name] = value
+            if not metrics:
+                continue
+            record['_aws'] = {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(self.dimensions)],
+                    'Metrics': metrics,
+                }],
+            }
+            records.append(record)
+        return records
+
+    def flush(self):
+        """
+        Writes the collected metrics as EMF lines and resets.
+
+        Returns:
+            dict: The snapshot that was written, see snapshot().
+        """
+        timings, counters = self._take()
+        stream = self.stream or sys.stdout
+        for record in self.to_emf(timings, counters):
+            stream.write(json.dumps(record) + '\n')
+        stream.flush()
+        return _summarise(timings, counters)
+
+
+def get_collector():
+    """Returns the installed collector, or None."""
+    return _collector
+
+
+def set_collector(collector):
+    """
+    Installs the collector that timer() and count() report to.
+
+    Args:
+        collector (MetricsCollector): The collector, or None to turn
+        instrumentation off.
+    """
+    global _collector
+    _collector = collector
+
+
+def count(name, value=1):
+    """
+    Adds to a counter, if a collector is installed.
+
+    Args:
+        name (str): The counter, such as 'kinesis_retries'. Names ending
+        in '_bytes' are reported in bytes.
+        value (int, optional): The amount to add. Defaults to 1.
+    """
+    collector = _collector
+    if collector is not None:
+        collector.count(name, value)
+
+
+@contextmanager
+def timer(name):
+    """
+    Times the enclosed block as a stage, if a collector is installed.
+
+    While a SamplingProfiler is running, samples taken inside the block
+    are attributed to the stage.
+
+    Args:
+        name (str): The stage, such as 'http_request'.
+    """
+    collector = _collector
+    if collector is None and _profiler is None:
+        yield
+        return
+    thread = threading.get_ident()
+    outer = _stages.get(thread)
+    _stages[thread] = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if collector is not None:
+            collector.timing(name, (time.perf_counter() - started) * 1000)
+        if outer is None:
+            _stages.pop(thread, None)
+        else:
+            _stages[thread] = outer
+
+
+class SamplingProfiler:
+    """
+    A low-overhead sampling profiler for finding where stages spend
+    their time.
+
+    A background thread looks at the innermost frame of every other
+    thread every `interval` seconds and counts the function it is in,
+    grouped by the stage that thread is in (see timer()). Nothing is
+    traced, so the cost is one stack peek per thread per interval.
+
+    Args:
+        interval (float, optional): Seconds between samples.
+        Defaults to 0.005.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread, frame in sys._current_frames().items():
+                if thread == own:
+                    continue
+                code = frame.f_code
+                location = f'{code.co_filename}:{frame.f_lineno} ' \
+                    f'{code.co_name}'
+                self.samples[(_stages.get(thread, '-'), location)] += 1
+
+    def start(self):
+        """Starts sampling, and attributing samples to stages."""
+        global _profiler
+        self._stop.clear()
+        _profiler = self
+        self._thread = threading.Thread(
+            target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling."""
+        global _profiler
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if _profiler is self:
+            _profiler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def report(self, top=20):
+        """
+        Returns the most sampled locations.
+
+        Args:
+            top (int, optional): The number of locations. Defaults to 20.
+
+        Returns:
+            list: (stage, 'file:line function', samples) tuples, most
+            sampled first.
+        """
+        return [(stage, location, samples) for (stage, location), samples
+                in self.samples.most_common(top)]
+
+    def log_report(self, top=20):
+        """Logs the report at INFO level."""
+        total = sum(self.samples.values()) or 1
+        for stage, location, samples in self.report(top):
+            logging.info(
+                f'profile {stage:>14} {samples / total:6.1%} {location}')
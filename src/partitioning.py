@@ -0,0 +1,193 @@
+"""This module contains the partitioning strategies used to spread
+Kinesis records across the shards of a stream."""
+
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+# Kinesis accepts partition keys of up to 256 characters.
+MAX_PARTITION_KEY_LENGTH = 256
+
+
+def _hash_key(value):
+    """Returns a short, evenly distributed partition key for a value."""
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:32]
+
+
+def by_article(record):
+    """
+    Partitions records by a hash of the article's webUrl or id.
+
+    Every article gets its own partition key, so articles are spread
+    across all shards of the stream, while repeat sends of the same
+    article always land on the same shard.
+
+    Args:
+        record (dict): A formatted article.
+
+    Returns:
+        dict: The PutRecords entry keys, i.e. {'PartitionKey': ...}.
+    """
+    key = record.get('webUrl') or record.get('id') or record.get('webTitle')
+    return {'PartitionKey': _hash_key(key)}
+
+
+def by_query(query):
+    """
+    Returns a strategy that partitions records by a hash of the query.
+
+    All articles for a query land on the same shard, which keeps them in
+    order for consumers, while different queries are spread over shards.
+
+    Args:
+        query (str): The search query the records were fetched for.
+
+    Returns:
+        callable: A strategy taking a record and returning its
+        PutRecords entry keys.
+    """
+    entry = {'PartitionKey': _hash_key(query)}
+
+    def strategy(record):
+        return dict(entry)
+
+    return strategy
+
+
+def fixed(partition_key):
+    """
+    Returns a strategy that sends every record with the same key.
+
+    Args:
+        partition_key (str): The partition key to use.
+
+    Returns:
+        callable: A strategy taking a record and returning its
+        PutRecords entry keys.
+
+    Raises:
+        ValueError: If the key is empty or longer than 256 characters.
+    """
+    if not partition_key or len(partition_key) > MAX_PARTITION_KEY_LENGTH:
+        raise ValueError(
+            f'Partition key must be 1 to {MAX_PARTITION_KEY_LENGTH} '
+            f'characters long!')
+    entry = {'PartitionKey': partition_key}
+
+    def strategy(record):
+        return dict(entry)
+
+    return strategy
+
+
+def list_all_shards(client, broker_id):
+    """
+    Lists every shard of a stream, open and closed, following NextToken.
+
+    Args:
+        client: A boto3 Kinesis client.
+        broker_id (str): The name of the Kinesis stream.
+
+    Returns:
+        list: The shard descriptions returned by list_shards, in order.
+    """
+    shards = []
+    kwargs = {'StreamName': broker_id}
+    while True:
+        response = client.list_shards(**kwargs)
+        shards.extend(response.get('Shards', []))
+        next_token = response.get('NextToken')
+        if not next_token:
+            return shards
+        kwargs = {'NextToken': next_token}
+
+
+def list_open_shards(client, broker_id):
+    """
+    Lists the open shards of a stream, ordered by hash key range.
+
+    Args:
+        client: A boto3 Kinesis client.
+        broker_id (str): The name of the Kinesis stream.
+
+    Returns:
+        list: The open shard descriptions returned by list_shards.
+    """
+    open_shards = [shard for shard in list_all_shards(client, broker_id)
+                   if 'EndingSequenceNumber'
+                   not in shard.get('SequenceNumberRange', {})]
+    return sorted(open_shards, key=lambda shard: int(
+        shard['HashKeyRange']['StartingHashKey']))
+
+
+class ExplicitHashKeyPartitioner:
+    """
+    Spreads records evenly over the open shards of a stream.
+
+    Each record is given an ExplicitHashKey at the midpoint of the next
+    shard's hash key range, round robin, so records are shared equally
+    between shards however their partition keys would have hashed. The
+    shard map is fetched with list_shards and cached for `ttl` seconds,
+    so resharding is picked up without a call per batch.
+
+    Args:
+        client: A boto3 Kinesis client.
+        broker_id (str): The name of the Kinesis stream.
+        ttl (float, optional): How long to cache the shard map, in
+        seconds. Defaults to 300.
+    """
+
+    def __init__(self, client, broker_id, ttl=300):
+        self.client = client
+        self.broker_id = broker_id
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hash_keys = None
+        self._cycle = None
+        self._fetched_at = 0.0
+
+    def refresh(self):
+        """
+        Fetches the current shard map and resets the round robin.
+
+        Raises:
+            ValueError: If the stream has no open shards.
+        """
+        shards = list_open_shards(self.client, self.broker_id)
+        if not shards:
+            raise ValueError(
+                f'Kinesis stream {self.broker_id} has no open shards!')
+
+        hash_keys = []
+        for shard in shards:
+            start = int(shard['HashKeyRange']['StartingHashKey'])
+            end = int(shard['HashKeyRange']['EndingHashKey'])
+            hash_keys.append(str((start + end) // 2))
+
+        with self._lock:
+            self._hash_keys = hash_keys
+            self._cycle = itertools.cycle(hash_keys)
+            self._fetched_at = time.monotonic()
+        logging.info(
+            f'Cached {len(hash_keys)} open shards for {self.broker_id}')
+
+    @property
+    def hash_keys(self):
+        """list: The explicit hash key used for each open shard."""
+        self._ensure_fresh()
+        return list(self._hash_keys)
+
+    def _ensure_fresh(self):
+        if (self._hash_keys is None
+                or time.monotonic() - self._fetched_at > self.ttl):
+            self.refresh()
+
+    def __call__(self, record):
+        self._ensure_fresh()
+        with self._lock:
+            explicit_hash_key = next(self._cycle)
+        entry = by_article(record)
+        entry['ExplicitHashKey'] = explicit_hash_key
+        return entry
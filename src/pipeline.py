@@ -0,0 +1,281 @@
+"""This module contains the definitions for the pipelined
+fetch -> format -> send engine: run_pipeline() and
+run_query_pipeline()."""
+
+import logging
+import queue
+import threading
+import time
+from src.api_interaction import iter_articles
+from src.format_article import format_articles
+from src.send_to_kinesis import send_batch_to_kinesis
+
+# Marks the end of a stage's output.
+_DONE = object()
+
+# How often blocked stages check whether the pipeline has been aborted.
+_POLL_INTERVAL = 0.1
+
+
+def deadline_from_context(context, margin=5.0):
+    """
+    Returns the time by which a Lambda invocation must stop fetching.
+
+    Args:
+        context: The Lambda context object.
+        margin (float, optional): Seconds to leave for draining queued
+        records and returning. Defaults to 5.0.
+
+    Returns:
+        float: A time.monotonic() deadline.
+    """
+    remaining = context.get_remaining_time_in_millis() / 1000.0
+    return time.monotonic() + remaining - margin
+
+
+class _Stage(threading.Thread):
+    """A pipeline stage thread that reports its error to the pipeline."""
+
+    def __init__(self, name, target, pipeline):
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self._pipeline = pipeline
+
+    def run(self):
+        try:
+            self._target_fn()
+        except BaseException as err:
+            self._pipeline.fail(err)
+
+
+class _Pipeline:
+    """Shared state for one run_pipeline() call."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.stop = threading.Event()
+        self.abort = threading.Event()
+        self.error = None
+        self.stats = {'fetched': 0, 'formatted': 0, 'sent': 0,
+                      'batches': 0, 'stopped_early': False}
+        self._lock = threading.Lock()
+
+    def fail(self, err):
+        with self._lock:
+            if self.error is None:
+                self.error = err
+        self.abort.set()
+        self.stop.set()
+
+    def should_stop(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            if not self.stop.is_set():
+                logging.warning('Deadline reached, draining the pipeline')
+                self.stats['stopped_early'] = True
+                self.stop.set()
+        return self.stop.is_set()
+
+    def put(self, target, item):
+        """Blocks until there is room downstream, unless aborted."""
+        while not self.abort.is_set():
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source, timeout=None):
+        """Blocks for the next item, unless aborted; None on timeout."""
+        waited = 0.0
+        while not self.abort.is_set():
+            wait = _POLL_INTERVAL if timeout is None \
+                else min(_POLL_INTERVAL, max(0.0, timeout - waited))
+            try:
+                return source.get(timeout=wait)
+            except queue.Empty:
+                waited += wait
+                if timeout is not None and waited >= timeout:
+                    return None
+        return _DONE
+
+
+def run_pipeline(source, format_batch, send_batch, batch_size=100,
+                 linger=0.5, queue_size=None, deadline=None):
+    """
+    Runs fetching, formatting and sending concurrently.
+
+    Raw articles are pulled from `source` on one thread, formatted in
+    micro-batches on a second, and sent from the calling thread, with
+    bounded queues between them. A batch is sent as soon as it holds
+    `batch_size` records or its oldest record has waited `linger`
+    seconds. When sending slows down (for example while Kinesis
+    throttles and send_batch retries), the queues fill up and fetching
+    pauses, so no more is fetched than can be published.
+
+    When `deadline` passes, fetching stops and everything already
+    fetched is formatted and sent before returning. If any stage raises,
+    the other stages stop and the error is re-raised.
+
+    Args:
+        source (iterable): Raw articles, typically a lazy generator such
+        as iter_articles().
+        format_batch (callable): Takes a list of raw articles and returns
+        a list of formatted records.
+        send_batch (callable): Takes a list of formatted records and
+        publishes them.
+        batch_size (int, optional): The records per send. Defaults to 100.
+        linger (float, optional): The maximum seconds a record waits for
+        its batch to fill. Defaults to 0.5.
+        queue_size (int, optional): The capacity of each queue.
+        Defaults to twice batch_size.
+        deadline (float, optional): A time.monotonic() time at which to
+        stop fetching, see deadline_from_context(). Defaults to None.
+
+    Returns:
+        dict: The number of articles 'fetched', 'formatted' and 'sent',
+        the 'batches' sent, and whether the run 'stopped_early'.
+
+    Raises:
+        Any exception raised by a stage.
+    """
+    capacity = queue_size or batch_size * 2
+    raw_queue = queue.Queue(maxsize=capacity)
+    formatted_queue = queue.Queue(maxsize=capacity)
+    pipeline = _Pipeline(deadline)
+    stats = pipeline.stats
+
+    def fetch():
+        try:
+            for article in source:
+                if not pipeline.put(raw_queue, article):
+                    return
+                stats['fetched'] += 1
+                if pipeline.should_stop():
+                    break
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+            pipeline.put(raw_queue, _DONE)
+
+    def format_stage():
+        while True:
+            item = pipeline.get(raw_queue)
+            if item is _DONE:
+                break
+            batch = [item]
+            done = False
+            while len(batch) < batch_size:
+                try:
+                    item = raw_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+            for record in format_batch(batch):
+                if not pipeline.put(formatted_queue, record):
+                    return
+            stats['formatted'] += len(batch)
+            if done:
+                break
+        pipeline.put(formatted_queue, _DONE)
+
+    def flush(batch):
+        send_batch(batch)
+        stats['sent'] += len(batch)
+        stats['batches'] += 1
+
+    stages = [_Stage('pipeline-fetch', fetch, pipeline),
+              _Stage('pipeline-format', format_stage, pipeline)]
+    for stage in stages:
+        stage.start()
+
+    try:
+        batch = []
+        first_at = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, linger - (time.monotonic() - first_at))
+            item = pipeline.get(formatted_queue, timeout=timeout)
+            if item is _DONE:
+                break
+            if item is None:
+                flush(batch)
+                batch = []
+                continue
+            if not batch:
+                first_at = time.monotonic()
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch and pipeline.error is None:
+            flush(batch)
+    except BaseException as err:
+        pipeline.fail(err)
+    finally:
+        pipeline.stop.set()
+        for stage in stages:
+            stage.join()
+
+    if pipeline.error is not None:
+        logging.error(f'Pipeline failed: {pipeline.error}')
+        raise pipeline.error
+    logging.info(
+        f"Pipeline sent {stats['sent']} articles in {stats['batches']} "
+        f"batches")
+    return stats
+
+
+def run_query_pipeline(query, broker_id, date_from=None, max_articles=None,
+                       page_size=50, batch_size=100, linger=0.5,
+                       deadline=None, relevance=None, **send_kwargs):
+    """
+    Fetches, formats and sends every article for a query, with each
+    stage running concurrently through run_pipeline().
+
+    Articles are sent one Kinesis record per article with
+    send_batch_to_kinesis(), so pages are fetched while earlier batches
+    are still being published.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        broker_id (str): The name of the Kinesis stream.
+        date_from (str, optional): The earliest publication date,
+        formatted as 'YYYY-MM-DD'. Defaults to None.
+        max_articles (int, optional): The maximum number of articles to
+        send. Defaults to None (all of them).
+        page_size (int, optional): The results per API page.
+        Defaults to 50.
+        batch_size (int, optional): The records per send. Defaults to 100.
+        linger (float, optional): The maximum seconds a record waits for
+        its batch to fill. Defaults to 0.5.
+        deadline (float, optional): A time.monotonic() time at which to
+        stop fetching and drain. Defaults to None.
+        relevance (RelevanceFilter, optional): Drops articles that are
+        not relevant as each batch is formatted. Defaults to None.
+        **send_kwargs: Passed through to send_batch_to_kinesis(), such as
+        partitioner, serializer or aggregate.
+
+    Returns:
+        dict: The pipeline statistics, see run_pipeline().
+    """
+    articles = iter_articles(
+        query, date_from, page_size=page_size, max_articles=max_articles,
+        order_by='newest')
+
+    def format_batch(batch):
+        records = format_articles(batch)
+        if relevance is not None:
+            records = relevance.filter_records(batch, records)
+        return records
+
+    return run_pipeline(
+        articles,
+        format_batch,
+        lambda batch: send_batch_to_kinesis(batch, broker_id, **send_kwargs),
+        batch_size=batch_size, linger=linger, deadline=deadline)
@@ -0,0 +1,156 @@
+"""This module contains the definition for the extract_preview()
+function, which turns article HTML into a plain text preview."""
+
+import re
+from html import unescape
+
+# Matches, at a position: a comment, a (possibly cut off) tag, a run of
+# text, or a stray '<'.
+_TOKEN = re.compile(
+    r'<!--.*?(?:-->|$)'
+    r'|<(/?)([a-zA-Z][\w:-]*)[^>]*(?:>|$)'
+    r'|[^<]+'
+    r'|<', re.S)
+
+# Elements whose content is never visible text, with their end tags.
+_SKIPPED_ELEMENTS = {
+    name: re.compile(r'</' + name, re.I)
+    for name in ('script', 'style', 'noscript', 'template')
+}
+
+# Elements that separate words when rendered.
+_BLOCK_ELEMENTS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl',
+    'dt', 'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'header', 'hr', 'li', 'ol', 'p', 'pre', 'section', 'table', 'td',
+    'th', 'tr', 'ul'
+])
+
+
+def _utf8_len(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+def _cut(text, max_chars, max_bytes):
+    """Cuts text to fit both budgets, never splitting a character."""
+    if max_chars is not None:
+        text = text[:max_chars]
+    if max_bytes is not None and _utf8_len(text) > max_bytes:
+        text = text.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+    return text
+
+
+def _to_word_boundary(text):
+    """Drops a trailing partial word, unless it is the only word."""
+    if text[-1:].isspace():
+        # The cut fell between words, so the last word is complete.
+        return text.rstrip()
+    cut = text.rstrip()
+    space = cut.rfind(' ')
+    return cut[:space].rstrip() if space > 0 else cut
+
+
+def _continues_word(html, pos):
+    """Returns True if the visible text at pos continues the last word."""
+    while pos < len(html):
+        match = _TOKEN.match(html, pos)
+        pos = match.end()
+        if match.group(2):
+            if match.group(2).lower() in _BLOCK_ELEMENTS:
+                return False
+            continue
+        if match.group().startswith('<!--'):
+            continue
+        return not match.group()[:1].isspace()
+    return False
+
+
+def extract_preview(html, max_chars=1000, max_bytes=None,
+                    word_boundary=False):
+    """
+    Extracts the first visible text of an HTML fragment.
+
+    Markup is stripped, entities are decoded and runs of whitespace are
+    collapsed as the fragment is scanned, and scanning stops as soon as
+    the preview is full, so the rest of a long body is never looked at.
+    Block elements such as paragraphs separate words, and the content of
+    script and style elements is skipped. Text with no markup, entities
+    or extra whitespace takes a fast path and is simply cut to length.
+
+    Args:
+        html (str): The article body or other HTML fragment.
+        max_chars (int, optional): The maximum preview length in
+        characters, or None for no limit. Defaults to 1000.
+        max_bytes (int, optional): The maximum preview size in UTF-8
+        bytes, or None for no limit. Defaults to None.
+        word_boundary (bool, optional): Whether to drop a word cut off
+        by the limit. Defaults to False.
+
+    Returns:
+        str: The plain text preview.
+    """
+    if not html:
+        return ''
+
+    if '<' not in html and '&' not in html:
+        preview = _cut(html, max_chars, max_bytes)
+        if preview == ' '.join(preview.split()):
+            if word_boundary and len(preview) < len(html) \
+                    and not html[len(preview)].isspace():
+                preview = _to_word_boundary(preview)
+            return preview
+
+    pieces = []
+    chars = 0
+    size = 0
+    pending_space = False
+    pos = 0
+    end = len(html)
+    while pos < end:
+        match = _TOKEN.match(html, pos)
+        pos = match.end()
+        token = match.group()
+
+        if match.group(2):
+            name = match.group(2).lower()
+            if name in _SKIPPED_ELEMENTS and not match.group(1) \
+                    and not token.endswith('/>'):
+                close = _SKIPPED_ELEMENTS[name].search(html, pos)
+                pos = close.start() if close else end
+            elif name in _BLOCK_ELEMENTS:
+                pending_space = bool(pieces)
+            continue
+        if token.startswith('<!--'):
+            continue
+
+        if token != '<' and '&' in token:
+            token = unescape(token)
+        if token[:1].isspace() and pieces:
+            pending_space = True
+        words = token.split()
+        if not words:
+            continue
+        text = ' '.join(words)
+        if pending_space:
+            text = ' ' + text
+        pending_space = token[-1:].isspace()
+
+        remaining_chars = None if max_chars is None else max_chars - chars
+        remaining_bytes = None if max_bytes is None else max_bytes - size
+        piece = _cut(text, remaining_chars, remaining_bytes)
+        pieces.append(piece)
+        chars += len(piece)
+        size += _utf8_len(piece)
+
+        if len(piece) < len(text):
+            if word_boundary and not text[len(piece)].isspace():
+                return _to_word_boundary(''.join(pieces))
+            break
+        if (max_chars is not None and chars >= max_chars) or \
+                (max_bytes is not None and size >= max_bytes):
+            if word_boundary and not pending_space \
+                    and _continues_word(html, pos):
+                return _to_word_boundary(''.join(pieces))
+            break
+
+    return ''.join(pieces).strip()
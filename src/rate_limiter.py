@@ -0,0 +1,213 @@
+"""This module contains the definition for the RateLimiter class,
+the process-wide token bucket that every Guardian request goes through."""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Guardian developer (free tier) key limits.
+DEFAULT_PER_SECOND = 1
+DEFAULT_PER_DAY = 500
+
+# Cap on the adaptive backoff used when a 429 has no Retry-After header.
+MAX_PENALTY = 60.0
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+    """Raised when the daily request budget has been used up."""
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header into a number of seconds.
+
+    Args:
+        value (str): The header value, either delay seconds or an
+        HTTP date.
+
+    Returns:
+        float: The delay in seconds, or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """
+    A thread-safe and asyncio-safe token bucket with a daily budget.
+
+    Each request reserves a token up front and is told how long to wait
+    for it, so concurrent callers are spaced out at exactly `per_second`
+    rather than racing and being throttled. The lock is only held while
+    reserving, never while waiting, so threads and coroutines can share
+    one limiter. A 429 response pauses every caller, for the server's
+    Retry-After if given, or for an adaptively doubling penalty if not.
+
+    Args:
+        per_second (float, optional): The sustained request rate.
+        Defaults to DEFAULT_PER_SECOND.
+        per_day (int, optional): The requests allowed per UTC day, or
+        None for no daily limit. Defaults to DEFAULT_PER_DAY.
+        burst (int, optional): The bucket size. Defaults to 1, so
+        requests are evenly spaced.
+    """
+
+    def __init__(self, per_second=DEFAULT_PER_SECOND, per_day=DEFAULT_PER_DAY,
+                 burst=1):
+        self.per_second = per_second
+        self.per_day = per_day
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._penalty = 0.0
+        self._day = self._today()
+        self._used_today = 0
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    @property
+    def remaining_today(self):
+        """int: The requests left in today's budget, or None if unlimited."""
+        with self._lock:
+            self._roll_day()
+            if self.per_day is None:
+                return None
+            return max(0, self.per_day - self._used_today)
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._used_today = 0
+
+    def _reserve(self):
+        """Reserves a token and returns how long to wait for it."""
+        with self._lock:
+            self._roll_day()
+            if self.per_day is not None and self._used_today >= self.per_day:
+                raise RateLimitExceeded(
+                    f'Daily budget of {self.per_day} Guardian API requests '
+                    f'has been used!')
+
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.per_second)
+            self._updated = now
+            self._tokens -= 1
+            self._used_today += 1
+
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.per_second  # noqa
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+
+        Raises:
+            RateLimitExceeded: If the daily budget has been used.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Waits, without blocking the event loop, until a request may be
+        sent.
+
+        Raises:
+            RateLimitExceeded: If the daily budget has been used.
+        """
+        import asyncio
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        """
+        Pauses every caller after a 429 response.
+
+        Args:
+            retry_after (float, optional): The server's Retry-After delay
+            in seconds. Without it the pause doubles on each consecutive
+            429, up to MAX_PENALTY.
+
+        Returns:
+            float: The pause applied, in seconds.
+        """
+        with self._lock:
+            if retry_after is None:
+                self._penalty = min(
+                    MAX_PENALTY, max(1.0 / self.per_second, self._penalty * 2))
+                delay = self._penalty
+            else:
+                delay = retry_after
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + delay)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = now
+        logging.warning(f'Guardian API throttled, pausing for {delay:.2f}s')
+        return delay
+
+    def succeeded(self):
+        """Resets the adaptive backoff after a successful request."""
+        with self._lock:
+            self._penalty = 0.0
+
+
+def get_rate_limiter():
+    """
+    Returns the process-wide limiter shared by all Guardian requests.
+
+    The limits are read from the 'Guardian_Rate_Per_Second' and
+    'Guardian_Rate_Per_Day' environment variables when the limiter is
+    first created, defaulting to the free tier limits.
+
+    Returns:
+        RateLimiter: The shared limiter.
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(
+                per_second=float(os.getenv(
+                    'Guardian_Rate_Per_Second', DEFAULT_PER_SECOND)),
+                per_day=int(os.getenv(
+                    'Guardian_Rate_Per_Day', DEFAULT_PER_DAY)))
+        return _default_limiter
+
+
+def set_rate_limiter(limiter):
+    """
+    Replaces the process-wide limiter.
+
+    Args:
+        limiter (RateLimiter): The limiter to share, or None to create a
+        new default on next use.
+    """
+    global _default_limiter
+    with _default_lock:
+        _default_limiter = limiter
@@ -0,0 +1,175 @@
+"""This module contains the record shaping stage, which makes sure every
+record sent to Kinesis fits its 1 MiB record limit before it is put,
+rather than letting the put fail.
+
+Sizes are measured on the encoded payload, in bytes, so long previews
+and non-ASCII text are accounted for exactly. A record that is too
+large has its content_preview shortened on a byte budget, never
+splitting a character, and every trimmed record is reported.
+"""
+
+import logging
+from src.metrics import count
+
+# The Kinesis limit on data plus partition key for one record.
+MAX_RECORD_BYTES = 1024 * 1024
+
+
+def utf8_size(value):
+    """
+    Returns the size of a payload in bytes.
+
+    Args:
+        value (str or bytes): The payload. Strings are measured as UTF-8.
+
+    Returns:
+        int: The size in bytes.
+    """
+    if isinstance(value, str):
+        return len(value) if value.isascii() else len(value.encode('utf-8'))
+    return len(value)
+
+
+def trim_to_bytes(text, max_bytes):
+    """
+    Cuts text to at most `max_bytes` UTF-8 bytes, never splitting a
+    character.
+
+    Args:
+        text (str): The text.
+        max_bytes (int): The byte budget.
+
+    Returns:
+        str: The text, or as much of its start as fits.
+    """
+    max_bytes = max(0, max_bytes)
+    if text.isascii():
+        return text[:max_bytes]
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode('utf-8', 'ignore')
+
+
+def _with_preview(record, preview):
+    """Returns a copy of a record with a different content_preview."""
+    if isinstance(record, dict):
+        return {**record, 'content_preview': preview}
+    return type(record)(record.webPublicationDate, record.webTitle,
+                        record.webUrl, preview)
+
+
+def _report(record, before, after, size):
+    trimmed = {'webUrl': record.get('webUrl'), 'size': size,
+               'preview_bytes': before, 'trimmed_preview_bytes': after}
+    logging.warning(
+        f"Trimmed content_preview of {trimmed['webUrl']} from {before} to "
+        f"{after} bytes to fit a {size} byte record within the limit")
+    count('records_trimmed')
+    return trimmed
+
+
+def shape_record(record, max_bytes, encode):
+    """
+    Encodes a record, shortening its content_preview until it fits.
+
+    The preview is cut in proportion to how far the payload is over
+    `max_bytes`, so even compressed or escaped payloads, whose size does
+    not follow the preview's byte for byte, fit within a few passes.
+
+    Args:
+        record (ArticleRecord or dict): A formatted article.
+        max_bytes (int): The largest payload allowed.
+        encode (callable): Encodes a record into its payload, str or
+        bytes.
+
+    Returns:
+        tuple: The record, trimmed if need be, its payload, and a dict
+        describing the trim, or None if it was not trimmed.
+
+    Raises:
+        ValueError: If the record does not fit even with no preview.
+    """
+    data = encode(record)
+    size = utf8_size(data)
+    if size <= max_bytes:
+        return record, data, None
+
+    original = record.get('content_preview') or ''
+    before = budget = utf8_size(original)
+    original_size = size
+    while budget:
+        budget = max(0, min(budget - 1, budget * max_bytes // size))
+        shaped = _with_preview(record, trim_to_bytes(original, budget))
+        data = encode(shaped)
+        size = utf8_size(data)
+        if size <= max_bytes:
+            return shaped, data, _report(
+                record, before, utf8_size(shaped['content_preview']),
+                original_size)
+    raise ValueError(
+        f'Record of {size} bytes exceeds the Kinesis limit of {max_bytes} '
+        f'bytes even without a content_preview!')
+
+
+def shape_batch(records, max_bytes, encode):
+    """
+    Encodes a list of records as one or more payloads that each fit.
+
+    The whole list is encoded first, and when it fits, as it usually
+    does, that single payload is returned. Otherwise each record is
+    shaped to fit on its own, and the records are packed in order into
+    as few payloads as fit, each checked against `max_bytes` once
+    encoded.
+
+    Args:
+        records (list): Formatted articles.
+        max_bytes (int): The largest payload allowed.
+        encode (callable): Encodes a list of records into a payload,
+        str or bytes.
+
+    Returns:
+        tuple: A list of (records, payload) pairs, in order, and a list
+        describing each trimmed record, see shape_record().
+
+    Raises:
+        ValueError: If a record does not fit even with no preview.
+    """
+    data = encode(records)
+    if utf8_size(data) <= max_bytes:
+        return [(records, data)], []
+
+    overhead = utf8_size(encode([]))
+    shaped = []
+    trimmed = []
+    for record in records:
+        record, payload, trim = shape_record(
+            record, max_bytes, lambda item: encode([item]))
+        shaped.append((record, utf8_size(payload) - overhead))
+        if trim is not None:
+            trimmed.append(trim)
+
+    batches = []
+
+    def pack(chunk):
+        payload = encode(chunk)
+        if utf8_size(payload) <= max_bytes or len(chunk) == 1:
+            batches.append((chunk, payload))
+        else:
+            middle = len(chunk) // 2
+            pack(chunk[:middle])
+            pack(chunk[middle:])
+
+    chunk = []
+    estimate = overhead
+    for record, size in shaped:
+        # Allow for a separator between items, such as ', ' in JSON.
+        if chunk and estimate + size + 2 > max_bytes:
+            pack(chunk)
+            chunk = []
+            estimate = overhead
+        chunk.append(record)
+        estimate += size + 2
+    if chunk:
+        pack(chunk)
+    return batches, trimmed
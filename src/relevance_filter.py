@@ -0,0 +1,210 @@
+"""This module contains the relevance filter run between formatting and
+sending, so articles that only mention a query in passing are dropped
+before they cost broker bytes and consumer time.
+
+Include and exclude terms are compiled into one Aho-Corasick automaton,
+which finds every term in an article's title, trailText and preview in
+a single pass, however many terms there are.
+"""
+
+import logging
+import threading
+from collections import deque
+from src.metrics import count
+
+
+def _normalise(term):
+    return ' '.join(term.lower().split())
+
+
+class TermMatcher:
+    """
+    An Aho-Corasick automaton that finds whole-word, case-insensitive
+    occurrences of a set of terms in one pass over a text.
+
+    Args:
+        terms (iterable): The terms, each a word or phrase.
+    """
+
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(
+            term for term in map(_normalise, terms) if term))
+        # Each state is a dict of transitions; state 0 is the root.
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for index, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto[state][char] = following
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = following
+            self._output[state] += (index,)
+        self._link()
+
+    def _link(self):
+        """Sets the failure links breadth first, merging outputs."""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, following in self._goto[state].items():
+                pending.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                self._output[following] += self._output[
+                    self._fail[following]]
+
+    def find(self, text):
+        """
+        Finds the terms that occur in a text as whole words.
+
+        Args:
+            text (str): The text to search.
+
+        Returns:
+            set: The indexes in `terms` of the terms found.
+        """
+        found = set()
+        if not self.terms or not text:
+            return found
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        terms = self.terms
+        last = len(text) - 1
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            after_ok = position == last or not text[position + 1].isalnum()
+            if not after_ok:
+                continue
+            for index in output[state]:
+                start = position - len(terms[index]) + 1
+                if start == 0 or not text[start - 1].isalnum():
+                    found.add(index)
+        return found
+
+
+def _article_text(article, record):
+    """Joins the title, trailText and preview of an article."""
+    fields = article.get('fields') or {}
+    parts = (record.get('webTitle') or article.get('webTitle'),
+             fields.get('trailText'), record.get('content_preview'))
+    return '\n'.join(part for part in parts if part)
+
+
+class RelevanceFilter:
+    """
+    Keeps articles that mention enough of the include terms and none of
+    the exclude terms.
+
+    An article's score is the sum of the weights of the distinct include
+    terms found in its title, trailText and preview. It is kept if the
+    score reaches `min_score` and no exclude term is found. With no
+    include terms, only the exclude terms apply. Terms match whole words
+    and phrases, ignoring case.
+
+    The filter is thread-safe and keeps running totals of the articles
+    it has kept and dropped.
+
+    Args:
+        include (iterable or dict, optional): The terms that make an
+        article relevant, or a dict of terms and their weights. Each term
+        weighs 1 if given as a list. Defaults to None.
+        exclude (iterable, optional): The terms that make an article
+        irrelevant whatever its score. Defaults to None.
+        min_score (float, optional): The score an article needs.
+        Defaults to 1.
+    """
+
+    def __init__(self, include=None, exclude=None, min_score=1):
+        include = include or {}
+        if not isinstance(include, dict):
+            include = {term: 1 for term in include}
+        include = {_normalise(term): weight
+                   for term, weight in include.items()}
+        exclude = [_normalise(term) for term in exclude or ()]
+        self.min_score = min_score
+        self._matcher = TermMatcher(list(include) + exclude)
+        terms = self._matcher.terms
+        self._weights = [include.get(term, 0) for term in terms]
+        self._excluded = {index for index, term in enumerate(terms)
+                          if term in exclude}
+        self._has_include = bool(include)
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.dropped = 0
+
+    def score(self, text):
+        """
+        Scores a text.
+
+        Args:
+            text (str): The text to score.
+
+        Returns:
+            float: The score, or None if an exclude term was found.
+        """
+        found = self._matcher.find(text)
+        if found & self._excluded:
+            return None
+        return sum(self._weights[index] for index in found)
+
+    def is_relevant(self, article, record):
+        """
+        Decides whether to keep one article.
+
+        Args:
+            article (dict): The raw Guardian article.
+            record (ArticleRecord): The article as formatted.
+
+        Returns:
+            bool: True if the article should be sent.
+        """
+        score = self.score(_article_text(article, record))
+        if score is None:
+            return False
+        return not self._has_include or score >= self.min_score
+
+    def apply(self, articles, records):
+        """
+        Filters formatted articles.
+
+        Args:
+            articles (list): The raw Guardian articles.
+            records (list): The same articles as formatted, in order.
+
+        Returns:
+            tuple: The kept raw articles and the kept records, in order.
+        """
+        kept_articles = []
+        kept_records = []
+        for article, record in zip(articles, records):
+            if self.is_relevant(article, record):
+                kept_articles.append(article)
+                kept_records.append(record)
+        dropped = len(records) - len(kept_records)
+        with self._lock:
+            self.kept += len(kept_records)
+            self.dropped += dropped
+        count('articles_dropped', dropped)
+        if dropped:
+            logging.info(
+                f'Relevance filter dropped {dropped} of {len(records)} '
+                f'articles')
+        return kept_articles, kept_records
+
+    def filter_records(self, articles, records):
+        """Returns only the kept records, see apply()."""
+        return self.apply(articles, records)[1]
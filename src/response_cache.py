@@ -0,0 +1,200 @@
+"""This module contains the definition for the ResponseCache class,
+a two tier (memory and SQLite) cache for Guardian API responses."""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# /tmp is the only writable path in Lambda and survives warm invocations.
+DEFAULT_CACHE_PATH = os.path.join(
+    tempfile.gettempdir(), 'guardian_response_cache.sqlite3')
+
+# Parameters that do not change the response and must never be stored.
+IGNORED_PARAMS = frozenset(['api-key'])
+
+
+def make_key(params):
+    """
+    Builds a cache key from Guardian request parameters.
+
+    The key ignores the API key, the search query's spacing and the
+    order of 'show-fields', so equivalent requests share a cache entry.
+    The query's case is kept, as Guardian boolean operators such as AND
+    are case-sensitive.
+
+    Args:
+        params (dict): The request parameters.
+
+    Returns:
+        str: The normalised cache key.
+    """
+    normalised = {}
+    for name, value in params.items():
+        if name in IGNORED_PARAMS or value is None:
+            continue
+        if name == 'q':
+            value = ' '.join(str(value).split())
+        elif name == 'show-fields':
+            value = ','.join(sorted(
+                field.strip() for field in str(value).split(',')
+                if field.strip()))
+        normalised[name] = str(value)
+    return json.dumps(normalised, sort_keys=True, separators=(',', ':'))
+
+
+class ResponseCache:
+    """
+    Caches Guardian API responses in memory and on disk.
+
+    Lookups check an in-memory LRU first and then a SQLite database,
+    promoting disk hits into memory. Entries expire after `ttl` seconds.
+    The memory tier holds at most `max_memory_entries` responses and the
+    disk tier at most `max_disk_bytes` of JSON, evicting the least
+    recently used entries first.
+
+    Args:
+        path (str, optional): The SQLite database file, or None for a
+        memory-only cache. Defaults to DEFAULT_CACHE_PATH under /tmp.
+        ttl (float, optional): Seconds before an entry expires.
+        Defaults to 3600.
+        max_memory_entries (int, optional): The size of the memory tier.
+        Defaults to 128.
+        max_disk_bytes (int, optional): The size of the disk tier.
+        Defaults to 50 MB.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=3600,
+                 max_memory_entries=128, max_disk_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'size INTEGER NOT NULL, expires_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL)')
+            self._db.commit()
+
+    @property
+    def stats(self):
+        """dict: The hit and miss counters for each tier."""
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
+
+    def get(self, params):
+        """
+        Looks up the cached response for a request.
+
+        Args:
+            params (dict): The request parameters.
+
+        Returns:
+            dict: The cached JSON response, or None on a miss.
+        """
+        key = make_key(params)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM responses WHERE key = ?',
+                    (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute(
+                        'UPDATE responses SET accessed_at = ? WHERE key = ?',
+                        (now, key))
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, params, value):
+        """
+        Stores a response for a request in both tiers.
+
+        Args:
+            params (dict): The request parameters.
+            value (dict): The JSON response to cache.
+        """
+        key = make_key(params)
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is None:
+                return
+            serialized = json.dumps(value, separators=(',', ':'))
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, value, size, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, serialized, len(serialized), expires_at, now))
+            self._evict_disk(now)
+            self._db.commit()
+
+    def clear(self):
+        """Removes every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM responses')
+                self._db.commit()
+
+    def close(self):
+        """Closes the SQLite connection."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = self._db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        logging.info(f'Evicted {len(evicted)} cached responses from disk')
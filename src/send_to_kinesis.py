@@ -1,15 +1,133 @@
-"""This module contains the definition for the
-send_to_kinesis() function."""
+"""This module contains the definitions for the
+send_to_kinesis(), send_batch_to_kinesis() and replay_spool() functions.
+
+boto3 and botocore are imported on first use rather than at import
+time, to keep Lambda cold starts short.
+"""
 
 import logging
-import boto3
+import threading
+from itertools import groupby
 import json
-from botocore.exceptions import BotoCoreError, ClientError
+import random
+import time
+from src.aggregation import aggregate_entries
+from src.metrics import count, timer
+from src.partitioning import MAX_PARTITION_KEY_LENGTH, by_article, fixed, \
+    list_open_shards
+from src.record_shaping import MAX_RECORD_BYTES, shape_batch, shape_record, \
+    utf8_size
+from src.serializers import encode_json, encode_payload
+
+# PutRecords request limits, see the Kinesis Data Streams quotas.
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+
+RETRYABLE_ERROR_CODES = frozenset([
+    'ProvisionedThroughputExceededException',
+    'InternalFailure'
+])
+
+# The error codes of failures that may succeed later, so the records
+# are spooled rather than the error raised. Any other error, such as a
+# missing stream or denied access, is raised even with a spool.
+TRANSIENT_ERROR_CODES = RETRYABLE_ERROR_CODES | frozenset([
+    'ThrottlingException',
+    'LimitExceededException',
+    'KMSThrottlingException',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'InternalServerError',
+    'RequestTimeout',
+    'RequestTimeoutException'
+])
+
+
+_kinesis_client = None
+_client_lock = threading.Lock()
+
 
-logging.basicConfig(level=logging.INFO)
+def get_kinesis_client():
+    """
+    Returns the shared boto3 Kinesis client.
+
+    The client is created on first use and kept at module level, so
+    later calls and warm Lambda invocations reuse it and its pooled
+    connections instead of paying for a new client every time. boto3
+    clients are thread-safe, so one client serves every thread.
+
+    Returns:
+        The shared Kinesis client.
+    """
+    global _kinesis_client
+    if _kinesis_client is None:
+        with _client_lock:
+            if _kinesis_client is None:
+                import boto3
+                _kinesis_client = boto3.client('kinesis')
+    return _kinesis_client
 
 
-def send_to_kinesis(data, broker_id):
+def close_kinesis_client():
+    """
+    Closes the shared Kinesis client and its connections, if created.
+    """
+    global _kinesis_client
+    with _client_lock:
+        if _kinesis_client is not None:
+            _kinesis_client.close()
+            _kinesis_client = None
+
+
+class KinesisPutRecordsError(Exception):
+    """
+    Raised when some records could not be written by PutRecords.
+
+    Attributes:
+        failed_entries (list): The PutRecords entries that were not
+        written, each a dict with 'Data' and 'PartitionKey' keys.
+        error_codes (list): The last error code reported for each
+        failed entry, in the same order.
+    """
+
+    def __init__(self, failed_entries, error_codes):
+        self.failed_entries = failed_entries
+        self.error_codes = error_codes
+        super().__init__(
+            f'{len(failed_entries)} record(s) failed to send to Kinesis: '
+            f'{sorted(set(error_codes))}')
+
+
+def is_transient_error(err):
+    """
+    Decides whether a Kinesis failure may succeed if tried again later.
+
+    Throttling, 5xx responses and connection or endpoint errors are
+    transient. Errors that no retry will fix, such as a missing stream,
+    denied access, invalid parameters or missing credentials, are not.
+
+    Args:
+        err (Exception): A BotoCoreError, ClientError or
+        KinesisPutRecordsError.
+
+    Returns:
+        bool: True if the error is transient.
+    """
+    from botocore.exceptions import ClientError, HTTPClientError, \
+        ConnectionError as BotoConnectionError
+
+    if isinstance(err, KinesisPutRecordsError):
+        return all(code in TRANSIENT_ERROR_CODES for code in err.error_codes)
+    if isinstance(err, ClientError):
+        status = err.response.get('ResponseMetadata', {}).get(
+            'HTTPStatusCode') or 0
+        return err.response.get('Error', {}).get('Code') in \
+            TRANSIENT_ERROR_CODES or status >= 500
+    return isinstance(err, (BotoConnectionError, HTTPClientError))
+
+
+def send_to_kinesis(data, broker_id, partition_key='guardian_content',
+                    serializer='json', compression=None, spool=None):
     """
         Sends a list of articles to an Amazon Kinesis stream
         as a single record.
@@ -18,43 +136,433 @@ def send_to_kinesis(data, broker_id):
     articles and sends the entire list as a single record
     to the specified Kinesis stream.
     The list of articles is serialized into JSON format
-    and sent with a partition key of 'article_data'.
+    and sent with a fixed partition key, or one chosen by a partitioning
+    strategy so that records spread across the stream's shards.
+    If the list does not fit the 1 MiB record limit, it is split over
+    as few records as fit, and any article too large on its own has its
+    content_preview shortened, see src.record_shaping.
 
     Args:
-        data (list): A list of dictionaries, where each dictionary contains
-        the following keys:
+        data (list): A list of dictionaries (or ArticleRecords), where each
+        contains the following keys:
             - 'webPublicationDate' (str): The publication date of the article.
             - 'webTitle' (str): The title of the article.
             - 'webUrl' (str): The URL of the article.
         broker_id (str): The name of the Kinesis stream to which the records
         will be sent.
+        partition_key (str or callable, optional): The partition key for
+        the record, or a partitioning strategy from src.partitioning,
+        such as by_query(query), called with the first article of each
+        record. Defaults to 'guardian_content'.
+        serializer (str, optional): The payload format, 'json', 'orjson'
+        or 'msgpack', see src.serializers. Defaults to 'json'.
+        compression (str, optional): The payload compression, None,
+        'gzip' or 'zstd'. Defaults to None.
+        spool (Spool, optional): Where to keep the record if it cannot
+        be sent because of a transient error, see is_transient_error(),
+        so replay_spool() can send it later. Defaults to None.
+
+    Returns:
+        dict: The number of Kinesis 'records' sent and 'spooled'. None
+        if there was no data.
+
     Raises:
         BotoCoreError: If there is an issue with the Kinesis client
-        (e.g., AWS credentials or connection issues).
+        (e.g., AWS credentials or connection issues), unless the error
+        was transient and the record was spooled.
         ClientError: If Kinesis returns an error related to the stream
-        or request parameters.
+        or request parameters, unless the error was transient and the
+        record was spooled.
         JSONDecodeError: If there is an error in encoding the article
         data into JSON format.
+        ValueError: If an article does not fit the record limit even
+        without its content_preview.
     """
     if not data:
         logging.info("No data send to Kinesis")
         return
 
-    kinesis = boto3.client('kinesis')
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    kinesis = get_kinesis_client()
+
+    def encode(batch):
+        if serializer == 'json' and compression is None:
+            return encode_json(batch)
+        return encode_payload(batch, serializer, compression)
 
+    if callable(partition_key):
+        partitioner = partition_key
+        key_bytes = MAX_PARTITION_KEY_LENGTH
+    else:
+        partitioner = fixed(partition_key)
+        key_bytes = utf8_size(partition_key)
+
+    batches = []
+    sent = 0
     try:
 
-        serialized_data = json.dumps(data)
+        with timer('serialize'):
+            batches, _ = shape_batch(
+                data, MAX_RECORD_BYTES - key_bytes, encode)
+        count('payload_bytes',
+              sum(utf8_size(payload) for _, payload in batches))
+        if len(batches) > 1:
+            logging.info(
+                f"Data split into {len(batches)} records to fit the "
+                f"Kinesis record limit")
 
-        kinesis.put_record(
-            StreamName=broker_id,
-            Data=serialized_data,
-            PartitionKey='guardian_content'
-        )
+        for records, serialized_data in batches:
+            with timer('kinesis_put'):
+                kinesis.put_record(
+                    StreamName=broker_id,
+                    Data=serialized_data,
+                    **partitioner(records[0])
+                )
+            count('kinesis_records')
+            sent += 1
         logging.info("Data successfully sent to Kinesis!")
     except (BotoCoreError, ClientError) as boto_err:
         logging.error(f"Error sending data to Kinesis: {boto_err}")
-        raise
+        if spool is None or not is_transient_error(boto_err):
+            raise
+        for records, serialized_data in batches[sent:]:
+            entry = partitioner(records[0])
+            spool.append(broker_id, entry['PartitionKey'], serialized_data,
+                         explicit_hash_key=entry.get('ExplicitHashKey'))
+        spool.flush()
+        logging.warning("Record spooled to be replayed on the next run")
     except json.JSONDecodeError as json_err:
         logging.error(f"Error with JSON encoding: {json_err}")
         raise
+    return {'records': sent, 'spooled': len(batches) - sent}
+
+
+def _entry_size(entry):
+    """Returns the size that a PutRecords entry counts against limits."""
+    return len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+
+
+def chunk_entries(entries, max_records=MAX_RECORDS_PER_REQUEST,
+                  max_bytes=MAX_BYTES_PER_REQUEST):
+    """
+    Splits PutRecords entries into request-sized chunks.
+
+    Args:
+        entries (list): PutRecords entries with 'Data' (bytes) and
+        'PartitionKey' (str) keys.
+        max_records (int, optional): The maximum records per chunk.
+        Defaults to MAX_RECORDS_PER_REQUEST.
+        max_bytes (int, optional): The maximum total size per chunk.
+        Defaults to MAX_BYTES_PER_REQUEST.
+
+    Yields:
+        list: Consecutive entries that fit in a single request.
+
+    Raises:
+        ValueError: If a single entry exceeds MAX_RECORD_BYTES.
+    """
+    chunk = []
+    chunk_bytes = 0
+    for entry in entries:
+        size = _entry_size(entry)
+        if size > MAX_RECORD_BYTES:
+            raise ValueError(
+                f'Record of {size} bytes exceeds the Kinesis limit '
+                f'of {MAX_RECORD_BYTES} bytes!')
+        if chunk and (len(chunk) >= max_records
+                      or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(entry)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def _backoff_delay(attempt, base_delay, max_delay):
+    """Returns a full-jitter exponential backoff delay in seconds."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))  # nosec B311 # noqa
+
+
+def put_records_with_retry(client, broker_id, entries, max_retries=5,
+                           base_delay=0.1, max_delay=5.0):
+    """
+    Sends one chunk of entries with PutRecords, retrying only the
+    entries that failed.
+
+    PutRecords is not atomic: a successful call can still report
+    per-record failures, typically ProvisionedThroughputExceededException
+    when a shard is throttled. Those entries are resent on their own
+    after a jittered exponential backoff, so records that were accepted
+    are never duplicated by the retry.
+
+    Args:
+        client: A boto3 Kinesis client.
+        broker_id (str): The name of the Kinesis stream.
+        entries (list): The entries to send, at most one request's worth.
+        max_retries (int, optional): The maximum number of retries for
+        failed entries. Defaults to 5.
+        base_delay (float, optional): The initial backoff in seconds.
+        Defaults to 0.1.
+        max_delay (float, optional): The backoff cap in seconds.
+        Defaults to 5.0.
+
+    Returns:
+        int: The number of retry rounds that were needed.
+
+    Raises:
+        KinesisPutRecordsError: If any entries still fail after
+        max_retries, or fail with a non-retryable error code.
+    """
+    pending = entries
+    failed = []
+    error_codes = []
+    attempt = 0
+    while True:
+        with timer('kinesis_put'):
+            response = client.put_records(
+                StreamName=broker_id, Records=pending)
+        count('kinesis_records', len(pending) - (
+            response.get('FailedRecordCount') or 0))
+        if not response.get('FailedRecordCount'):
+            break
+
+        retry = []
+        retry_codes = []
+        for entry, result in zip(pending, response['Records']):
+            code = result.get('ErrorCode')
+            if not code:
+                continue
+            if code in RETRYABLE_ERROR_CODES:
+                retry.append(entry)
+                retry_codes.append(code)
+            else:
+                failed.append(entry)
+                error_codes.append(code)
+
+        count('kinesis_throttles', len(retry))
+        if not retry:
+            break
+        if attempt >= max_retries:
+            failed.extend(retry)
+            error_codes.extend(retry_codes)
+            break
+
+        logging.warning(
+            f'{len(retry)} record(s) throttled by Kinesis, retrying '
+            f'(attempt {attempt + 1} of {max_retries})')
+        count('kinesis_retries')
+        with timer('kinesis_backoff'):
+            time.sleep(_backoff_delay(attempt, base_delay, max_delay))
+        pending = retry
+        attempt += 1
+
+    if failed:
+        raise KinesisPutRecordsError(failed, error_codes)
+    return attempt
+
+
+def send_batch_to_kinesis(data, broker_id, client=None, partitioner=None,
+                          serializer='json', compression=None,
+                          aggregate=False, shard_ranges=None, max_retries=5,
+                          base_delay=0.1, max_delay=5.0, spool=None):
+    """
+    Sends a list of articles to an Amazon Kinesis stream, one record
+    per article, using PutRecords.
+
+    Articles are serialized individually and grouped into requests of
+    at most 500 records and 5 MB. An article too large for the 1 MiB
+    record limit has its content_preview shortened to fit, see
+    src.record_shaping. Entries that fail within a request are retried
+    on their own with jittered exponential backoff.
+
+    Args:
+        data (list): A list of article dictionaries, as produced by
+        format_article(), or ArticleRecords from format_articles().
+        broker_id (str): The name of the Kinesis stream to which the records
+        will be sent.
+        client (optional): The boto3 Kinesis client to use. Defaults to
+        the shared client from get_kinesis_client().
+        partitioner (callable or str, optional): The partitioning
+        strategy from src.partitioning, taking an article and returning
+        its 'PartitionKey' (and optionally 'ExplicitHashKey'), or a
+        fixed partition key string. Defaults to by_article, which
+        spreads articles over every shard.
+        serializer (str, optional): The payload format, 'json', 'orjson'
+        or 'msgpack', see src.serializers. Defaults to 'json'.
+        compression (str, optional): The payload compression, None,
+        'gzip' or 'zstd'. Defaults to None.
+        aggregate (bool, optional): Pack many articles into each Kinesis
+        record in the KPL aggregated record format, see
+        src.aggregation. Defaults to False.
+        shard_ranges (list, optional): (starting, ending) hash keys of
+        the open shards, used to aggregate records per shard. Fetched
+        with list_shards when aggregating without them. Defaults to None.
+        max_retries (int, optional): The maximum retries per request for
+        failed entries. Defaults to 5.
+        base_delay (float, optional): The initial backoff in seconds.
+        Defaults to 0.1.
+        max_delay (float, optional): The backoff cap in seconds.
+        Defaults to 5.0.
+        spool (Spool, optional): Where to keep records that cannot be
+        sent because of a transient error, see is_transient_error(), so
+        replay_spool() can send them later. Defaults to None.
+
+    Returns:
+        dict: A summary with the number of articles sent as
+        'user_records', Kinesis 'records' sent, 'requests' made,
+        'retries' needed, records 'spooled' and articles 'trimmed' to
+        fit. None if there was no data.
+
+    Raises:
+        ValueError: If an article does not fit the record limit even
+        without its content_preview.
+        KinesisPutRecordsError: If records still fail after retrying,
+        unless every failure was transient and they were spooled.
+        BotoCoreError: If there is an issue with the Kinesis client,
+        unless it was transient and the records were spooled.
+        ClientError: If Kinesis rejects the whole request, unless the
+        error was transient and the records were spooled.
+        TypeError: If an article cannot be serialized.
+        ValueError: If the serializer or compression is not recognised.
+    """
+    if not data:
+        logging.info("No data send to Kinesis")
+        return
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    kinesis = client or get_kinesis_client()
+
+    if partitioner is None:
+        partitioner = by_article
+    elif isinstance(partitioner, str):
+        partitioner = fixed(partitioner)
+
+    def encode(article):
+        return encode_payload(article, serializer, compression)
+
+    entries = []
+    trimmed = 0
+    payload_bytes = 0
+    with timer('serialize'):
+        for article in data:
+            entry = partitioner(article)
+            max_bytes = MAX_RECORD_BYTES - utf8_size(entry['PartitionKey'])
+            _, entry['Data'], trim = shape_record(article, max_bytes, encode)
+            trimmed += trim is not None
+            payload_bytes += len(entry['Data'])
+            entries.append(entry)
+    count('payload_bytes', payload_bytes)
+
+    summary = {'user_records': len(entries), 'records': 0, 'requests': 0,
+               'retries': 0, 'spooled': 0, 'trimmed': trimmed}
+    chunks = []
+    sent = 0
+    try:
+        if aggregate:
+            if shard_ranges is None:
+                shard_ranges = [
+                    (shard['HashKeyRange']['StartingHashKey'],
+                     shard['HashKeyRange']['EndingHashKey'])
+                    for shard in list_open_shards(kinesis, broker_id)]
+            entries = aggregate_entries(entries, shard_ranges)
+
+        chunks = list(chunk_entries(entries))
+        for chunk in chunks:
+            summary['retries'] += put_records_with_retry(
+                kinesis, broker_id, chunk, max_retries=max_retries,
+                base_delay=base_delay, max_delay=max_delay)
+            summary['records'] += len(chunk)
+            summary['requests'] += 1
+            sent += 1
+    except KinesisPutRecordsError as put_err:
+        logging.error(f"Error sending data to Kinesis: {put_err}")
+        if spool is None or not is_transient_error(put_err):
+            raise
+        unsent = put_err.failed_entries + [
+            entry for chunk in chunks[sent + 1:] for entry in chunk]
+        summary['records'] += len(chunks[sent]) - len(put_err.failed_entries)
+        summary['spooled'] = _spool_entries(spool, broker_id, unsent)
+    except (BotoCoreError, ClientError) as boto_err:
+        logging.error(f"Error sending data to Kinesis: {boto_err}")
+        if spool is None or not is_transient_error(boto_err):
+            raise
+        unsent = [entry for chunk in chunks[sent:] for entry in chunk] \
+            if chunks else entries
+        summary['spooled'] = _spool_entries(spool, broker_id, unsent)
+
+    if summary['spooled']:
+        return summary
+    logging.info(
+        f"{summary['user_records']} articles successfully sent to Kinesis "
+        f"in {summary['records']} records!")
+    return summary
+
+
+def _spool_entries(spool, broker_id, entries):
+    """Keeps unsent PutRecords entries in the spool for replay."""
+    spool.extend(broker_id, entries)
+    logging.warning(
+        f"{len(entries)} record(s) spooled to be replayed on the next run")
+    return len(entries)
+
+
+def replay_spool(spool, client=None, max_retries=5, base_delay=0.1,
+                 max_delay=5.0):
+    """
+    Sends the records held in a spool, oldest first.
+
+    Call this before fetching anything new, so that while the stream is
+    unavailable a run fails here rather than spending Guardian API calls
+    on articles that cannot be sent. Records are sent with PutRecords in
+    the order they were spooled, and each segment is removed from the
+    spool once it has been sent. If sending fails part way through, a
+    request that was partly written may be sent again on the next
+    replay, so delivery is at least once.
+
+    Args:
+        spool (Spool): The spool to replay.
+        client (optional): The boto3 Kinesis client to use. Defaults to
+        the shared client from get_kinesis_client(), created only if the
+        spool holds records.
+        max_retries (int, optional): The maximum retries per request for
+        failed entries. Defaults to 5.
+        base_delay (float, optional): The initial backoff in seconds.
+        Defaults to 0.1.
+        max_delay (float, optional): The backoff cap in seconds.
+        Defaults to 5.0.
+
+    Returns:
+        dict: The number of records 'replayed' and 'expired'.
+
+    Raises:
+        KinesisPutRecordsError: If records still fail after retrying.
+        BotoCoreError: If there is an issue with the Kinesis client.
+        ClientError: If Kinesis rejects the whole request.
+    """
+    def publish(records):
+        kinesis = client or get_kinesis_client()
+        for broker_id, group in groupby(
+                records, key=lambda record: record.broker_id):
+            entries = []
+            for record in group:
+                entry = {'PartitionKey': record.partition_key,
+                         'Data': record.data}
+                if record.explicit_hash_key:
+                    entry['ExplicitHashKey'] = record.explicit_hash_key
+                entries.append(entry)
+            for chunk in chunk_entries(entries):
+                put_records_with_retry(
+                    kinesis, broker_id, chunk, max_retries=max_retries,
+                    base_delay=base_delay, max_delay=max_delay)
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        return spool.replay(publish, batch_size=MAX_RECORDS_PER_REQUEST)
+    except (KinesisPutRecordsError, BotoCoreError, ClientError) as err:
+        logging.error(f"Error replaying spooled records to Kinesis: {err}")
+        raise
@@ -0,0 +1,261 @@
+"""This module contains the serializers and compression codecs used to
+encode Kinesis record payloads, and the decode_payload() helper that
+consumers use to read them back."""
+
+import gzip
+import importlib
+import json
+from src.format_article import ArticleRecord, records_to_json_bytes
+
+# Framed payloads start with this marker. 0xF5 never appears in UTF-8
+# text, so a framed payload cannot be mistaken for plain JSON.
+MAGIC = b'\xf5G'
+HEADER_LENGTH = len(MAGIC) + 2
+
+
+def record_to_dict(obj):
+    """Serializer hook that converts ArticleRecords to dicts."""
+    if isinstance(obj, ArticleRecord):
+        return obj.to_dict()
+    raise TypeError(
+        f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _is_record_list(obj):
+    return isinstance(obj, list) and all(
+        isinstance(item, ArticleRecord) for item in obj)
+
+
+def encode_json(data):
+    """
+    Encodes articles as plain JSON, without a format header.
+
+    A list of ArticleRecords is written straight to bytes from their
+    fields, see records_to_json_bytes(), without a dict per record.
+
+    Args:
+        data: The articles, usually a list of ArticleRecords or dicts.
+
+    Returns:
+        bytes or str: The JSON, as bytes for a list of ArticleRecords.
+    """
+    if _is_record_list(data):
+        return records_to_json_bytes(data)
+    return json.dumps(data, default=record_to_dict)
+
+
+def _import_optional(module, package):
+    """Imports an optional dependency, explaining how to install it."""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(
+            f'The {package!r} package is required for this format. '
+            f'Install it with "pip install {package}".') from None
+
+
+class JsonSerializer:
+    """Serializes with the standard library json module."""
+
+    name = 'json'
+    format_id = 1
+
+    def dumps(self, obj):
+        if isinstance(obj, ArticleRecord):
+            return obj.to_json_bytes()
+        if _is_record_list(obj):
+            return records_to_json_bytes(obj)
+        return json.dumps(obj, default=record_to_dict).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """
+    Serializes with orjson, several times faster than json.
+
+    The output is standard JSON, so it can be read without orjson.
+    """
+
+    name = 'orjson'
+    format_id = 2
+
+    def dumps(self, obj):
+        orjson = _import_optional('orjson', 'orjson')
+        return orjson.dumps(obj, default=record_to_dict)
+
+    def loads(self, data):
+        try:
+            orjson = importlib.import_module('orjson')
+        except ImportError:
+            return json.loads(data)
+        return orjson.loads(data)
+
+
+class MsgpackSerializer:
+    """Serializes with MessagePack, a compact binary format."""
+
+    name = 'msgpack'
+    format_id = 3
+
+    def dumps(self, obj):
+        msgpack = _import_optional('msgpack', 'msgpack')
+        return msgpack.packb(obj, default=record_to_dict)
+
+    def loads(self, data):
+        msgpack = _import_optional('msgpack', 'msgpack')
+        return msgpack.unpackb(data)
+
+
+class GzipCodec:
+    """Compresses with gzip from the standard library."""
+
+    name = 'gzip'
+    codec_id = 1
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=6, mtime=0)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+
+class ZstdCodec:
+    """Compresses with Zstandard, faster than gzip at similar ratios."""
+
+    name = 'zstd'
+    codec_id = 2
+
+    def compress(self, data):
+        zstandard = _import_optional('zstandard', 'zstandard')
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    def decompress(self, data):
+        zstandard = _import_optional('zstandard', 'zstandard')
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+SERIALIZERS = {
+    serializer.name: serializer
+    for serializer in (JsonSerializer(), OrjsonSerializer(),
+                       MsgpackSerializer())
+}
+
+CODECS = {codec.name: codec for codec in (GzipCodec(), ZstdCodec())}
+
+_SERIALIZERS_BY_ID = {
+    serializer.format_id: serializer for serializer in SERIALIZERS.values()}
+_CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+
+def get_serializer(name):
+    """
+    Looks up a serializer by name.
+
+    Args:
+        name (str): 'json', 'orjson' or 'msgpack'.
+
+    Returns:
+        The serializer, with dumps() and loads() methods.
+
+    Raises:
+        ValueError: If the name is not recognised.
+    """
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(
+            f'Unknown serializer {name!r}, expected one of '
+            f'{sorted(SERIALIZERS)}') from None
+
+
+def get_codec(name):
+    """
+    Looks up a compression codec by name.
+
+    Args:
+        name (str): 'gzip' or 'zstd'.
+
+    Returns:
+        The codec, with compress() and decompress() methods.
+
+    Raises:
+        ValueError: If the name is not recognised.
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f'Unknown compression {name!r}, expected one of '
+            f'{sorted(CODECS)}') from None
+
+
+def encode_payload(obj, serializer='json', compression=None):
+    """
+    Encodes an object as a Kinesis record payload.
+
+    Plain JSON is written as it always has been, so existing consumers
+    keep working. Any other serializer, or any compression, is written
+    behind a four byte header (MAGIC, format id, codec id) so that
+    decode_payload() can tell how to read it.
+
+    Args:
+        obj: The article, list of articles or other JSON-like object.
+        serializer (str, optional): 'json', 'orjson' or 'msgpack'.
+        Defaults to 'json'.
+        compression (str, optional): None, 'gzip' or 'zstd'.
+        Defaults to None.
+
+    Returns:
+        bytes: The payload.
+
+    Raises:
+        ValueError: If the serializer or compression is not recognised.
+        ImportError: If the optional package it needs is not installed.
+        TypeError: If the object cannot be serialized.
+    """
+    chosen = get_serializer(serializer)
+    codec = get_codec(compression) if compression else None
+    data = chosen.dumps(obj)
+    if chosen.name == 'json' and codec is None:
+        return data
+    if codec is not None:
+        data = codec.compress(data)
+    header = MAGIC + bytes(
+        [chosen.format_id, codec.codec_id if codec else 0])
+    return header + data
+
+
+def decode_payload(data):
+    """
+    Decodes a payload written by encode_payload() in any format.
+
+    Args:
+        data (bytes or str): The Kinesis record data.
+
+    Returns:
+        The decoded article, list of articles or other object.
+
+    Raises:
+        ValueError: If the header names an unknown format or codec, or
+        the payload is not valid.
+        ImportError: If the optional package it needs is not installed.
+    """
+    if isinstance(data, str) or not data.startswith(MAGIC):
+        return json.loads(data)
+    if len(data) < HEADER_LENGTH:
+        raise ValueError('Payload header is truncated!')
+
+    format_id = data[len(MAGIC)]
+    codec_id = data[len(MAGIC) + 1]
+    serializer = _SERIALIZERS_BY_ID.get(format_id)
+    if serializer is None:
+        raise ValueError(f'Unknown payload format id {format_id}!')
+    body = data[HEADER_LENGTH:]
+    if codec_id:
+        codec = _CODECS_BY_ID.get(codec_id)
+        if codec is None:
+            raise ValueError(f'Unknown payload codec id {codec_id}!')
+        body = codec.decompress(body)
+    return serializer.loads(body)
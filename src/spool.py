@@ -0,0 +1,279 @@
+"""This module contains the definition of the Spool class, a durable
+on-disk queue for Kinesis records that could not be sent, so they can
+be replayed on the next run instead of being fetched again."""
+
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'guardian_spool')
+
+# The spec allows records to be delivered up to three days late.
+MAX_AGE = 3 * 24 * 60 * 60
+
+SEGMENT_SUFFIX = '.seg'
+
+# Each frame is its length and CRC-32, then the creation time, the
+# lengths of the stream name, partition key and explicit hash key, and
+# those three strings followed by the record data.
+_FRAME = struct.Struct('>II')
+_META = struct.Struct('>dHHH')
+
+SpooledRecord = namedtuple(
+    'SpooledRecord',
+    ['broker_id', 'partition_key', 'data', 'explicit_hash_key', 'created'])
+
+
+def _encode_frame(record):
+    stream = record.broker_id.encode('utf-8')
+    partition_key = record.partition_key.encode('utf-8')
+    explicit_hash_key = (record.explicit_hash_key or '').encode('utf-8')
+    data = record.data
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tail = _META.pack(record.created, len(stream), len(partition_key),
+                      len(explicit_hash_key)) + \
+        stream + partition_key + explicit_hash_key + bytes(data)
+    return _FRAME.pack(len(tail), zlib.crc32(tail)) + tail
+
+
+def _read_segment(path):
+    """
+    Reads the records in a segment file, in order.
+
+    A frame that is cut short or fails its checksum, as left by a crash
+    part way through a write, ends the segment.
+    """
+    with open(path, 'rb') as segment:
+        data = segment.read()
+
+    records = []
+    pos = 0
+    while pos < len(data):
+        if pos + _FRAME.size > len(data):
+            logging.warning(f'Ignoring a truncated frame at the end of {path}')
+            break
+        length, crc = _FRAME.unpack_from(data, pos)
+        tail = data[pos + _FRAME.size:pos + _FRAME.size + length]
+        if len(tail) < length or zlib.crc32(tail) != crc:
+            logging.warning(f'Ignoring a corrupt frame at the end of {path}')
+            break
+        created, stream_len, key_len, hash_len = _META.unpack_from(tail)
+        offset = _META.size
+        fields = []
+        for size in (stream_len, key_len, hash_len):
+            fields.append(tail[offset:offset + size].decode('utf-8'))
+            offset += size
+        records.append(SpooledRecord(
+            fields[0], fields[1], tail[offset:], fields[2] or None, created))
+        pos += _FRAME.size + length
+    return records
+
+
+class Spool:
+    """
+    An append-only, on-disk queue of Kinesis records.
+
+    Records are written to numbered segment files as length-prefixed,
+    checksummed frames. Writes are fsynced in batches of `sync_every`
+    records, and on flush() and close(). Once the spool holds more than
+    `max_bytes`, its oldest segments are dropped, and records older
+    than `max_age` are discarded rather than replayed.
+
+    The default directory is under /tmp so the spool survives warm
+    Lambda invocations; point it at durable storage, such as an EFS
+    mount, to keep it across cold starts.
+
+    Args:
+        directory (str, optional): The directory holding the segments.
+        Defaults to DEFAULT_SPOOL_DIR.
+        max_bytes (int, optional): The size cap. Defaults to 64 MiB.
+        max_age (float, optional): The age in seconds after which a
+        record is discarded. Defaults to MAX_AGE, three days.
+        segment_bytes (int, optional): The size at which a new segment
+        is started. Defaults to 4 MiB.
+        sync_every (int, optional): The records written between fsyncs.
+        Defaults to 100.
+    """
+
+    def __init__(self, directory=DEFAULT_SPOOL_DIR,
+                 max_bytes=64 * 1024 * 1024, max_age=MAX_AGE,
+                 segment_bytes=4 * 1024 * 1024, sync_every=100):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self._file = None
+        self._file_size = 0
+        self._unsynced = 0
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self):
+        """Returns the segment paths, oldest first."""
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _open_segment(self):
+        segments = self._segments()
+        number = 1
+        if segments:
+            name = os.path.basename(segments[-1])
+            number = int(name[:-len(SEGMENT_SUFFIX)]) + 1
+        path = os.path.join(self.directory, f'{number:012d}{SEGMENT_SUFFIX}')
+        self._file = open(path, 'ab')
+        self._file_size = 0
+        self._enforce_cap()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _enforce_cap(self):
+        """Drops the oldest sealed segments while over max_bytes."""
+        segments = self._segments()
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        active = self._file.name if self._file is not None else None
+        for path, size in zip(segments, sizes):
+            if total <= self.max_bytes:
+                break
+            if path == active:
+                continue
+            os.remove(path)
+            total -= size
+            logging.warning(
+                f'Spool is over {self.max_bytes} bytes, dropped {path}')
+
+    def append(self, broker_id, partition_key, data, explicit_hash_key=None,
+               created=None):
+        """
+        Adds a record to the end of the spool.
+
+        Args:
+            broker_id (str): The name of the Kinesis stream.
+            partition_key (str): The record's partition key.
+            data (bytes or str): The record's data.
+            explicit_hash_key (str, optional): The record's explicit hash
+            key. Defaults to None.
+            created (float, optional): When the record was first sent, as
+            a time.time() timestamp. Defaults to now.
+        """
+        frame = _encode_frame(SpooledRecord(
+            broker_id, partition_key, data, explicit_hash_key,
+            time.time() if created is None else created))
+        with self._lock:
+            if self._file is not None and self._file_size and \
+                    self._file_size + len(frame) > self.segment_bytes:
+                self.close()
+            if self._file is None:
+                self._open_segment()
+            self._file.write(frame)
+            self._file_size += len(frame)
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+
+    def extend(self, broker_id, entries):
+        """
+        Adds PutRecords entries to the spool and flushes it.
+
+        Args:
+            broker_id (str): The name of the Kinesis stream.
+            entries (list): Dicts with 'PartitionKey', 'Data' and
+            optionally 'ExplicitHashKey'.
+        """
+        with self._lock:
+            for entry in entries:
+                self.append(broker_id, entry['PartitionKey'], entry['Data'],
+                            entry.get('ExplicitHashKey'))
+            self.flush()
+
+    def flush(self):
+        """Writes and fsyncs any buffered records."""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Flushes and closes the active segment."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+                self._file_size = 0
+
+    def size(self):
+        """int: The bytes held in the spool."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            return sum(os.path.getsize(path) for path in self._segments())
+
+    def _rewrite(self, path, records):
+        """Atomically replaces a segment with the given records."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            for record in records:
+                tmp_file.write(_encode_frame(record))
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+
+    def replay(self, publish, batch_size=500):
+        """
+        Publishes every spooled record, oldest first, and removes it.
+
+        Records are passed to `publish` in batches, in the order they
+        were spooled. A segment is removed once all of its records have
+        been published. If `publish` raises, the records it had not yet
+        published are kept, in order, for the next replay. Records
+        older than max_age are discarded.
+
+        Args:
+            publish (callable): Takes a list of SpooledRecords and sends
+            them, raising if they could not be sent.
+            batch_size (int, optional): The records per publish call.
+            Defaults to 500.
+
+        Returns:
+            dict: The number of records 'replayed' and 'expired'.
+
+        Raises:
+            Any exception raised by publish.
+        """
+        summary = {'replayed': 0, 'expired': 0}
+        with self._lock:
+            self.close()
+            cutoff = time.time() - self.max_age
+            for path in self._segments():
+                records = _read_segment(path)
+                fresh = [record for record in records
+                         if record.created >= cutoff]
+                summary['expired'] += len(records) - len(fresh)
+                sent = 0
+                try:
+                    for start in range(0, len(fresh), batch_size):
+                        batch = fresh[start:start + batch_size]
+                        publish(batch)
+                        sent += len(batch)
+                        summary['replayed'] += len(batch)
+                except Exception:
+                    self._rewrite(path, fresh[sent:])
+                    raise
+                os.remove(path)
+
+        if summary['replayed'] or summary['expired']:
+            logging.info(
+                f"Replayed {summary['replayed']} spooled records, "
+                f"discarded {summary['expired']} expired")
+        return summary
@@ -0,0 +1,295 @@
+"""This module contains the definition for the ResultsStreamParser
+class, an incremental parser for Guardian search responses."""
+
+import codecs
+import json
+import re
+
+# Characters that can end or nest a value outside and inside strings.
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = ' \t\r\n'
+_SCALAR_END = re.compile(r'[\s,}\]]')
+
+# Drop consumed text from the buffer once this much has built up.
+_COMPACT_AT = 64 * 1024
+
+
+class ResultsStreamParser:
+    """
+    Incrementally parses a Guardian search response from raw chunks.
+
+    Chunks are fed as they arrive from the socket and each article in
+    'response.results' is returned as soon as its closing brace has been
+    read, so only the current article is ever held as text and as Python
+    objects. The other scalar fields of 'response' (such as 'pages' and
+    'currentPage') are collected into `meta`.
+
+    Article bodies longer than `max_body_chars` are truncated once each
+    article has been decoded, before it is handed on. This bounds the
+    size of the articles returned, not the memory used while parsing:
+    the current article is held whole, body included, until its closing
+    brace has been read.
+
+    Args:
+        max_body_chars (int, optional): The maximum length of
+        'fields.body' in each article. Defaults to None (no limit).
+    """
+
+    def __init__(self, max_body_chars=None):
+        self.max_body_chars = max_body_chars
+        self.meta = {}
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._state = 'start'
+        self._key = None
+        self._scan = None
+
+    @property
+    def done(self):
+        """bool: True once the whole top-level object has been read."""
+        return self._state == 'done'
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the response.
+
+        Args:
+            chunk (bytes or str): The next piece of the response body.
+
+        Returns:
+            list: The articles completed by this chunk, in order.
+
+        Raises:
+            ValueError: If the response is not valid JSON of the
+            expected shape.
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._compact()
+        self._buf += chunk
+        articles = []
+        while self._step(articles):
+            pass
+        return articles
+
+    def close(self):
+        """
+        Checks that the whole response was parsed.
+
+        Raises:
+            ValueError: If the response ended early.
+        """
+        self._buf += self._decoder.decode(b'', final=True)
+        if self._state != 'done':
+            raise ValueError('Guardian response ended unexpectedly!')
+
+    def _compact(self):
+        if self._pos < _COMPACT_AT:
+            return
+        shift = self._pos
+        self._buf = self._buf[shift:]
+        self._pos = 0
+        if self._scan is not None:
+            self._scan['start'] -= shift
+            self._scan['pos'] -= shift
+
+    def _skip(self, separators=_WHITESPACE):
+        buf = self._buf
+        pos = self._pos
+        while pos < len(buf) and buf[pos] in separators:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _expect(self, char):
+        raise ValueError(
+            f'Invalid Guardian response: expected {char} at offset '
+            f'{self._pos}')
+
+    def _step(self, articles):
+        """Advances the state machine, returning False when starved."""
+        state = self._state
+        if state == 'done':
+            return False
+
+        if state == 'start':
+            char = self._skip()
+            if char is None:
+                return False
+            if char != '{':
+                self._expect("'{'")
+            self._pos += 1
+            self._state = 'top_key'
+            return True
+
+        if state in ('top_key', 'resp_key'):
+            char = self._skip(_WHITESPACE + ',')
+            if char is None:
+                return False
+            if char == '}':
+                self._pos += 1
+                self._state = 'done' if state == 'top_key' else 'top_key'
+                return True
+            key = self._read_key()
+            if key is None:
+                return False
+            self._key = key
+            self._state = state + '_value'
+            return True
+
+        if state in ('top_key_value', 'resp_key_value'):
+            char = self._skip()
+            if char is None:
+                return False
+            if state == 'top_key_value' and self._key == 'response':
+                if char != '{':
+                    self._expect("an object for 'response'")
+                self._pos += 1
+                self._state = 'resp_key'
+                return True
+            if state == 'resp_key_value' and self._key == 'results':
+                if char != '[':
+                    self._expect("an array for 'results'")
+                self._pos += 1
+                self._state = 'results'
+                return True
+            value = self._read_value()
+            if value is None:
+                return False
+            if state == 'resp_key_value':
+                self.meta[self._key] = json.loads(value)
+            self._state = state[:-len('_value')]
+            return True
+
+        # state == 'results'
+        char = self._skip(_WHITESPACE + ',')
+        if char is None:
+            return False
+        if char == ']':
+            self._pos += 1
+            self._state = 'resp_key'
+            return True
+        value = self._read_value()
+        if value is None:
+            return False
+        articles.append(self._truncate(json.loads(value)))
+        return True
+
+    def _read_key(self):
+        """Reads an object key and its colon, or None if incomplete."""
+        if self._buf[self._pos] != '"':
+            self._expect('a key')
+        end = self._string_end(self._pos + 1)
+        if end is None:
+            return None
+        colon = end
+        while colon < len(self._buf) and self._buf[colon] in _WHITESPACE:
+            colon += 1
+        if colon >= len(self._buf):
+            return None
+        if self._buf[colon] != ':':
+            self._pos = colon
+            self._expect("':'")
+        key = json.loads(self._buf[self._pos:end])
+        self._pos = colon + 1
+        return key
+
+    def _string_end(self, pos):
+        """Returns the offset after a string's closing quote, or None."""
+        buf = self._buf
+        while True:
+            match = _STRING_SPECIAL.search(buf, pos)
+            if match is None:
+                return None
+            if match.group() == '"':
+                return match.end()
+            if match.end() >= len(buf):
+                return None
+            pos = match.end() + 1
+
+    def _read_value(self):
+        """Reads one complete JSON value as text, or None if incomplete."""
+        buf = self._buf
+        start = self._pos
+        char = buf[start]
+
+        if char == '"':
+            end = self._string_end(start + 1)
+        elif char in '{[':
+            end = self._compound_end(start)
+        else:
+            match = _SCALAR_END.search(buf, start)
+            end = match.start() if match else None
+
+        if end is None:
+            return None
+        self._pos = end
+        return buf[start:end]
+
+    def _compound_end(self, start):
+        """Finds the end of an object or array, resuming across feeds."""
+        scan = self._scan
+        if scan is None or scan['start'] != start:
+            scan = self._scan = {'start': start, 'pos': start, 'depth': 0}
+        buf = self._buf
+        pos = scan['pos']
+        depth = scan['depth']
+        while True:
+            match = _STRUCTURAL.search(buf, pos)
+            if match is None:
+                scan['pos'] = len(buf)
+                scan['depth'] = depth
+                return None
+            char = match.group()
+            if char == '"':
+                end = self._string_end(match.end())
+                if end is None:
+                    scan['pos'] = match.start()
+                    scan['depth'] = depth
+                    return None
+                pos = end
+                continue
+            pos = match.end()
+            depth += 1 if char in '{[' else -1
+            if depth == 0:
+                self._scan = None
+                return pos
+
+    def _truncate(self, article):
+        if self.max_body_chars is None or not isinstance(article, dict):
+            return article
+        fields = article.get('fields')
+        if isinstance(fields, dict):
+            body = fields.get('body')
+            if isinstance(body, str) and len(body) > self.max_body_chars:
+                fields['body'] = body[:self.max_body_chars]
+        return article
+
+
+def iter_results(chunks, max_body_chars=None, meta=None):
+    """
+    Yields the articles of a Guardian search response from raw chunks.
+
+    Args:
+        chunks (iterable): The response body in pieces, as bytes or str.
+        max_body_chars (int, optional): The maximum length of
+        'fields.body' in each article yielded. The body is cut after the
+        article is decoded, so each article is still read whole.
+        Defaults to None (no limit).
+        meta (dict, optional): A dict to fill with the other fields of
+        'response', such as 'pages'. Defaults to None.
+
+    Yields:
+        dict: One article at a time.
+
+    Raises:
+        ValueError: If the response is malformed or ends early.
+    """
+    parser = ResultsStreamParser(max_body_chars=max_body_chars)
+    if meta is not None:
+        parser.meta = meta
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
@@ -0,0 +1,221 @@
+"""This module contains the definitions for incremental polling:
+per-query high-water marks, a bounded seen-id index and the
+iter_new_articles() generator."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from src.api_interaction import iter_articles, DEFAULT_SHOW_FIELDS
+
+DEFAULT_WATERMARK_PATH = os.path.join(
+    tempfile.gettempdir(), 'guardian_watermarks.json')
+
+
+def _fingerprint(article_id):
+    """Returns a compact 64-bit fingerprint of an article id."""
+    return hashlib.blake2b(
+        article_id.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class BoundedIdSet:
+    """
+    A set of article ids that remembers only the most recent `max_size`.
+
+    Ids are stored as 64-bit fingerprints rather than full Guardian ids,
+    and the oldest fingerprints are forgotten first once the set is full.
+
+    Args:
+        fingerprints (iterable, optional): Fingerprints to start with,
+        oldest first. Defaults to None.
+        max_size (int, optional): The maximum number of ids to remember.
+        Defaults to 1000.
+    """
+
+    def __init__(self, fingerprints=None, max_size=1000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        for fingerprint in fingerprints or []:
+            self._insert(fingerprint)
+
+    def __contains__(self, article_id):
+        return _fingerprint(article_id) in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, article_id):
+        """Adds an article id, forgetting the oldest if full."""
+        self._insert(_fingerprint(article_id))
+
+    def to_list(self):
+        """list: The stored fingerprints, oldest first."""
+        return list(self._items)
+
+    def _insert(self, fingerprint):
+        self._items[fingerprint] = None
+        self._items.move_to_end(fingerprint)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+class Watermark:
+    """
+    The high-water mark for one query.
+
+    Args:
+        latest (str, optional): The latest webPublicationDate seen.
+        Defaults to None.
+        seen (BoundedIdSet, optional): The ids of recently seen
+        articles. Defaults to an empty set.
+    """
+
+    def __init__(self, latest=None, seen=None):
+        self.latest = latest
+        self.seen = seen if seen is not None else BoundedIdSet()
+
+    @property
+    def date_from(self):
+        """str: The 'from-date' to request, or None on the first run."""
+        return self.latest[:10] if self.latest else None
+
+    def is_new(self, article):
+        """Returns True if the article has not been seen before."""
+        article_id = article.get('id')
+        return not article_id or article_id not in self.seen
+
+    def is_older(self, article):
+        """Returns True if the article predates the high-water mark."""
+        published = article.get('webPublicationDate')
+        return bool(self.latest and published and published < self.latest)
+
+    def advance(self, articles):
+        """
+        Records articles as seen and moves the high-water mark forward.
+
+        Args:
+            articles (iterable): Raw Guardian articles that were sent.
+        """
+        for article in articles:
+            if article.get('id'):
+                self.seen.add(article['id'])
+            published = article.get('webPublicationDate')
+            if published and (not self.latest or published > self.latest):
+                self.latest = published
+
+
+class WatermarkStore:
+    """
+    Persists a Watermark per query in a JSON file.
+
+    The default path is under /tmp so the state survives warm Lambda
+    invocations; point it at durable storage to keep it across cold
+    starts.
+
+    Args:
+        path (str, optional): The JSON file to read and write.
+        Defaults to DEFAULT_WATERMARK_PATH.
+        max_ids (int, optional): The number of seen ids to remember per
+        query. Defaults to 1000.
+    """
+
+    def __init__(self, path=DEFAULT_WATERMARK_PATH, max_ids=1000):
+        self.path = path
+        self.max_ids = max_ids
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as json_err:
+            logging.error(f'Ignoring corrupt watermark file: {json_err}')
+            return {}
+
+    def get(self, query):
+        """
+        Returns the stored Watermark for a query.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            Watermark: The stored state, or an empty Watermark.
+        """
+        state = self._load().get(query, {})
+        return Watermark(
+            latest=state.get('latest'),
+            seen=BoundedIdSet(state.get('ids'), max_size=self.max_ids))
+
+    def save(self, query, watermark):
+        """
+        Stores the Watermark for a query, replacing the file atomically.
+
+        Args:
+            query (str): The search query.
+            watermark (Watermark): The state to store.
+        """
+        state = self._load()
+        state[query] = {
+            'latest': watermark.latest,
+            'ids': watermark.seen.to_list()
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(state, tmp_file)
+        os.replace(tmp_path, self.path)
+
+
+def iter_new_articles(query, watermark, page_size=10, max_articles=None,
+                      show_fields=DEFAULT_SHOW_FIELDS, cache=None,
+                      stream=False):
+    """
+    Lazily yields only the articles published since the last run.
+
+    Once a query has a high-water mark, results are requested oldest
+    first from the mark's date, so when more than `max_articles` are new
+    the oldest are yielded and the rest are left for the next run, which
+    resumes after the last one sent. Articles from the mark's own date
+    that are older than the mark, or were already sent, are dropped
+    using the mark and the seen-id index, before any formatting. The
+    first run, with no mark, requests the newest articles.
+
+    Args:
+        query (str): The search query string to filter articles by.
+        watermark (Watermark): The query's high-water mark.
+        page_size (int, optional): The number of results to request per
+        page. Defaults to 10.
+        max_articles (int, optional): The maximum number of new articles
+        to yield. Defaults to None.
+        show_fields (str, optional): The extra fields passed through to
+        api_interaction(). Defaults to DEFAULT_SHOW_FIELDS.
+        cache (ResponseCache, optional): A cache passed through to
+        api_interaction(). Defaults to None.
+        stream (bool, optional): Parse pages incrementally, see
+        iter_articles(). Defaults to False.
+
+    Yields:
+        dict: A raw Guardian article that has not been seen before.
+    """
+    count = 0
+    skipped = 0
+    articles = iter_articles(
+        query, watermark.date_from, page_size=page_size,
+        order_by='oldest' if watermark.latest else 'newest',
+        show_fields=show_fields, cache=cache, stream=stream)
+    for article in articles:
+        if watermark.is_older(article):
+            continue
+        if not watermark.is_new(article):
+            skipped += 1
+            continue
+        yield article
+        count += 1
+        if max_articles is not None and count >= max_articles:
+            break
+    if skipped:
+        logging.info(f'Skipped {skipped} already sent articles for {query}')
@@ -0,0 +1,22 @@
+"""This module contains fixtures shared by every test module."""
+
+import pytest
+from src.metrics import set_collector
+from src.send_to_kinesis import close_kinesis_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_kinesis_client():
+    """Stops a Kinesis client cached by one test leaking into the next."""
+    close_kinesis_client()
+    yield
+    close_kinesis_client()
+
+
+@pytest.fixture(autouse=True)
+def no_metrics_collector():
+    """Stops a metrics collector installed by one test leaking into the
+    next."""
+    set_collector(None)
+    yield
+    set_collector(None)
@@ -0,0 +1,153 @@
+"""This module contains the test suite for
+the KPL record aggregation only.
+"""
+
+import hashlib
+import pytest
+from src.aggregation import (
+    Aggregator, aggregate_entries, deaggregate, is_aggregated,
+    hash_key_for, MAGIC)
+
+MAX_HASH_KEY = 2 ** 128 - 1
+
+
+def entry(index, explicit_hash_key=None):
+    """Builds a PutRecords entry for a small user record."""
+    result = {'PartitionKey': f'key-{index}',
+              'Data': f'{{"id": {index}}}'.encode('utf-8')}
+    if explicit_hash_key is not None:
+        result['ExplicitHashKey'] = explicit_hash_key
+    return result
+
+
+def test_round_trip():
+    """
+    Test that deaggregate returns every user record with its own
+    partition and explicit hash keys.
+    """
+    aggregator = Aggregator()
+    records = [entry(0), entry(1, '42'), entry(0, '42'), entry(2)]
+    for record in records:
+        assert aggregator.add(
+            record['PartitionKey'], record['Data'],
+            record.get('ExplicitHashKey')) is None
+    aggregated = aggregator.flush()
+
+    assert aggregated['PartitionKey'] == 'key-0'
+    assert 'ExplicitHashKey' not in aggregated
+    assert aggregated['Data'].startswith(MAGIC)
+    assert deaggregate(aggregated['Data']) == [
+        {'PartitionKey': record['PartitionKey'],
+         'ExplicitHashKey': record.get('ExplicitHashKey'),
+         'Data': record['Data']} for record in records]
+    assert aggregator.flush() is None
+
+
+def test_known_encoding():
+    """
+    Test that the protobuf encoding matches the KPL wire format for
+    a single record.
+    """
+    aggregator = Aggregator()
+    aggregator.add('pk', b'data')
+    data = aggregator.flush()['Data']
+
+    message = b'\x0a\x02pk' + b'\x1a\x08' + b'\x08\x00' + b'\x1a\x04data'
+    digest = hashlib.md5(message, usedforsecurity=False).digest()
+    assert data == MAGIC + message + digest
+
+
+def test_flushes_at_size_limit():
+    """
+    Test that the aggregator starts a new record when the next user
+    record would not fit, and never exceeds max_bytes.
+    """
+    aggregator = Aggregator(max_bytes=200)
+    flushed = [aggregator.add(f'k{i}', b'x' * 40) for i in range(10)]
+    flushed.append(aggregator.flush())
+    aggregated = [record for record in flushed if record is not None]
+
+    assert len(aggregated) > 1
+    for record in aggregated:
+        size = len(record['Data']) + len(record['PartitionKey'])
+        assert size <= 200
+    user_records = [user for record in aggregated
+                    for user in deaggregate(record['Data'])]
+    assert [user['PartitionKey'] for user in user_records] == [
+        f'k{i}' for i in range(10)]
+
+
+def test_rejects_oversized_record():
+    """
+    Test that a user record too large for an empty aggregate raises
+    a ValueError.
+    """
+    with pytest.raises(ValueError, match='too large'):
+        Aggregator(max_bytes=100).add('pk', b'x' * 100)
+
+
+def test_aggregate_entries_groups_by_shard():
+    """
+    Test that aggregate_entries only packs together user records
+    bound for the same shard, and routes each aggregate there.
+    """
+    half = MAX_HASH_KEY // 2
+    shard_ranges = [('0', str(half)), (str(half + 1), str(MAX_HASH_KEY))]
+    entries = [entry(i) for i in range(20)] + [
+        entry(20, str(half + 5)), entry(21, '5')]
+
+    aggregated = aggregate_entries(entries, shard_ranges)
+
+    assert len(aggregated) == 2
+    for record in aggregated:
+        first = deaggregate(record['Data'])[0]
+        assert record['PartitionKey'] == first['PartitionKey']
+        shard_of_first = hash_key_for(first['PartitionKey']) > half \
+            if first['ExplicitHashKey'] is None \
+            else int(first['ExplicitHashKey']) > half
+        for user in deaggregate(record['Data']):
+            hash_key = int(user['ExplicitHashKey']) \
+                if user['ExplicitHashKey'] else \
+                hash_key_for(user['PartitionKey'])
+            assert (hash_key > half) == shard_of_first
+    assert sum(len(deaggregate(record['Data']))
+               for record in aggregated) == 22
+
+
+def test_aggregate_entries_without_shards():
+    """
+    Test that aggregate_entries packs everything in order without a
+    shard map.
+    """
+    entries = [entry(i) for i in range(5)]
+
+    aggregated = aggregate_entries(entries)
+
+    assert len(aggregated) == 1
+    assert [user['Data'] for user in deaggregate(aggregated[0]['Data'])] \
+        == [record['Data'] for record in entries]
+
+
+def test_deaggregate_plain_record():
+    """
+    Test that a record that is not aggregated, or fails its digest
+    check, is returned as a single user record.
+    """
+    assert deaggregate(b'{"id": 1}', 'pk') == [
+        {'PartitionKey': 'pk', 'ExplicitHashKey': None,
+         'Data': b'{"id": 1}'}]
+
+    aggregator = Aggregator()
+    aggregator.add('pk', b'data')
+    corrupted = bytearray(aggregator.flush()['Data'])
+    corrupted[-1] ^= 0xFF
+    assert not is_aggregated(bytes(corrupted))
+    assert len(deaggregate(bytes(corrupted))) == 1
+
+
+def test_hash_key_for():
+    """
+    Test that hash_key_for matches the Kinesis MD5 key mapping.
+    """
+    assert hash_key_for('pk') == int(hashlib.md5(
+        b"pk", usedforsecurity=False).hexdigest(), 16)
@@ -1,9 +1,14 @@
 """This module contains the test suite
 for the api_interaction() function only."""
 
+import json
 import pytest
 import requests
-from src.api_interaction import api_interaction
+from src.api_interaction import (
+    api_interaction, iter_articles, iter_article_stream, get_session,
+    get_api_key, close_session, DEFAULT_TIMEOUT)
+from src.response_cache import ResponseCache
+from src.rate_limiter import RateLimiter, set_rate_limiter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,13 +40,22 @@ mock_data = {
 }
 
 
+@pytest.fixture(autouse=True)
+def unlimited_rate():
+    """Stops the shared rate limiter from slowing the tests down."""
+    set_rate_limiter(RateLimiter(per_second=1000, per_day=None, burst=1000))
+    yield
+    set_rate_limiter(None)
+
+
 def test_api_interaction_success(mocker):
     """
     Test that the api_interaction function successfully fetches articles when
     the API call returns a 200 status.
     """
     mocker.patch('os.getenv', return_value='test-api-key')
-    mock_get = mocker.patch('requests.get')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
 
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = mock_data
@@ -53,8 +67,9 @@ def test_api_interaction_success(mocker):
         params={
             'q': 'machine learning',
             'api-key': 'test-api-key',
-            'show-fields': 'trailText, body'
-        }
+            'show-fields': 'trailText,body'
+        },
+        timeout=DEFAULT_TIMEOUT
     )
 
     assert result == mock_data
@@ -65,7 +80,8 @@ def test_api_interaction_success_with_date(mocker):
     Test that the api_interaction function correctly handles the date filter.
     """
     mocker.patch('os.getenv', return_value='test-api-key')
-    mock_get = mocker.patch('requests.get')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
 
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = mock_data
@@ -77,9 +93,10 @@ def test_api_interaction_success_with_date(mocker):
         params={
             'q': 'machine learning',
             'api-key': 'test-api-key',
-            'show-fields': 'trailText, body',
+            'show-fields': 'trailText,body',
             'from-date': '2023-01-01'
-        }
+        },
+        timeout=DEFAULT_TIMEOUT
     )
 
     assert result == mock_data
@@ -102,10 +119,11 @@ def test_api_interaction_http_error(mocker):
     the API call results in an HTTP error.
     """
     mocker.patch('os.getenv', return_value='test-api-key')
-    mock_get = mocker.patch('requests.get')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
 
-    mock_get.side_effect = requests.exceptions.HTTPError(
-        "404 Client Error: Not Found for url")
+    mock_get.return_value.raise_for_status.side_effect = \
+        requests.exceptions.HTTPError("404 Client Error: Not Found for url")
 
     with pytest.raises(requests.exceptions.HTTPError, match="404 Client Error"):  # noqa
         api_interaction('machine learning')
@@ -117,7 +135,8 @@ def test_api_interaction_request_exception(mocker):
     a network-related error or timeout occurs.
     """
     mocker.patch('os.getenv', return_value='test-api-key')
-    mock_get = mocker.patch('requests.get')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
 
     mock_get.side_effect = requests.exceptions.RequestException(
         "A network-related error occurred")
@@ -132,9 +151,385 @@ def test_api_interaction_generic_exception(mocker):
     an unexpected error occurs.
     """
     mocker.patch('os.getenv', return_value='test-api-key')
-    mock_get = mocker.patch('requests.get')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
 
     mock_get.side_effect = Exception("Unexpected error")
 
     with pytest.raises(Exception, match="Unexpected error"):
         api_interaction('machine learning')
+
+
+def test_api_interaction_request_shape(mocker):
+    """
+    Test that the api_interaction function sends the requested
+    ordering and fields, and omits show-fields when none are wanted.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.return_value.json.return_value = mock_data
+
+    api_interaction('machine learning', order_by='newest',
+                    show_fields='trailText')
+    params = mock_get.call_args.kwargs['params']
+    assert params['order-by'] == 'newest'
+    assert params['show-fields'] == 'trailText'
+
+    api_interaction('machine learning', show_fields=None)
+    assert 'show-fields' not in mock_get.call_args.kwargs['params']
+
+
+def test_api_interaction_uses_given_session(mocker):
+    """
+    Test that the api_interaction function sends the request with
+    the given session and timeout instead of the shared session.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mock_shared = mocker.patch('src.api_interaction.get_session')
+    session = mocker.Mock()
+    session.get.return_value.json.return_value = mock_data
+
+    result = api_interaction('machine learning', session=session, timeout=5)
+
+    assert result == mock_data
+    assert session.get.call_args.kwargs['timeout'] == 5
+    mock_shared.assert_not_called()
+
+
+def test_get_session_is_shared():
+    """
+    Test that get_session returns the same pooled session on every
+    call until it is closed.
+    """
+    close_session()
+    session = get_session()
+    try:
+        assert get_session() is session
+        adapter = session.get_adapter('https://content.guardianapis.com')
+        assert adapter.max_retries.total == 0
+    finally:
+        close_session()
+
+    assert get_session() is not session
+    close_session()
+
+
+def test_get_session_grows_pool_after_warm_up():
+    """
+    Test that asking for a larger pool after the session was created,
+    as main_multi() does after a Lambda warm-up, resizes its pool.
+    """
+    close_session()
+    try:
+        session = get_session()
+        adapter = session.get_adapter('https://content.guardianapis.com')
+        assert adapter._pool_maxsize == 10
+
+        assert get_session(pool_maxsize=32) is session
+        adapter = session.get_adapter('https://content.guardianapis.com')
+        assert adapter._pool_maxsize == 32
+        assert adapter.max_retries.total == 0
+
+        get_session(pool_maxsize=4)
+        assert session.get_adapter(
+            'https://content.guardianapis.com') is adapter
+    finally:
+        close_session()
+
+
+def test_api_interaction_served_from_cache(mocker):
+    """
+    Test that the api_interaction function returns a cached response
+    without sending a request, and caches responses on a miss.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.return_value.json.return_value = mock_data
+    cache = ResponseCache(path=None)
+
+    first = api_interaction('machine learning', cache=cache)
+    second = api_interaction('machine  learning', cache=cache)
+
+    assert first == second == mock_data
+    assert mock_get.call_count == 1
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1}
+
+
+def test_api_interaction_waits_out_429(mocker):
+    """
+    Test that the api_interaction function pauses the rate limiter
+    for the Retry-After delay on a 429 and then retries.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    throttled = mocker.Mock(status_code=429, headers={'Retry-After': '2'})
+    ok = mocker.Mock(status_code=200)
+    ok.json.return_value = mock_data
+    session = mocker.Mock()
+    session.get.side_effect = [throttled, ok]
+    limiter = mocker.Mock()
+
+    result = api_interaction(
+        'machine learning', session=session, rate_limiter=limiter)
+
+    assert result == mock_data
+    assert limiter.acquire.call_count == 2
+    limiter.throttled.assert_called_once_with(2.0)
+    limiter.succeeded.assert_called_once()
+
+
+def test_api_interaction_gives_up_after_429s(mocker):
+    """
+    Test that the api_interaction function raises an HTTPError once
+    it has retried repeated 429 responses.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    throttled = mocker.Mock(status_code=429, headers={})
+    throttled.raise_for_status.side_effect = requests.exceptions.HTTPError(
+        "429 Client Error: Too Many Requests")
+    session = mocker.Mock()
+    session.get.return_value = throttled
+    limiter = mocker.Mock()
+
+    with pytest.raises(requests.exceptions.HTTPError, match="429"):
+        api_interaction(
+            'machine learning', session=session, rate_limiter=limiter)
+
+    assert session.get.call_count == 4
+    assert limiter.throttled.call_count == 3
+
+
+def test_api_interaction_retries_5xx_through_limiter(mocker):
+    """
+    Test that 5xx responses and connection errors are retried by
+    api_interaction, each attempt taking a rate limiter token.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    sleep = mocker.patch('src.api_interaction.time.sleep')
+    unavailable = mocker.Mock(status_code=503)
+    ok = mocker.Mock(status_code=200)
+    ok.json.return_value = mock_data
+    session = mocker.Mock()
+    session.get.side_effect = [
+        unavailable, requests.exceptions.ConnectionError('reset'), ok]
+    limiter = mocker.Mock()
+
+    result = api_interaction(
+        'machine learning', session=session, rate_limiter=limiter)
+
+    assert result == mock_data
+    assert session.get.call_count == 3
+    assert limiter.acquire.call_count == 3
+    assert [call.args[0] for call in sleep.call_args_list] == [0.5, 1.0]
+
+
+def test_api_interaction_gives_up_after_5xx(mocker):
+    """
+    Test that api_interaction raises once it has retried repeated 5xx
+    responses, and that a connection error is raised after its retries.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mocker.patch('src.api_interaction.time.sleep')
+    unavailable = mocker.Mock(status_code=503)
+    unavailable.raise_for_status.side_effect = requests.exceptions.HTTPError(
+        "503 Server Error")
+    session = mocker.Mock()
+    session.get.return_value = unavailable
+    limiter = mocker.Mock()
+
+    with pytest.raises(requests.exceptions.HTTPError, match="503"):
+        api_interaction(
+            'machine learning', session=session, rate_limiter=limiter)
+    assert session.get.call_count == limiter.acquire.call_count == 4
+
+    session.get.side_effect = requests.exceptions.Timeout('read timeout')
+    with pytest.raises(requests.exceptions.Timeout):
+        api_interaction(
+            'machine learning', session=session, rate_limiter=limiter)
+    assert session.get.call_count == limiter.acquire.call_count == 8
+
+
+def test_api_interaction_cache_hit_skips_limiter(mocker):
+    """
+    Test that a cache hit does not use up a rate limiter token.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    cache = mocker.Mock()
+    cache.get.return_value = mock_data
+    limiter = mocker.Mock()
+
+    api_interaction('machine learning', cache=cache, rate_limiter=limiter)
+
+    limiter.acquire.assert_not_called()
+
+
+def make_page(ids, pages):
+    """Builds a single page of mock API results."""
+    return {
+        'response': {
+            'status': 'ok',
+            'pages': pages,
+            'results': [{'id': article_id} for article_id in ids]
+        }
+    }
+
+
+def test_api_interaction_with_paging(mocker):
+    """
+    Test that the api_interaction function passes the page and
+    page-size parameters through to the API.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.return_value.json.return_value = mock_data
+
+    api_interaction('machine learning', page=2, page_size=50)
+
+    params = mock_get.call_args.kwargs['params']
+    assert params['page'] == 2
+    assert params['page-size'] == 50
+
+
+def test_iter_articles_walks_pages(mocker):
+    """
+    Test that iter_articles yields articles from every page until
+    the API reports no further pages.
+    """
+    mock_api = mocker.patch(
+        'src.api_interaction.api_interaction',
+        side_effect=[make_page(['a', 'b'], 2), make_page(['c'], 2)])
+
+    result = [article['id'] for article in iter_articles('test')]
+
+    assert result == ['a', 'b', 'c']
+    assert mock_api.call_count == 2
+    assert mock_api.call_args_list[1].kwargs['page'] == 2
+
+
+def test_iter_articles_is_lazy(mocker):
+    """
+    Test that iter_articles does not request the next page until
+    the current page has been consumed.
+    """
+    mock_api = mocker.patch(
+        'src.api_interaction.api_interaction',
+        side_effect=[make_page(['a', 'b'], 5), make_page(['c', 'd'], 5)])
+
+    articles = iter_articles('test', page_size=2)
+    assert next(articles)['id'] == 'a'
+    assert next(articles)['id'] == 'b'
+    assert mock_api.call_count == 1
+
+    assert next(articles)['id'] == 'c'
+    assert mock_api.call_count == 2
+
+
+def test_iter_articles_stops_at_max_articles(mocker):
+    """
+    Test that iter_articles stops fetching once max_articles
+    have been yielded, and requests no larger a page than needed.
+    """
+    mock_api = mocker.patch(
+        'src.api_interaction.api_interaction',
+        side_effect=[make_page(['a', 'b', 'c'], 10)])
+
+    result = list(iter_articles('test', page_size=50, max_articles=3))
+
+    assert len(result) == 3
+    assert mock_api.call_count == 1
+    assert mock_api.call_args.kwargs['page_size'] == 3
+
+
+def test_iter_articles_stops_on_empty_page(mocker):
+    """
+    Test that iter_articles stops when the API returns an empty page.
+    """
+    mock_api = mocker.patch(
+        'src.api_interaction.api_interaction',
+        return_value=make_page([], 10))
+
+    assert list(iter_articles('test')) == []
+    assert mock_api.call_count == 1
+
+
+def streamed_response(mocker, page):
+    """Builds a mock streaming response for a page of results."""
+    body = json.dumps(page).encode('utf-8')
+    response = mocker.Mock(status_code=200)
+    response.iter_content.return_value = [
+        body[i:i + 16] for i in range(0, len(body), 16)]
+    return response
+
+
+def test_iter_article_stream(mocker):
+    """
+    Test that iter_article_stream sends a streaming request, yields
+    parsed articles, fills in the page metadata and closes the
+    response.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    response = streamed_response(mocker, make_page(['a', 'b'], 3))
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.return_value = response
+    meta = {}
+
+    result = list(iter_article_stream('test', page=2, meta=meta))
+
+    assert [article['id'] for article in result] == ['a', 'b']
+    assert meta['pages'] == 3
+    assert mock_get.call_args.kwargs['stream'] is True
+    assert mock_get.call_args.kwargs['params']['page'] == 2
+    response.close.assert_called_once()
+
+
+def test_iter_articles_streaming(mocker):
+    """
+    Test that iter_articles pages through streamed responses and
+    closes the last response when it stops early.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    first = streamed_response(mocker, make_page(['a', 'b'], 2))
+    second = streamed_response(mocker, make_page(['c', 'd'], 2))
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.side_effect = [first, second]
+
+    result = list(iter_articles(
+        'test', page_size=2, max_articles=3, stream=True))
+
+    assert [article['id'] for article in result] == ['a', 'b', 'c']
+    second.close.assert_called_once()
+
+
+def test_api_interaction_with_date_range(mocker):
+    """
+    Test that api_interaction sends to-date when date_to is given.
+    """
+    mocker.patch('os.getenv', return_value='test-api-key')
+    mock_get = mocker.patch(
+        'src.api_interaction.get_session').return_value.get
+    mock_get.return_value.json.return_value = mock_data
+
+    api_interaction('machine learning', date_from='2023-01-01',
+                    date_to='2023-01-31')
+
+    params = mock_get.call_args.kwargs['params']
+    assert params['from-date'] == '2023-01-01'
+    assert params['to-date'] == '2023-01-31'
+
+
+def test_get_api_key_loads_dotenv_once(mocker, monkeypatch):
+    """
+    Test that the .env file is loaded on the first call to get_api_key()
+    rather than on import, and only once.
+    """
+    monkeypatch.setattr('src.api_interaction._dotenv_loaded', False)
+    monkeypatch.setenv('Guardian_API_Key', 'env-key')
+    mock_load = mocker.patch('dotenv.load_dotenv')
+
+    assert get_api_key() == 'env-key'
+    assert get_api_key() == 'env-key'
+    mock_load.assert_called_once()
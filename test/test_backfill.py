@@ -0,0 +1,169 @@
+"""This module contains the test suite for
+the split_windows() and backfill() functions and
+the BackfillCheckpoint class.
+"""
+
+import time
+import pytest
+from src.backfill import split_windows, backfill, BackfillCheckpoint
+
+
+def test_split_windows_covers_the_range():
+    """
+    Test that windows are consecutive, inclusive and clipped to the end
+    of the range.
+    """
+    assert split_windows('2024-01-01', '2024-03-05', window_days=30) == [
+        ('2024-01-01', '2024-01-30'),
+        ('2024-01-31', '2024-02-29'),
+        ('2024-03-01', '2024-03-05'),
+    ]
+    assert split_windows('2024-01-01', '2024-01-01') == \
+        [('2024-01-01', '2024-01-01')]
+
+
+def test_split_windows_rejects_bad_ranges():
+    """
+    Test that a reversed range or a non-positive window size raises
+    ValueError.
+    """
+    with pytest.raises(ValueError, match='is after'):
+        split_windows('2024-02-01', '2024-01-01')
+    with pytest.raises(ValueError, match='window_days'):
+        split_windows('2024-01-01', '2024-02-01', window_days=0)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    """
+    Test that completed windows are kept per job across instances.
+    """
+    path = str(tmp_path / 'checkpoint.json')
+    job = BackfillCheckpoint.job_key('ai', '2024-01-01', '2024-02-01', 7)
+    BackfillCheckpoint(path).mark_done(job, ('2024-01-01', '2024-01-07'))
+    BackfillCheckpoint(path).mark_done(job, ('2024-01-01', '2024-01-07'))
+
+    assert BackfillCheckpoint(path).completed(job) == \
+        {('2024-01-01', '2024-01-07')}
+    assert BackfillCheckpoint(path).completed('other') == set()
+
+
+def test_checkpoint_ignores_corrupt_file(tmp_path):
+    """
+    Test that a corrupt checkpoint file is treated as empty.
+    """
+    path = tmp_path / 'checkpoint.json'
+    path.write_text('{not json')
+
+    assert BackfillCheckpoint(str(path)).completed('job') == set()
+
+
+def window_articles(query, date_from, **kwargs):
+    return iter([{'id': f'{date_from}/{i}', 'webTitle': f'{date_from} {i}',
+                  'webUrl': f'https://www.theguardian.com/{date_from}/{i}'}
+                 for i in range(3)])
+
+
+def test_backfill_sends_every_window(mocker, tmp_path):
+    """
+    Test that each window is fetched with from-date and to-date, sent in
+    batches and checkpointed.
+    """
+    mock_iter = mocker.patch('src.backfill.iter_articles',
+                             side_effect=window_articles)
+    mock_send = mocker.patch('src.backfill.send_batch_to_kinesis')
+    checkpoint = BackfillCheckpoint(str(tmp_path / 'checkpoint.json'))
+
+    summary = backfill('ai', 'stream', '2024-01-01', '2024-01-20',
+                       window_days=10, checkpoint=checkpoint, batch_size=2,
+                       aggregate=True)
+
+    assert summary == {'windows': 2, 'skipped': 0, 'completed': 2,
+                       'remaining': 0, 'articles': 6}
+    mock_iter.assert_any_call(
+        'ai', '2024-01-11', page_size=200, order_by='oldest',
+        show_fields='trailText,body', date_to='2024-01-20')
+    assert mock_send.call_count == 4
+    assert mock_send.call_args.args[1] == 'stream'
+    assert mock_send.call_args.kwargs == {'aggregate': True}
+    job = BackfillCheckpoint.job_key('ai', '2024-01-01', '2024-01-20', 10)
+    assert checkpoint.completed(job) == {
+        ('2024-01-01', '2024-01-10'), ('2024-01-11', '2024-01-20')}
+
+
+def test_backfill_resumes_from_checkpoint(mocker, tmp_path):
+    """
+    Test that windows already in the checkpoint are not fetched again.
+    """
+    mock_iter = mocker.patch('src.backfill.iter_articles',
+                             side_effect=window_articles)
+    mocker.patch('src.backfill.send_batch_to_kinesis')
+    checkpoint = BackfillCheckpoint(str(tmp_path / 'checkpoint.json'))
+    job = BackfillCheckpoint.job_key('ai', '2024-01-01', '2024-01-20', 10)
+    checkpoint.mark_done(job, ('2024-01-01', '2024-01-10'))
+
+    summary = backfill('ai', 'stream', '2024-01-01', '2024-01-20',
+                       window_days=10, checkpoint=checkpoint)
+
+    assert summary['skipped'] == 1
+    assert summary['completed'] == 1
+    mock_iter.assert_called_once()
+    assert mock_iter.call_args.args[1] == '2024-01-11'
+
+
+def test_backfill_failed_window_is_not_checkpointed(mocker, tmp_path):
+    """
+    Test that a window whose send fails is left for the next run, the
+    other windows are still checkpointed and the error is raised.
+    """
+    mocker.patch('src.backfill.iter_articles', side_effect=window_articles)
+
+    def send(records, broker_id):
+        if records[0]['webTitle'].startswith('2024-01-11'):
+            raise RuntimeError('send failed')
+
+    mocker.patch('src.backfill.send_batch_to_kinesis', side_effect=send)
+    checkpoint = BackfillCheckpoint(str(tmp_path / 'checkpoint.json'))
+
+    with pytest.raises(RuntimeError, match='send failed'):
+        backfill('ai', 'stream', '2024-01-01', '2024-01-30',
+                 window_days=10, checkpoint=checkpoint)
+
+    job = BackfillCheckpoint.job_key('ai', '2024-01-01', '2024-01-30', 10)
+    assert checkpoint.completed(job) == {
+        ('2024-01-01', '2024-01-10'), ('2024-01-21', '2024-01-30')}
+
+
+def test_backfill_stops_starting_windows_at_deadline(mocker, tmp_path):
+    """
+    Test that no window is started after the deadline and the rest are
+    reported as remaining.
+    """
+    mock_iter = mocker.patch('src.backfill.iter_articles')
+    checkpoint = BackfillCheckpoint(str(tmp_path / 'checkpoint.json'))
+
+    summary = backfill('ai', 'stream', '2024-01-01', '2024-01-30',
+                       window_days=10, checkpoint=checkpoint,
+                       deadline=time.monotonic() - 1)
+
+    mock_iter.assert_not_called()
+    assert summary['remaining'] == 3
+    assert summary['completed'] == 0
+
+
+def test_backfill_formats_on_worker_processes(mocker, tmp_path):
+    """
+    Test that with format_workers, batches are formatted with
+    format_articles_parallel().
+    """
+    mocker.patch('src.backfill.iter_articles', side_effect=window_articles)
+    mocker.patch('src.backfill.send_batch_to_kinesis')
+    mock_parallel = mocker.patch(
+        'src.backfill.format_articles_parallel',
+        side_effect=lambda batch, max_workers: batch)
+
+    backfill('ai', 'stream', '2024-01-01', '2024-01-10', window_days=10,
+             checkpoint=BackfillCheckpoint(str(tmp_path / 'cp.json')),
+             format_workers=4)
+
+    mock_parallel.assert_called_once()
+    assert mock_parallel.call_args.kwargs == {'max_workers': 4}
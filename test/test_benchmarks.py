@@ -0,0 +1,150 @@
+"""This module contains the test suite for the offline benchmark
+harness: FakeKinesis, FakeGuardianSession and the bench_pipeline
+regression gate.
+"""
+
+import pytest
+from botocore.exceptions import ClientError
+from benchmarks.bench_brokers import run as run_brokers
+from benchmarks.bench_pipeline import run, compare
+from benchmarks.fake_guardian import FakeGuardianSession, build_articles
+from benchmarks.fake_kinesis import FakeKinesis
+from src.aggregation import hash_key_for
+from src.send_to_kinesis import send_batch_to_kinesis
+
+
+def test_fake_kinesis_routes_records_by_hash_key():
+    """
+    Test that records land on the shard whose hash range holds their
+    key, and are read back in order.
+    """
+    kinesis = FakeKinesis(shard_count=2)
+    for key in ('a', 'b', 'c', 'd'):
+        kinesis.put_record(StreamName='s', Data=key.encode(),
+                           PartitionKey=key)
+
+    shards = kinesis.list_shards(StreamName='s')['Shards']
+    seen = []
+    for shard in shards:
+        start = int(shard['HashKeyRange']['StartingHashKey'])
+        end = int(shard['HashKeyRange']['EndingHashKey'])
+        iterator = kinesis.get_shard_iterator(
+            StreamName='s', ShardId=shard['ShardId'],
+            ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+        for record in kinesis.get_records(ShardIterator=iterator)['Records']:
+            assert start <= hash_key_for(record['PartitionKey']) <= end
+            seen.append(record['Data'])
+
+    assert sorted(seen) == [b'a', b'b', b'c', b'd']
+    assert [record['Data'] for record in kinesis.records()] == \
+        [b'a', b'b', b'c', b'd']
+
+
+def test_fake_kinesis_throttling_is_retried():
+    """
+    Test that throttled records are reported per record and that the
+    batch producer's retries still deliver every record once.
+    """
+    kinesis = FakeKinesis(throttle_rate=0.3, seed=1)
+    articles = [{'webTitle': str(i), 'webUrl': f'https://x/{i}'}
+                for i in range(50)]
+
+    summary = send_batch_to_kinesis(articles, 's', client=kinesis,
+                                    base_delay=0, max_retries=20)
+
+    assert summary['retries'] > 0
+    assert len(kinesis.records()) == 50
+
+
+def test_fake_kinesis_put_record_throttled():
+    """
+    Test that put_record raises a throttling ClientError.
+    """
+    kinesis = FakeKinesis(throttle_rate=1)
+
+    with pytest.raises(ClientError, match='ProvisionedThroughput'):
+        kinesis.put_record(StreamName='s', Data=b'x', PartitionKey='k')
+
+
+def test_fake_kinesis_split_shard():
+    """
+    Test that splitting closes the parent and routes new records to the
+    children, which name it as their parent.
+    """
+    kinesis = FakeKinesis(shard_count=1)
+    kinesis.put_record(StreamName='s', Data=b'before', PartitionKey='k')
+    children = kinesis.split_shard('shardId-000000000000')
+    kinesis.put_record(StreamName='s', Data=b'after', PartitionKey='k')
+
+    shards = {shard['ShardId']: shard for shard in
+              kinesis.list_shards(StreamName='s')['Shards']}
+    assert 'EndingSequenceNumber' in \
+        shards['shardId-000000000000']['SequenceNumberRange']
+    assert [shards[child]['ParentShardId'] for child in children] == \
+        ['shardId-000000000000'] * 2
+
+    iterator = kinesis.get_shard_iterator(
+        StreamName='s', ShardId='shardId-000000000000',
+        ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+    response = kinesis.get_records(ShardIterator=iterator)
+    assert [record['Data'] for record in response['Records']] == [b'before']
+    assert response['NextShardIterator'] is None
+
+
+def test_fake_guardian_session_pages():
+    """
+    Test that the fake session serves pages in the API's shape.
+    """
+    session = FakeGuardianSession(build_articles(25))
+
+    response = session.get('url', params={'page': 3, 'page-size': 10})
+    data = response.json()['response']
+
+    assert data['pages'] == 3
+    assert len(data['results']) == 5
+    assert b''.join(response.iter_content(7)) == response.content
+
+
+def test_run_reports_every_stage():
+    """
+    Test that a run measures each stage at each size.
+    """
+    report = run(sizes=['3'], iterations=2)
+
+    assert set(report['results']) == {
+        'api_interaction/3', 'format_article/3', 'format_articles/3',
+        'format_articles_parallel/3', 'send_to_kinesis/3',
+        'send_batch_to_kinesis/3', 'main/3'}
+    result = report['results']['main/3']
+    assert result['items'] == 3
+    assert result['p50_ms'] <= result['p99_ms']
+    assert result['peak_kib'] > 0
+
+
+def test_compare_flags_only_real_regressions():
+    """
+    Test that compare() reports stages slower than the tolerance, and
+    ignores small absolute changes and stages missing from the baseline.
+    """
+    baseline = {'results': {'main/small': {'p50_ms': 10.0},
+                            'fast/small': {'p50_ms': 0.01}}}
+    current = {'results': {'main/small': {'p50_ms': 13.0},
+                           'fast/small': {'p50_ms': 0.05},
+                           'new/small': {'p50_ms': 5.0}}}
+
+    assert compare(current, baseline, tolerance=0.5) == []
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('main/small')
+
+
+def test_bench_brokers_measures_both_backends():
+    """
+    Test that the broker benchmark publishes every record through both
+    backends and reads them all back from the file log.
+    """
+    results = run_brokers(articles=50, batch_size=20, kinesis_latency=0)
+
+    assert set(results) == {'kinesis', 'file', 'file_read'}
+    assert all(row['records'] == 50 for row in results.values())
+    assert results['file']['records_per_s'] > 0
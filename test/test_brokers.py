@@ -0,0 +1,143 @@
+"""This module contains the test suite for the broker backends:
+get_broker(), KinesisBroker and the FileBroker segment log.
+"""
+
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import threading
+import pytest
+from src.brokers import FileBroker, KinesisBroker, get_broker
+from src.format_article import ArticleRecord
+from src.main import main
+from src.serializers import decode_payload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def record(index):
+    return ArticleRecord('2024-01-01T00:00:00Z', f'Article {index}',
+                         f'https://g/{index}', 'preview')
+
+
+def test_get_broker_picks_backend_from_uri(tmp_path):
+    """
+    Test that stream names and kinesis:// URIs give a KinesisBroker,
+    file:// URIs a FileBroker with their options, and brokers are
+    returned unchanged.
+    """
+    assert get_broker('my-stream').stream_name == 'my-stream'
+    assert get_broker('kinesis://my-stream').stream_name == 'my-stream'
+    broker = get_broker(f'file://{tmp_path}/log?partitions=2')
+    assert isinstance(broker, FileBroker)
+    assert broker.partitions == 2
+    assert get_broker(broker) is broker
+    with pytest.raises(ValueError, match='Unknown broker scheme'):
+        get_broker('ftp://somewhere')
+
+
+def test_kinesis_broker_sends_with_options(mocker):
+    """
+    Test that KinesisBroker passes its spool and options through to
+    send_to_kinesis() and send_batch_to_kinesis().
+    """
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+    mock_batch = mocker.patch('src.brokers.send_batch_to_kinesis')
+    broker = KinesisBroker('stream', spool='spool', compression='gzip')
+
+    broker.publish(['a'], partition_key='pk')
+    broker.publish_batch(['a'], partitioner='pk')
+
+    mock_send.assert_called_once_with(
+        ['a'], 'stream', spool='spool', compression='gzip',
+        partition_key='pk')
+    mock_batch.assert_called_once_with(
+        ['a'], 'stream', partitioner='pk', spool='spool', compression='gzip')
+
+
+def test_file_broker_round_trip(tmp_path):
+    """
+    Test that published messages are read back in order with their
+    offsets, routed to partitions by key.
+    """
+    broker = FileBroker(str(tmp_path), partitions=3)
+
+    first = broker.publish([record(0), record(1)], partition_key='k')
+    second = broker.publish([record(2)], partition_key='k')
+    summary = broker.publish_batch([record(index) for index in range(10)])
+
+    assert first == (broker.partition_for('k'), 0)
+    assert second == (first[0], 1)
+    assert summary == {'user_records': 10, 'records': 10}
+    messages = broker.read(first[0])
+    assert [offset for offset, _ in messages][:2] == [0, 1]
+    assert json.loads(messages[0][1])[1]['webTitle'] == 'Article 1'
+    batch = [decode_payload(message)['webTitle']
+             for partition in range(3)
+             for _, message in broker.read(partition)
+             if not message.startswith(b'[')]
+    assert sorted(batch) == sorted(f'Article {index}' for index in range(10))
+    assert broker.publish([]) is None
+    broker.close()
+
+
+def test_file_broker_rolls_segments_and_reopens(tmp_path):
+    """
+    Test that the log continues over several segments, including one
+    larger than the segment size, and carries on after being reopened.
+    """
+    broker = FileBroker(str(tmp_path), partitions=1, segment_bytes=256)
+    for index in range(20):
+        broker.publish([record(index)])
+    broker.publish([record(20)] * 10)
+    broker.close()
+    assert len(os.listdir(tmp_path / '0000')) > 2
+
+    reopened = FileBroker(str(tmp_path), partitions=4, segment_bytes=256)
+    assert reopened.partitions == 1
+    assert reopened.publish([record(21)]) == (0, 21)
+    messages = reopened.read(0, offset=19)
+    assert [offset for offset, _ in messages] == [19, 20, 21]
+    assert len(json.loads(messages[1][1])) == 10
+    reopened.close()
+
+
+def test_file_broker_can_be_tailed_from_another_process(tmp_path):
+    """
+    Test that tail() follows messages appended by another process.
+    """
+    FileBroker(str(tmp_path), partitions=1, segment_bytes=512)
+    code = (
+        'import sys; from src.brokers import FileBroker; '
+        f'broker = FileBroker({str(tmp_path)!r}); '
+        '[broker.publish([{"n": n}]) for n in range(50)]; broker.close()')
+    writer = subprocess.Popen([sys.executable, '-c', code],  # nosec B603
+                              cwd=ROOT)
+    reader = FileBroker(str(tmp_path))
+    stop = threading.Event()
+    timer = threading.Timer(10, stop.set)
+    timer.start()
+    seen = []
+    for offset, message in reader.tail(0, poll_interval=0.01, stop=stop):
+        seen.append((offset, json.loads(message)[0]['n']))
+        if len(seen) == 50:
+            break
+    timer.cancel()
+    writer.wait()
+
+    assert seen == [(n, n) for n in range(50)]
+
+
+def test_main_publishes_to_file_broker(mocker, tmp_path):
+    """
+    Test that main() publishes through the broker named by a file:// URI.
+    """
+    mocker.patch('src.main.iter_articles', return_value=iter([
+        {'webTitle': 'One', 'webUrl': 'https://g/1'}]))
+
+    main('test', f'file://{tmp_path}?partitions=1')
+
+    messages = FileBroker(str(tmp_path)).read(0)
+    assert [json.loads(message)[0]['webTitle']
+            for _, message in messages] == ['One']
@@ -0,0 +1,169 @@
+"""This module contains the test suite for the Kinesis consumer:
+decode_record(), ShardCheckpoint and consume(), run against FakeKinesis.
+"""
+
+import threading
+import pytest
+from botocore.exceptions import ClientError
+from benchmarks.fake_kinesis import FakeKinesis
+from src.aggregation import aggregate_entries
+from src.consume_from_kinesis import ShardCheckpoint, consume, \
+    decode_record
+from src.send_to_kinesis import send_batch_to_kinesis, send_to_kinesis
+from src.serializers import encode_payload
+
+STREAM = 'guardian_content'
+
+
+def articles(start, stop):
+    return [{'webTitle': f'Article {index}',
+             'webUrl': f'https://g/{index}'} for index in range(start, stop)]
+
+
+class Collector:
+    """A thread-safe handle() that keeps what it is given."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def __call__(self, batch):
+        with self.lock:
+            self.records.extend(batch)
+
+    def titles(self):
+        return sorted(record.article['webTitle'] for record in self.records)
+
+
+def read(kinesis, checkpoint, handle=None):
+    handle = handle or Collector()
+    stats = consume(STREAM, handle, client=kinesis, checkpoint=checkpoint,
+                    poll_interval=0.01, until_caught_up=True)
+    return handle, stats
+
+
+def test_decode_record_handles_every_producer_format():
+    """
+    Test that JSON lists, encoded payloads and aggregated records are all
+    decoded into articles.
+    """
+    plain = {'Data': b'[{"webTitle": "A"}, {"webTitle": "B"}]',
+             'PartitionKey': 'k'}
+    encoded = {'Data': encode_payload({'webTitle': 'C'}, 'json', 'gzip'),
+               'PartitionKey': 'k'}
+    aggregated = aggregate_entries([
+        {'PartitionKey': f'k{index}',
+         'Data': encode_payload({'webTitle': title})}
+        for index, title in enumerate('DE')])[0]
+
+    assert decode_record(plain) == [{'webTitle': 'A'}, {'webTitle': 'B'}]
+    assert decode_record(encoded) == [{'webTitle': 'C'}]
+    assert decode_record(aggregated) == [{'webTitle': 'D'},
+                                         {'webTitle': 'E'}]
+
+
+def test_consume_reads_every_shard_once(mocker, tmp_path):
+    """
+    Test that every article on every shard is handled once, including
+    aggregated records and a list sent as one record.
+    """
+    kinesis = FakeKinesis(shard_count=4)
+    send_batch_to_kinesis(articles(0, 40), STREAM, client=kinesis)
+    send_batch_to_kinesis(articles(40, 60), STREAM, client=kinesis,
+                          aggregate=True)
+    mocker.patch('src.send_to_kinesis.get_kinesis_client',
+                 return_value=kinesis)
+    send_to_kinesis(articles(60, 65), STREAM, partition_key='p')
+
+    handle, stats = read(kinesis, ShardCheckpoint(tmp_path / 'cp.json'))
+
+    assert handle.titles() == sorted(f'Article {index}'
+                                     for index in range(65))
+    assert stats['shards'] == 4
+    assert stats['articles'] == 65
+
+
+def test_consume_resumes_from_checkpoint(tmp_path):
+    """
+    Test that a restarted consumer neither re-reads nor skips records.
+    """
+    kinesis = FakeKinesis(shard_count=2)
+    path = tmp_path / 'cp.json'
+    send_batch_to_kinesis(articles(0, 10), STREAM, client=kinesis)
+    first, _ = read(kinesis, ShardCheckpoint(path))
+
+    send_batch_to_kinesis(articles(10, 15), STREAM, client=kinesis)
+    second, _ = read(kinesis, ShardCheckpoint(path))
+
+    assert len(first.records) == 10
+    assert second.titles() == sorted(f'Article {index}'
+                                     for index in range(10, 15))
+
+
+def test_consume_reads_parents_before_children(tmp_path):
+    """
+    Test that after a shard split the parent is read to its end before
+    either child, and that both children are then read.
+    """
+    kinesis = FakeKinesis(shard_count=1)
+    send_batch_to_kinesis(articles(0, 20), STREAM, client=kinesis)
+    kinesis.split_shard('shardId-000000000000')
+    send_batch_to_kinesis(articles(20, 40), STREAM, client=kinesis)
+
+    handle, stats = read(kinesis, ShardCheckpoint(tmp_path / 'cp.json'))
+
+    shards = [record.shard_id for record in handle.records]
+    assert shards[:20] == ['shardId-000000000000'] * 20
+    assert set(shards[20:]) == {'shardId-000000000001',
+                                'shardId-000000000002'}
+    assert handle.titles() == sorted(f'Article {index}'
+                                     for index in range(40))
+    assert stats['shards'] == 3
+
+    again, _ = read(kinesis, ShardCheckpoint(tmp_path / 'cp.json'))
+    assert again.records == []
+
+
+def test_consume_does_not_checkpoint_a_failed_batch(tmp_path):
+    """
+    Test that an error in handle() stops the consumer and is raised,
+    and that the batch is delivered again on the next run.
+    """
+    kinesis = FakeKinesis(shard_count=1)
+    path = tmp_path / 'cp.json'
+    send_batch_to_kinesis(articles(0, 3), STREAM, client=kinesis)
+
+    def fail(batch):
+        raise RuntimeError('handler failed')
+
+    with pytest.raises(RuntimeError, match='handler failed'):
+        read(kinesis, ShardCheckpoint(path), handle=fail)
+
+    handle, _ = read(kinesis, ShardCheckpoint(path))
+    assert len(handle.records) == 3
+
+
+def test_consume_retries_throttled_reads(mocker, tmp_path):
+    """
+    Test that a throttled GetRecords call is retried.
+    """
+    kinesis = FakeKinesis(shard_count=1)
+    send_batch_to_kinesis(articles(0, 2), STREAM, client=kinesis)
+    throttled = ClientError(
+        {'Error': {'Code': 'ProvisionedThroughputExceededException',
+                   'Message': 'Rate exceeded'}}, 'GetRecords')
+    get_records = kinesis.get_records
+    responses = iter([throttled])
+
+    def flaky_get_records(**kwargs):
+        error = next(responses, None)
+        if error is not None:
+            raise error
+        return get_records(**kwargs)
+
+    mocker.patch.object(kinesis, 'get_records', side_effect=flaky_get_records)
+
+    handle, _ = read(kinesis, ShardCheckpoint(tmp_path / 'cp.json'))
+
+    assert len(handle.records) == 2
+    assert kinesis.get_records.call_count >= 2
@@ -4,7 +4,12 @@ for the format_article() function only.
 
 import pytest
 from unittest.mock import Mock  # noqa
-from src.format_article import format_article
+import json
+from concurrent.futures import ThreadPoolExecutor
+from src.format_article import (
+    format_article, format_articles, fields_for_preview, ArticleRecord,
+    records_to_json_bytes, format_articles_parallel, get_format_pool,
+    shutdown_format_pool)
 
 
 def test_format_article_valid():
@@ -30,7 +35,7 @@ def test_format_article_valid():
         "webPublicationDate": "2023-11-21T11:11:31Z",
         "webTitle": "Who said what: using machine learning to correctly attribute quotes",  # noqa
         "webUrl": "https://www.theguardian.com/info/2023/nov/21/who-said-what-using-machine-learning-to-correctly-attribute-quotes",  # noqa
-        "content_preview": "<p>This is the full content of the article.</p>"
+        "content_preview": "This is the full content of the article."
     }
 
     result = format_article(mock_data)
@@ -93,3 +98,217 @@ def test_format_article_empty_dict():
 
     result = format_article(article)
     assert result == expected_output
+
+
+def test_format_article_trail_text_fallback():
+    """
+    Test that the format_article function uses the trailText as the
+    content preview when the body was not requested.
+    """
+    article = {
+        "webTitle": "Test Article",
+        "fields": {"trailText": "A short standfirst."}
+    }
+
+    result = format_article(article)
+    assert result["content_preview"] == "A short standfirst."
+
+
+def test_fields_for_preview():
+    """
+    Test that fields_for_preview returns the fields each preview
+    source needs and rejects unknown sources.
+    """
+    assert fields_for_preview() == 'trailText,body'
+    assert fields_for_preview('trailText') == 'trailText'
+
+    with pytest.raises(ValueError, match='Unknown preview source'):
+        fields_for_preview('headline')
+
+
+def test_format_article_strips_markup():
+    """
+    Test that the format_article function builds the content preview
+    from visible text only, limited to 1000 characters.
+    """
+    body = '<p>Caf&eacute; <a href="https://x">news</a></p>' + \
+        '<p>' + 'word ' * 500 + '</p>'
+    article = {"webTitle": "Test", "fields": {"body": body}}
+
+    preview = format_article(article)["content_preview"]
+
+    assert preview.startswith("Café news word word")
+    assert 990 < len(preview) <= 1000
+    assert '<' not in preview
+
+
+batch = [
+    {
+        "webPublicationDate": "2023-11-21T11:11:31Z",
+        "webTitle": "Quotes \"attributed\" by caf\u00e9 staff",
+        "webUrl": "https://www.theguardian.com/info/article-1",
+        "fields": {"body": "<p>Body &amp; more.</p>"}
+    },
+    {
+        "webTitle": "Trail only",
+        "fields": {"trailText": "A short standfirst."}
+    },
+    {}
+]
+
+
+def test_format_articles_matches_format_article():
+    """
+    Test that format_articles returns records equal to the dicts
+    format_article returns for each article.
+    """
+    records = format_articles(iter(batch))
+
+    assert all(isinstance(record, ArticleRecord) for record in records)
+    assert records == [format_article(article) for article in batch]
+    assert records[0]['content_preview'] == 'Body & more.'
+    assert records[1].get('webUrl') is None
+    assert records[1].get('missing', 'default') == 'default'
+
+
+def test_format_articles_validates_batch():
+    """
+    Test that format_articles raises a TypeError naming the first
+    item that is not a dictionary, before formatting anything.
+    """
+    with pytest.raises(TypeError, match="at index 1"):
+        format_articles([{}, ["Not", "a", "dict"]])
+
+
+def test_article_record_is_compact():
+    """
+    Test that ArticleRecord has no per-instance dict.
+    """
+    record = format_articles([batch[0]])[0]
+
+    assert not hasattr(record, '__dict__')
+    with pytest.raises(KeyError):
+        record['fields']
+
+
+def test_article_record_json_matches_json_dumps():
+    """
+    Test that records serialize to the same bytes as json.dumps of
+    the equivalent dicts.
+    """
+    records = format_articles(batch)
+    dicts = [record.to_dict() for record in records]
+
+    assert records[0].to_json_bytes() == json.dumps(dicts[0]).encode()
+    assert records_to_json_bytes(records) == json.dumps(dicts).encode()
+    assert json.loads(records_to_json_bytes(records)) == dicts
+
+
+def parallel_articles(count):
+    articles = []
+    for index in range(count):
+        fields = [{'body': f'<p>Body <b>{index}</b> &amp; more</p>'},
+                  {'trailText': f'Trail {index}'}, {}][index % 3]
+        articles.append({'webPublicationDate': f'2024-01-{index % 28 + 1:02d}',
+                         'webTitle': f'Title {index}', 'webUrl': index,
+                         'fields': fields})
+    return articles
+
+
+def test_format_articles_parallel_matches_in_process():
+    """
+    Test that formatting on worker processes gives the same records, in
+    the same order, as format_articles().
+    """
+    articles = parallel_articles(50)
+    try:
+        records = format_articles_parallel(
+            articles, max_workers=2, chunk_size=7, min_articles=10)
+    finally:
+        shutdown_format_pool()
+
+    assert records == format_articles(articles)
+    assert [record.webUrl for record in records] == \
+        [str(index) for index in range(50)]
+
+
+def test_format_articles_parallel_falls_back_in_process(mocker):
+    """
+    Test that small batches, and environments without worker processes,
+    are formatted in process.
+    """
+    articles = parallel_articles(12)
+    get_pool = mocker.patch('src.format_article.get_format_pool')
+
+    assert format_articles_parallel(articles, max_workers=4) == \
+        format_articles(articles)
+    get_pool.assert_not_called()
+
+    get_pool.return_value.map.side_effect = OSError('no /dev/shm')
+    assert format_articles_parallel(
+        articles, max_workers=4, min_articles=1) == format_articles(articles)
+    get_pool.assert_called_once_with(4)
+
+
+def test_format_articles_parallel_uses_given_executor():
+    """
+    Test that a given executor is used for the chunks, and that items
+    that are not dictionaries are rejected.
+    """
+    articles = parallel_articles(9)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert format_articles_parallel(
+            articles, min_articles=1, chunk_size=2, executor=executor) == \
+            format_articles(articles)
+        with pytest.raises(TypeError, match='index 1'):
+            format_articles_parallel([{}, 'x'], min_articles=1,
+                                     executor=executor)
+
+
+def test_get_format_pool_keeps_shared_pools(mocker):
+    """
+    Test that the shared pool does not fork its workers, and that asking
+    for another size gives a separate pool rather than shutting down the
+    one other threads may be using.
+    """
+    executor = mocker.patch('concurrent.futures.ProcessPoolExecutor')
+    executor.side_effect = lambda **kwargs: mocker.Mock(**kwargs)
+    try:
+        first = get_format_pool(2)
+        other = get_format_pool(3)
+
+        assert get_format_pool(2) is first
+        assert other is not first
+        first.shutdown.assert_not_called()
+        assert first.mp_context.get_start_method() != 'fork'
+    finally:
+        shutdown_format_pool()
+    first.shutdown.assert_called_once_with()
+
+
+def test_format_articles_parallel_replaces_broken_pool(mocker):
+    """
+    Test that a shared pool whose workers died is discarded, so the next
+    call starts a new one, while a given executor is left alone.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    executor = mocker.patch('concurrent.futures.ProcessPoolExecutor')
+    executor.side_effect = lambda **kwargs: mocker.Mock(**kwargs)
+    articles = parallel_articles(12)
+    try:
+        broken = get_format_pool(2)
+        broken.map.side_effect = BrokenProcessPool('worker died')
+
+        assert format_articles_parallel(
+            articles, max_workers=2, min_articles=1) == \
+            format_articles(articles)
+        broken.shutdown.assert_called_once_with(wait=False)
+        assert get_format_pool(2) is not broken
+
+        given = mocker.Mock()
+        given.map.side_effect = BrokenProcessPool('worker died')
+        format_articles_parallel(articles, min_articles=1, executor=given)
+        given.shutdown.assert_not_called()
+    finally:
+        shutdown_format_pool()
@@ -0,0 +1,155 @@
+"""This module contains the test suite for
+the Lambda handler() and warm_up() functions.
+"""
+
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import pytest
+from unittest.mock import patch
+from src.handler import handler, warm_up
+from src.metrics import set_collector
+from src.send_to_kinesis import get_kinesis_client
+
+
+@pytest.fixture
+def warm(mocker):
+    """Stands in for the HTTP session, Kinesis client and API key."""
+    return mocker.patch('src.handler.warm_up')
+
+
+def test_handler_runs_main(mocker, warm):
+    """
+    Test that handler() runs main() for the event's query and stream.
+    """
+    mock_main = mocker.patch('src.handler.main')
+
+    result = handler({'query': 'ai', 'broker_id': 'stream',
+                      'date_from': '2024-01-01', 'max_articles': 5}, None)
+
+    warm.assert_called_once_with('stream')
+    mock_main.assert_called_once_with(
+        'ai', 'stream', date_from='2024-01-01', max_articles=5)
+    assert result == {'statusCode': 200, 'queries': ['ai']}
+
+
+def test_handler_runs_main_multi(mocker, warm, monkeypatch):
+    """
+    Test that handler() fans out a list of queries with main_multi(),
+    taking the stream from the environment.
+    """
+    monkeypatch.setenv('Kinesis_Stream_Name', 'env-stream')
+    mock_multi = mocker.patch('src.handler.main_multi')
+
+    handler({'queries': ['ai', 'ml']}, None)
+
+    mock_multi.assert_called_once_with(
+        ['ai', 'ml'], 'env-stream', date_from=None, max_articles=10)
+
+
+def test_handler_rejects_incomplete_events(warm, monkeypatch):
+    """
+    Test that handler() raises ValueError without a query or stream.
+    """
+    monkeypatch.delenv('Kinesis_Stream_Name', raising=False)
+
+    with pytest.raises(ValueError, match='query'):
+        handler({'broker_id': 'stream'}, None)
+    with pytest.raises(ValueError, match='broker_id'):
+        handler({'query': 'ai'}, None)
+    warm.assert_not_called()
+
+
+def test_warm_up_reuses_clients(mocker):
+    """
+    Test that the Kinesis client and HTTP session are created once and
+    reused by later invocations.
+    """
+    mocker.patch('src.handler.get_api_key', return_value='key')
+    mock_session = mocker.patch('src.handler.get_session')
+
+    with patch('boto3.client') as mock_boto_client:
+        warm_up()
+        warm_up()
+        assert get_kinesis_client() is mock_boto_client.return_value
+
+    mock_boto_client.assert_called_once_with('kinesis')
+    assert mock_session.call_count == 2
+
+
+def test_warm_up_skips_kinesis_for_file_broker(mocker):
+    """
+    Test that warm_up() only creates the Kinesis client for a broker
+    that sends to Kinesis.
+    """
+    mocker.patch('src.handler.get_api_key', return_value='key')
+    mocker.patch('src.handler.get_session')
+    mock_client = mocker.patch('src.handler.get_kinesis_client')
+
+    warm_up('file:///tmp/guardian-log?partitions=2')
+    mock_client.assert_not_called()
+
+    warm_up('kinesis://stream')
+    warm_up('stream')
+    assert mock_client.call_count == 2
+
+
+def test_warm_up_requires_api_key(mocker):
+    """
+    Test that warm_up() raises ValueError if the API key is missing.
+    """
+    mocker.patch('src.handler.get_api_key', return_value=None)
+
+    with pytest.raises(ValueError, match='API key is missing'):
+        warm_up()
+
+
+def test_importing_handler_defers_heavy_imports():
+    """
+    Test that importing the handler does not import boto3, requests,
+    python-dotenv or asyncio, which are loaded on first use instead.
+    """
+    code = ('import json, sys, src.handler; print(json.dumps(['
+            'name for name in ("boto3", "botocore", "requests", "dotenv", '
+            '"asyncio") if name in sys.modules]))')
+    output = subprocess.run(  # nosec B603
+        [sys.executable, '-c', code], capture_output=True, text=True,
+        check=True, cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+
+    assert json.loads(output) == []
+
+
+def test_handler_writes_emf_metrics(mocker, warm, capsys, monkeypatch):
+    """
+    Test that handler() writes the invocation's metrics as an EMF line,
+    and writes none when metrics are turned off.
+    """
+    mocker.patch('src.handler.main')
+
+    handler({'query': 'ai', 'broker_id': 'stream'}, None)
+
+    record = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert len(record['invocation_ms']) == 1
+    assert record['Service'] == 'guardian-streaming'
+
+    set_collector(None)
+    monkeypatch.setenv('Guardian_Metrics', 'off')
+    handler({'query': 'ai', 'broker_id': 'stream'}, None)
+    assert capsys.readouterr().out == ''
+
+
+def test_handler_runs_profiler_when_configured(mocker, warm, monkeypatch):
+    """
+    Test that handler() runs the sampling profiler and logs its report
+    when Guardian_Profile_Interval is set, even if the invocation fails.
+    """
+    monkeypatch.setenv('Guardian_Metrics', 'off')
+    monkeypatch.setenv('Guardian_Profile_Interval', '0.001')
+    mocker.patch('src.handler.main', side_effect=RuntimeError('boom'))
+    log_report = mocker.patch('src.handler.SamplingProfiler.log_report')
+
+    with pytest.raises(RuntimeError):
+        handler({'query': 'ai', 'broker_id': 'stream'}, None)
+
+    log_report.assert_called_once()
@@ -2,9 +2,12 @@
 the main() function only.
 """
 
+import time
 import pytest
 from unittest.mock import patch, MagicMock  # noqa
-from src.main import main
+from src.main import main, main_multi, merge_results
+from src.relevance_filter import RelevanceFilter
+from src.watermark import WatermarkStore
 
 mock_data = {
     'response': {
@@ -34,22 +37,26 @@ def test_main_success(mocker):
     function is called successfully.
     """
     mock_interaction = mocker.patch(
-        'src.main.api_interaction',
-        return_value=mock_data)
+        'src.main.iter_articles',
+        return_value=iter(mock_data['response']['results']))
     mock_format = mocker.patch(
-        'src.main.format_article',
-        side_effect=lambda article: article)
-    mock_send = mocker.patch('src.main.send_to_kinesis')
+        'src.main.format_articles',
+        side_effect=lambda articles: list(articles))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
 
     main('test', 'test-kinesis-stream', '2024-01-01')
 
-    mock_interaction.assert_called_once_with('test', '2024-01-01')
+    mock_interaction.assert_called_once_with(
+        'test', '2024-01-01', page_size=10, max_articles=10,
+        order_by='newest', show_fields='trailText,body', cache=None,
+        stream=False)
 
-    assert mock_format.call_count == 2
+    mock_format.assert_called_once_with(mock_data['response']['results'])
 
-    mock_send.assert_called_once_with(
-        mock_data['response']['results'],
-        'test-kinesis-stream')
+    mock_send.assert_called_once()
+    assert mock_send.call_args.args == (
+        mock_data['response']['results'], 'test-kinesis-stream')
+    assert mock_send.call_args.kwargs['spool'] is None
 
 
 def test_main_no_articles_found(mocker):
@@ -57,20 +64,21 @@ def test_main_no_articles_found(mocker):
     Test that the main() function raises a
     ValueError when no articles are found.
     """
-    empty_data = {'response': {'status': 'ok', 'results': []}}
-    mocker.patch('src.main.api_interaction', return_value=empty_data)
-    mocker.patch('src.main.send_to_kinesis')
+    mocker.patch('src.main.iter_articles', return_value=iter([]))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
 
     with pytest.raises(ValueError, match="No articles found for the given query and date!"):  # noqa
         main('test', 'test-kinesis-stream', '2024-01-01')
 
+    mock_send.assert_not_called()
+
 
 def test_main_api_exception(mocker):
     """
     Test that the main() function raises an Exception
     if api_interaction() throws an error.
     """
-    mocker.patch('src.main.api_interaction',
+    mocker.patch('src.main.iter_articles',
                  side_effect=Exception("API interaction failed"))
 
     with pytest.raises(Exception, match="API interaction failed"):
@@ -80,10 +88,11 @@ def test_main_api_exception(mocker):
 def test_main_format_exception(mocker):
     """
     Test that the main() function raises an Exception
-    if format_article() throws an error.
+    if format_articles() throws an error.
     """
-    mocker.patch('src.main.api_interaction', return_value=mock_data)
-    mocker.patch('src.main.format_article',
+    mocker.patch('src.main.iter_articles',
+                 return_value=iter(mock_data['response']['results']))
+    mocker.patch('src.main.format_articles',
                  side_effect=Exception('Error with formatting'))
 
     with pytest.raises(Exception, match='Error with formatting'):
@@ -95,12 +104,408 @@ def test_main_kinesis_exception(mocker):
     Test that the main() function raises an Exception
     if send_to_kinesis() throws an error.
     """
-    mocker.patch('src.main.api_interaction', return_value=mock_data)
+    mocker.patch('src.main.iter_articles',
+                 return_value=iter(mock_data['response']['results']))
     mocker.patch(
-        'src.main.format_article',
-        side_effect=lambda article: article)
-    mocker.patch('src.main.send_to_kinesis',
+        'src.main.format_articles',
+        side_effect=lambda articles: list(articles))
+    mocker.patch('src.brokers.send_to_kinesis',
                  side_effect=Exception('Error with sending to Kinesis'))
 
     with pytest.raises(Exception, match='Error with sending to Kinesis'):
         main('test', 'test-kinesis-stream')
+
+
+def test_main_limits_articles(mocker):
+    """
+    Test that the main() function stops consuming articles once
+    max_articles have been formatted.
+    """
+    articles = ({'id': f'article-{i}'} for i in range(25))
+    mocker.patch('src.main.iter_articles', return_value=articles)
+    mocker.patch(
+        'src.main.format_articles',
+        side_effect=lambda articles: list(articles))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    main('test', 'test-kinesis-stream', max_articles=3)
+
+    sent = mock_send.call_args[0][0]
+    assert [article['id'] for article in sent] == [
+        'article-0', 'article-1', 'article-2']
+    assert next(articles)['id'] == 'article-3'
+
+
+def test_main_trail_text_preview(mocker):
+    """
+    Test that the main() function only requests trailText when
+    it is the preview source.
+    """
+    mock_interaction = mocker.patch(
+        'src.main.iter_articles',
+        return_value=iter(mock_data['response']['results']))
+    mocker.patch('src.brokers.send_to_kinesis')
+
+    main('test', 'test-kinesis-stream', preview='trailText')
+
+    assert mock_interaction.call_args.kwargs['show_fields'] == 'trailText'
+
+
+def test_main_unknown_preview(mocker):
+    """
+    Test that the main() function raises a ValueError for an
+    unknown preview source.
+    """
+    mock_interaction = mocker.patch('src.main.iter_articles')
+
+    with pytest.raises(ValueError, match='Unknown preview source'):
+        main('test', 'test-kinesis-stream', preview='headline')
+
+    mock_interaction.assert_not_called()
+
+
+def test_main_incremental_sends_only_new(mocker, tmp_path):
+    """
+    Test that main() in incremental mode skips articles sent by a
+    previous run and advances the stored high-water mark.
+    """
+    first_page = [
+        {'id': 'b', 'webPublicationDate': '2024-01-02T10:00:00Z'},
+        {'id': 'a', 'webPublicationDate': '2024-01-01T10:00:00Z'}
+    ]
+    mock_api = mocker.patch(
+        'src.watermark.iter_articles', return_value=iter(first_page))
+    mocker.patch(
+        'src.main.format_articles',
+        side_effect=lambda articles: list(articles))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+    store = WatermarkStore(path=str(tmp_path / 'watermarks.json'))
+
+    main('test', 'test-kinesis-stream', watermark_store=store)
+
+    assert mock_api.call_args.args == ('test', None)
+    assert mock_api.call_args.kwargs['order_by'] == 'newest'
+    assert mock_send.call_args[0][0] == first_page
+
+    second_page = [
+        {'id': 'c', 'webPublicationDate': '2024-01-02T12:00:00Z'},
+        {'id': 'b', 'webPublicationDate': '2024-01-02T10:00:00Z'},
+        {'id': 'a', 'webPublicationDate': '2024-01-01T10:00:00Z'}
+    ]
+    mock_api.return_value = iter(second_page)
+
+    main('test', 'test-kinesis-stream', watermark_store=store)
+
+    assert mock_api.call_args.args == ('test', '2024-01-02')
+    assert mock_send.call_args[0][0] == [second_page[0]]
+    assert store.get('test').latest == '2024-01-02T12:00:00Z'
+
+
+def test_main_incremental_sends_backlog_over_several_runs(mocker, tmp_path):
+    """
+    Test that main() in incremental mode sends every new article when
+    more than max_articles are new, over as many runs as it takes.
+    """
+    published = [
+        {'id': f'a{index:02d}',
+         'webPublicationDate': f'2024-01-02T{index:02d}:00:00Z'}
+        for index in range(25)]
+
+    def fake_iter_articles(query, date_from, order_by=None, **kwargs):
+        found = [item for item in published
+                 if not date_from or item['webPublicationDate'] >= date_from]
+        return iter(sorted(found, key=lambda item: item['webPublicationDate'],
+                           reverse=order_by == 'newest'))
+
+    mocker.patch('src.watermark.iter_articles',
+                 side_effect=fake_iter_articles)
+    mocker.patch('src.main.format_articles',
+                 side_effect=lambda articles: list(articles))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+    store = WatermarkStore(path=str(tmp_path / 'watermarks.json'))
+    watermark = store.get('test')
+    watermark.advance([{'id': 'seed',
+                        'webPublicationDate': '2024-01-01T23:00:00Z'}])
+    store.save('test', watermark)
+
+    for _ in range(4):
+        main('test', 'test-kinesis-stream', watermark_store=store)
+
+    sent = [item['id'] for call in mock_send.call_args_list
+            for item in call[0][0]]
+    assert sent == [item['id'] for item in published]
+    assert store.get('test').latest == published[-1]['webPublicationDate']
+
+
+def test_main_incremental_nothing_new(mocker, tmp_path):
+    """
+    Test that main() in incremental mode returns without sending or
+    raising when there are no new articles.
+    """
+    mocker.patch('src.watermark.iter_articles', return_value=iter([]))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+    store = WatermarkStore(path=str(tmp_path / 'watermarks.json'))
+
+    main('test', 'test-kinesis-stream', watermark_store=store)
+
+    mock_send.assert_not_called()
+
+
+def test_main_incremental_keeps_mark_on_failure(mocker, tmp_path):
+    """
+    Test that main() does not advance the high-water mark when
+    sending fails, so the articles are retried on the next run.
+    """
+    mocker.patch(
+        'src.watermark.iter_articles',
+        return_value=iter([{'id': 'a',
+                            'webPublicationDate': '2024-01-01T10:00:00Z'}]))
+    mocker.patch('src.main.format_articles',
+                 side_effect=lambda articles: list(articles))
+    mocker.patch('src.brokers.send_to_kinesis',
+                 side_effect=Exception('Error with sending to Kinesis'))
+    store = WatermarkStore(path=str(tmp_path / 'watermarks.json'))
+
+    with pytest.raises(Exception, match='Error with sending to Kinesis'):
+        main('test', 'test-kinesis-stream', watermark_store=store)
+
+    assert store.get('test').latest is None
+
+
+def article(article_id):
+    return {'id': article_id, 'webTitle': f'Title {article_id}',
+            'webUrl': f'https://www.theguardian.com/{article_id}',
+            'webPublicationDate': '2024-01-01T00:00:00Z'}
+
+
+def test_merge_results_tags_duplicates():
+    """
+    Test that merge_results() keeps each article once, in first-seen
+    order, tagged with every query that found it.
+    """
+    merged = merge_results([
+        ('ai', [article('a'), article('b')]),
+        ('ml', [article('b'), article('c')]),
+    ])
+
+    assert [item['id'] for item in merged] == ['a', 'b', 'c']
+    assert [item['queries'] for item in merged] == \
+        [['ai'], ['ai', 'ml'], ['ml']]
+
+
+def test_main_multi_fans_out_and_merges(mocker):
+    """
+    Test that main_multi() runs every query with the per-query limit
+    and sends the merged, deduplicated articles as one record.
+    """
+    mocker.patch('src.main.get_session')
+    found = {'ai': [article('a'), article('b'), article('x')],
+             'ml': [article('b'), article('c')]}
+    mock_iter = mocker.patch(
+        'src.main.iter_articles',
+        side_effect=lambda query, *args, **kwargs: iter(found[query]))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    main_multi(['ai', 'ml', 'ai'], 'test-kinesis-stream', '2024-01-01',
+               max_articles=2)
+
+    assert mock_iter.call_count == 2
+    mock_iter.assert_any_call(
+        'ml', '2024-01-01', page_size=2, max_articles=2,
+        order_by='newest', show_fields='trailText,body', cache=None,
+        stream=False)
+    sent, broker = mock_send.call_args.args
+    assert broker == 'test-kinesis-stream'
+    assert [item['webTitle'] for item in sent] == \
+        ['Title a', 'Title b', 'Title c']
+    assert [item['queries'] for item in sent] == \
+        [['ai'], ['ai', 'ml'], ['ml']]
+    assert set(sent[0]) == {'webPublicationDate', 'webTitle', 'webUrl',
+                            'content_preview', 'queries'}
+
+
+def test_main_multi_runs_queries_concurrently(mocker):
+    """
+    Test that slow queries overlap instead of running one after another.
+    """
+    mocker.patch('src.main.get_session')
+
+    def slow(query, *args, **kwargs):
+        time.sleep(0.1)
+        return iter([article(query)])
+
+    mocker.patch('src.main.iter_articles', side_effect=slow)
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    started = time.monotonic()
+    main_multi([f'q{i}' for i in range(20)], 'test-kinesis-stream',
+               max_workers=20)
+
+    assert time.monotonic() - started < 1
+    assert len(mock_send.call_args.args[0]) == 20
+
+
+def test_main_multi_skips_failed_queries(mocker):
+    """
+    Test that a failing query is skipped and the others are still sent.
+    """
+    mocker.patch('src.main.get_session')
+
+    def fetch(query, *args, **kwargs):
+        if query == 'bad':
+            raise Exception('API interaction failed')
+        return iter([article(query)])
+
+    mocker.patch('src.main.iter_articles', side_effect=fetch)
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    main_multi(['good', 'bad'], 'test-kinesis-stream')
+
+    assert [item['queries'] for item in mock_send.call_args.args[0]] == \
+        [['good']]
+
+
+def test_main_multi_all_queries_fail(mocker):
+    """
+    Test that main_multi() raises when every query fails.
+    """
+    mocker.patch('src.main.get_session')
+    mocker.patch('src.main.iter_articles',
+                 side_effect=Exception('API interaction failed'))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    with pytest.raises(Exception, match='API interaction failed'):
+        main_multi(['ai', 'ml'], 'test-kinesis-stream')
+
+    mock_send.assert_not_called()
+
+
+def test_main_multi_no_articles_found(mocker):
+    """
+    Test that main_multi() raises a ValueError when no query finds
+    any articles.
+    """
+    mocker.patch('src.main.get_session')
+    mocker.patch('src.main.iter_articles', return_value=iter([]))
+
+    with pytest.raises(ValueError, match='No articles found'):
+        main_multi(['ai'], 'test-kinesis-stream')
+
+
+def test_main_replays_spool_before_fetching(mocker):
+    """
+    Test that spooled records are replayed before the API is called and
+    the spool is passed on to the send.
+    """
+    calls = []
+    mocker.patch('src.main.replay_spool',
+                 side_effect=lambda spool: calls.append('replay'))
+    mocker.patch('src.main.iter_articles', side_effect=lambda *a, **k: (
+        calls.append('fetch') or iter(mock_data['response']['results'])))
+    mocker.patch('src.main.format_articles',
+                 side_effect=lambda articles: list(articles))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+    spool = MagicMock()
+
+    main('test', 'test-kinesis-stream', spool=spool)
+
+    assert calls == ['replay', 'fetch']
+    assert mock_send.call_args.kwargs['spool'] is spool
+
+
+def test_main_broker_outage_costs_no_api_calls(mocker):
+    """
+    Test that if the spool cannot be replayed, main() stops before
+    fetching anything.
+    """
+    mocker.patch('src.main.replay_spool',
+                 side_effect=ConnectionError('stream unavailable'))
+    mock_iter = mocker.patch('src.main.iter_articles')
+
+    with pytest.raises(ConnectionError):
+        main('test', 'test-kinesis-stream', spool=MagicMock())
+
+    mock_iter.assert_not_called()
+
+
+def test_main_drops_irrelevant_articles(mocker):
+    """
+    Test that main() sends only the articles the relevance filter keeps,
+    and sends nothing when it keeps none.
+    """
+    mocker.patch('src.main.iter_articles',
+                 side_effect=lambda *args, **kwargs: iter(
+                     mock_data['response']['results']))
+    mock_send = mocker.patch('src.brokers.send_to_kinesis')
+
+    main('test', 'test-kinesis-stream',
+         relevance=RelevanceFilter(include=['article 2']))
+
+    sent = mock_send.call_args.args[0]
+    assert [record.webTitle for record in sent] == ['Test Article 2']
+
+    mock_send.reset_mock()
+    main('test', 'test-kinesis-stream',
+         relevance=RelevanceFilter(exclude=['test']))
+    mock_send.assert_not_called()
+
+
+def test_main_does_not_report_success_when_spooled(mocker, caplog):
+    """
+    Test that main() warns rather than reporting success when records
+    were spooled instead of sent.
+    """
+    mocker.patch('src.main.iter_articles',
+                 side_effect=lambda *args, **kwargs: iter(
+                     mock_data['response']['results']))
+    mocker.patch('src.main.replay_spool')
+    mocker.patch('src.brokers.send_to_kinesis',
+                 return_value={'records': 0, 'spooled': 1})
+
+    with caplog.at_level('INFO'):
+        main('test', 'test-kinesis-stream', spool=MagicMock())
+
+    assert 'successfully' not in caplog.text
+    assert '1 record(s) could not be sent' in caplog.text
+
+
+def test_main_partitions_records_by_query(mocker):
+    """
+    Test that main() sends each query's record with a partition key
+    derived from the query, not a constant, so queries spread over
+    shards.
+    """
+    mocker.patch('src.main.iter_articles',
+                 side_effect=lambda *args, **kwargs: iter(
+                     mock_data['response']['results']))
+    mock_client = mocker.patch(
+        'src.send_to_kinesis.get_kinesis_client').return_value
+
+    main('politics', 'test-kinesis-stream')
+    main('sport', 'test-kinesis-stream')
+
+    keys = [call.kwargs['PartitionKey']
+            for call in mock_client.put_record.call_args_list]
+    assert len(keys) == 2
+    assert 'guardian_content' not in keys
+    assert keys[0] != keys[1]
+
+
+def test_main_caps_page_size(mocker):
+    """
+    Test that main() and main_multi() never ask for more than the API's
+    largest page size, however many articles are wanted.
+    """
+    mock_iter = mocker.patch(
+        'src.main.iter_articles',
+        side_effect=lambda *args, **kwargs: iter(
+            mock_data['response']['results']))
+    mocker.patch('src.brokers.send_to_kinesis')
+
+    main('test', 'test-kinesis-stream', max_articles=500)
+    main_multi(['a', 'b'], 'test-kinesis-stream', max_articles=500)
+
+    assert {call.kwargs['page_size'] for call in mock_iter.call_args_list} \
+        == {200}
+    assert {call.kwargs['max_articles']
+            for call in mock_iter.call_args_list} == {500}
@@ -0,0 +1,140 @@
+"""This module contains the test suite for the instrumentation layer:
+timer(), count(), MetricsCollector, EmfEmitter and SamplingProfiler.
+"""
+
+import io
+import json
+import time
+from src.format_article import format_articles
+from src.metrics import EmfEmitter, MetricsCollector, SamplingProfiler, \
+    count, get_collector, set_collector, timer
+from src.send_to_kinesis import send_batch_to_kinesis
+
+
+def test_hooks_do_nothing_without_a_collector():
+    """
+    Test that timer() and count() are no-ops until a collector is set.
+    """
+    assert get_collector() is None
+    with timer('format'):
+        count('records_formatted', 3)
+
+
+def test_collector_records_timings_and_counters():
+    """
+    Test that the installed collector receives stage timings and counters,
+    and that flush() returns them and resets it.
+    """
+    collector = MetricsCollector()
+    set_collector(collector)
+
+    with timer('http_request'):
+        time.sleep(0.01)
+    with timer('http_request'):
+        pass
+    count('cache_hits')
+    count('response_bytes', 100)
+    count('response_bytes', 50)
+
+    snapshot = collector.flush()
+
+    assert snapshot['timings']['http_request']['count'] == 2
+    assert snapshot['timings']['http_request']['max_ms'] >= 10
+    assert snapshot['counters'] == {'cache_hits': 1, 'response_bytes': 150}
+    assert collector.snapshot() == {'timings': {}, 'counters': {}}
+
+
+def test_emf_emitter_writes_embedded_metric_format():
+    """
+    Test that EmfEmitter.flush() writes EMF JSON lines declaring each
+    metric with its unit, namespace and dimensions.
+    """
+    stream = io.StringIO()
+    emitter = EmfEmitter(dimensions={'Service': 'test'}, stream=stream)
+    emitter.timing('kinesis_put', 12.5)
+    emitter.count('kinesis_retries', 2)
+    emitter.count('payload_bytes', 1024)
+
+    emitter.flush()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record['Service'] == 'test'
+    assert record['kinesis_put_ms'] == [12.5]
+    assert record['kinesis_retries'] == 2
+    directive = record['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'GuardianStreaming'
+    assert directive['Dimensions'] == [['Service']]
+    assert {'Name': 'kinesis_put_ms', 'Unit': 'Milliseconds'} in \
+        directive['Metrics']
+    assert {'Name': 'payload_bytes', 'Unit': 'Bytes'} in directive['Metrics']
+    assert emitter.flush() == {'timings': {}, 'counters': {}}
+
+
+def test_emf_emitter_splits_long_timing_arrays():
+    """
+    Test that more than 100 values of a timing are split across records,
+    with the counters written only once.
+    """
+    emitter = EmfEmitter()
+    records = emitter.to_emf({'format': list(range(250))},
+                             {'records_formatted': 250})
+
+    assert [len(record['format_ms']) for record in records] == [100, 100, 50]
+    assert [record.get('records_formatted') for record in records] == \
+        [250, None, None]
+
+
+def test_pipeline_stages_are_instrumented(mocker):
+    """
+    Test that formatting, serialization and the Kinesis put report their
+    timings and counters.
+    """
+    collector = MetricsCollector()
+    set_collector(collector)
+    client = mocker.Mock()
+    client.put_records.side_effect = [
+        {'FailedRecordCount': 1, 'Records': [
+            {'SequenceNumber': '1'},
+            {'ErrorCode': 'ProvisionedThroughputExceededException'}]},
+        {'FailedRecordCount': 0, 'Records': [{'SequenceNumber': '2'}]},
+    ]
+    mocker.patch('boto3.client', return_value=client)
+    mocker.patch('time.sleep')
+
+    records = format_articles([
+        {'webTitle': 'One', 'webUrl': 'https://a'},
+        {'webTitle': 'Two', 'webUrl': 'https://b'}])
+    send_batch_to_kinesis(records, 'stream')
+
+    snapshot = collector.flush()
+    assert {'format', 'serialize', 'kinesis_put'} <= \
+        set(snapshot['timings'])
+    assert snapshot['timings']['kinesis_put']['count'] == 2
+    counters = snapshot['counters']
+    assert counters['records_formatted'] == 2
+    assert counters['kinesis_records'] == 2
+    assert counters['kinesis_throttles'] == 1
+    assert counters['kinesis_retries'] == 1
+    assert counters['payload_bytes'] > 0
+
+
+def test_sampling_profiler_attributes_samples_to_stages():
+    """
+    Test that the profiler counts samples taken inside a timed stage
+    against that stage.
+    """
+    def busy():
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+
+    with SamplingProfiler(interval=0.001) as profiler:
+        with timer('format'):
+            busy()
+
+    report = profiler.report()
+    assert report
+    assert any(stage == 'format' and 'busy' in location
+               for stage, location, _ in report)
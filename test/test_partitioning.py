@@ -0,0 +1,165 @@
+"""This module contains the test suite for
+the partitioning strategies only.
+"""
+
+import pytest
+from src.partitioning import (
+    by_article, by_query, fixed, list_all_shards, list_open_shards,
+    ExplicitHashKeyPartitioner)
+
+MAX_HASH_KEY = 2 ** 128 - 1
+
+article = {
+    "webPublicationDate": "2023-11-21T11:11:31Z",
+    "webTitle": "Who said what: using machine learning to correctly attribute quotes",  # noqa
+    "webUrl": "https://www.theguardian.com/info/2023/nov/21/who-said-what-using-machine-learning-to-correctly-attribute-quotes"  # noqa
+}
+
+
+def make_shard(shard_id, start, end, closed=False):
+    """Builds a shard description as returned by list_shards."""
+    sequence_range = {'StartingSequenceNumber': '1'}
+    if closed:
+        sequence_range['EndingSequenceNumber'] = '2'
+    return {
+        'ShardId': shard_id,
+        'HashKeyRange': {'StartingHashKey': str(start),
+                         'EndingHashKey': str(end)},
+        'SequenceNumberRange': sequence_range
+    }
+
+
+def two_shard_client(mocker):
+    """Builds a mock client for a stream with two open shards."""
+    half = MAX_HASH_KEY // 2
+    client = mocker.Mock()
+    client.list_shards.return_value = {'Shards': [
+        make_shard('shard-2', half + 1, MAX_HASH_KEY),
+        make_shard('shard-0', 0, MAX_HASH_KEY, closed=True),
+        make_shard('shard-1', 0, half)
+    ]}
+    return client
+
+
+def test_by_article_is_stable_and_distinct():
+    """
+    Test that by_article gives the same key for the same article and
+    different keys for different articles.
+    """
+    other = dict(article, webUrl='https://www.theguardian.com/other')
+
+    assert by_article(article) == by_article(dict(article))
+    assert by_article(article) != by_article(other)
+    assert len(by_article(article)['PartitionKey']) <= 256
+
+
+def test_by_article_falls_back_to_id():
+    """
+    Test that by_article uses the id when the article has no webUrl.
+    """
+    assert by_article({'id': 'a'}) == by_article({'id': 'a'})
+    assert by_article({'id': 'a'}) != by_article({'id': 'b'})
+
+
+def test_by_query_groups_records():
+    """
+    Test that by_query gives every record for a query the same key.
+    """
+    strategy = by_query('machine learning')
+
+    assert strategy(article) == strategy({'webUrl': 'other'})
+    assert strategy(article) != by_query('football')(article)
+
+
+def test_fixed_rejects_invalid_keys():
+    """
+    Test that fixed raises a ValueError for empty or long keys.
+    """
+    assert fixed('guardian_content')(article) == {
+        'PartitionKey': 'guardian_content'}
+    with pytest.raises(ValueError):
+        fixed('')
+    with pytest.raises(ValueError):
+        fixed('k' * 257)
+
+
+def test_list_open_shards_pages_and_sorts(mocker):
+    """
+    Test that list_open_shards follows NextToken, drops closed
+    shards and sorts by starting hash key.
+    """
+    client = mocker.Mock()
+    client.list_shards.side_effect = [
+        {'Shards': [make_shard('b', 10, 20)], 'NextToken': 'token'},
+        {'Shards': [make_shard('a', 0, 9), make_shard('c', 0, 20, True)]}
+    ]
+
+    shards = list_open_shards(client, 'stream')
+
+    assert [shard['ShardId'] for shard in shards] == ['a', 'b']
+    assert client.list_shards.call_args_list[1].kwargs == {
+        'NextToken': 'token'}
+
+
+def test_list_all_shards_keeps_closed_shards(mocker):
+    """
+    Test that list_all_shards follows NextToken and keeps closed
+    shards, in the order they were listed.
+    """
+    client = mocker.Mock()
+    client.list_shards.side_effect = [
+        {'Shards': [make_shard('b', 10, 20)], 'NextToken': 'token'},
+        {'Shards': [make_shard('c', 0, 20, True)]}
+    ]
+
+    shards = list_all_shards(client, 'stream')
+
+    assert [shard['ShardId'] for shard in shards] == ['b', 'c']
+
+
+def test_explicit_hash_key_partitioner_spreads_evenly(mocker):
+    """
+    Test that ExplicitHashKeyPartitioner alternates between the
+    open shards, using a hash key inside each shard's range.
+    """
+    client = two_shard_client(mocker)
+    partitioner = ExplicitHashKeyPartitioner(client, 'stream')
+
+    keys = [int(partitioner(article)['ExplicitHashKey'])
+            for _ in range(4)]
+
+    half = MAX_HASH_KEY // 2
+    assert keys[0] <= half < keys[1]
+    assert keys[0] == keys[2] and keys[1] == keys[3]
+    assert partitioner(article)['PartitionKey'] == by_article(
+        article)['PartitionKey']
+
+
+def test_explicit_hash_key_partitioner_caches_shards(mocker):
+    """
+    Test that ExplicitHashKeyPartitioner only calls list_shards again
+    once the cached shard map has expired.
+    """
+    client = two_shard_client(mocker)
+    clock = mocker.patch('src.partitioning.time.monotonic', return_value=0)
+    partitioner = ExplicitHashKeyPartitioner(client, 'stream', ttl=60)
+
+    for _ in range(10):
+        partitioner(article)
+    assert client.list_shards.call_count == 1
+
+    clock.return_value = 61
+    partitioner(article)
+    assert client.list_shards.call_count == 2
+
+
+def test_explicit_hash_key_partitioner_no_open_shards(mocker):
+    """
+    Test that ExplicitHashKeyPartitioner raises a ValueError when
+    the stream has no open shards.
+    """
+    client = mocker.Mock()
+    client.list_shards.return_value = {'Shards': []}
+
+    with pytest.raises(ValueError, match='no open shards'):
+        ExplicitHashKeyPartitioner(client, 'stream')(article)
@@ -0,0 +1,207 @@
+"""This module contains the test suite for
+the run_pipeline() and run_query_pipeline() functions.
+"""
+
+import threading
+import time
+import pytest
+from src.pipeline import run_pipeline, run_query_pipeline, \
+    deadline_from_context
+
+
+def identity(batch):
+    return list(batch)
+
+
+def test_run_pipeline_sends_everything_in_order():
+    """
+    Test that every article is formatted and sent, in source order,
+    in batches of at most batch_size.
+    """
+    sent = []
+    stats = run_pipeline(range(25), identity, sent.append, batch_size=10,
+                         linger=5)
+
+    assert [item for batch in sent for item in batch] == list(range(25))
+    assert all(len(batch) <= 10 for batch in sent)
+    assert stats['fetched'] == stats['formatted'] == stats['sent'] == 25
+    assert stats['batches'] == len(sent)
+    assert stats['stopped_early'] is False
+
+
+def test_run_pipeline_flushes_on_linger():
+    """
+    Test that a partial batch is sent once linger expires, without
+    waiting for the source to finish.
+    """
+    release = threading.Event()
+    sent = []
+
+    def source():
+        yield 'first'
+        release.wait(5)
+        yield 'second'
+
+    def send(batch):
+        sent.append(batch)
+        release.set()
+
+    started = time.monotonic()
+    run_pipeline(source(), identity, send, batch_size=10, linger=0.05)
+
+    assert sent == [['first'], ['second']]
+    assert time.monotonic() - started < 5
+
+
+def test_run_pipeline_overlaps_fetching_and_sending():
+    """
+    Test that fetching continues while a batch is being sent, so the
+    run takes about as long as the slowest stage.
+    """
+    def source():
+        for item in range(4):
+            time.sleep(0.05)
+            yield item
+
+    def send(batch):
+        time.sleep(0.05)
+
+    started = time.monotonic()
+    run_pipeline(source(), identity, send, batch_size=1, linger=0)
+
+    assert time.monotonic() - started < 0.38
+
+
+def test_run_pipeline_applies_backpressure():
+    """
+    Test that a slow sender stops the source from running more than
+    the queues can hold ahead of it.
+    """
+    fetched = []
+    gate = threading.Event()
+
+    def source():
+        for item in range(100):
+            fetched.append(item)
+            yield item
+
+    def send(batch):
+        gate.wait(5)
+
+    thread = threading.Thread(target=run_pipeline, args=(
+        source(), identity, send), kwargs={
+            'batch_size': 2, 'linger': 0, 'queue_size': 2})
+    thread.start()
+    time.sleep(0.3)
+    ahead = len(fetched)
+    gate.set()
+    thread.join(5)
+
+    assert ahead < 15
+    assert len(fetched) == 100
+
+
+def test_run_pipeline_drains_at_deadline():
+    """
+    Test that fetching stops once the deadline passes and everything
+    already fetched is still sent.
+    """
+    def source():
+        for item in range(1000):
+            time.sleep(0.01)
+            yield item
+
+    sent = []
+    stats = run_pipeline(source(), identity, sent.extend, batch_size=5,
+                         linger=0.01, deadline=time.monotonic() + 0.1)
+
+    assert stats['stopped_early'] is True
+    assert 0 < stats['sent'] < 1000
+    assert sent == list(range(stats['fetched']))
+
+
+def test_run_pipeline_closes_the_source():
+    """
+    Test that the source generator is closed when the pipeline stops
+    early, so it can release its HTTP response.
+    """
+    closed = []
+
+    def source():
+        try:
+            for item in range(1000):
+                time.sleep(0.01)
+                yield item
+        finally:
+            closed.append(True)
+
+    run_pipeline(source(), identity, lambda batch: None,
+                 deadline=time.monotonic() + 0.05)
+
+    assert closed == [True]
+
+
+def test_run_pipeline_propagates_send_errors():
+    """
+    Test that an error raised by the sender stops the other stages and
+    is re-raised.
+    """
+    def send(batch):
+        raise RuntimeError('throttled for good')
+
+    with pytest.raises(RuntimeError, match='throttled for good'):
+        run_pipeline(iter(range(10_000)), identity, send, batch_size=10,
+                     queue_size=10)
+
+
+def test_run_pipeline_propagates_source_errors():
+    """
+    Test that an error raised while fetching is re-raised and nothing
+    after it is sent.
+    """
+    def source():
+        yield 1
+        raise ValueError('bad page')
+
+    with pytest.raises(ValueError, match='bad page'):
+        run_pipeline(source(), identity, lambda batch: None, linger=5)
+
+
+def test_deadline_from_context(mocker):
+    """
+    Test that the deadline leaves the margin before the Lambda
+    invocation times out.
+    """
+    context = mocker.Mock()
+    context.get_remaining_time_in_millis.return_value = 30_000
+    mocker.patch('src.pipeline.time.monotonic', return_value=100.0)
+
+    assert deadline_from_context(context, margin=5) == 125.0
+
+
+def test_run_query_pipeline(mocker):
+    """
+    Test that run_query_pipeline() formats the query's articles and
+    sends them with send_batch_to_kinesis().
+    """
+    articles = [{'webPublicationDate': '2023-11-21T11:11:31Z',
+                 'webTitle': f'Title {i}',
+                 'webUrl': f'https://www.theguardian.com/{i}',
+                 'fields': {'body': f'<p>Body {i}</p>'}}
+                for i in range(3)]
+    mock_iter = mocker.patch('src.pipeline.iter_articles',
+                             return_value=iter(articles))
+    mock_send = mocker.patch('src.pipeline.send_batch_to_kinesis')
+
+    stats = run_query_pipeline('ai', 'stream', max_articles=3,
+                               aggregate=True)
+
+    mock_iter.assert_called_once_with(
+        'ai', None, page_size=50, max_articles=3, order_by='newest')
+    batch = mock_send.call_args.args[0]
+    assert [record['webTitle'] for record in batch] == \
+        ['Title 0', 'Title 1', 'Title 2']
+    assert batch[0]['content_preview'] == 'Body 0'
+    assert mock_send.call_args.args[1] == 'stream'
+    assert mock_send.call_args.kwargs == {'aggregate': True}
+    assert stats['sent'] == 3
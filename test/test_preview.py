@@ -0,0 +1,110 @@
+"""This module contains the test suite for
+the extract_preview() function only.
+"""
+
+import pytest
+from src.preview import extract_preview
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('<p>Hello &amp; <b>world</b></p>', 'Hello & world'),
+    ('<p>First</p><p>Second</p>', 'First Second'),
+    ('<p>One<br>Two<br/>Three</p>', 'One Two Three'),
+    ('<p>un<em>broken</em></p>', 'unbroken'),
+    ('<p>\n  Lots   of\n\tspace  </p>', 'Lots of space'),
+    ('<style>p {}</style><p>Text</p><SCRIPT>x()</script>', 'Text'),
+    ('<!-- hidden --><p>Shown</p>', 'Shown'),
+    ('<figure><img src="a.jpg" alt="Alt"></figure><p>Caption</p>',
+     'Caption'),
+    ('x < y &lt; z', 'x < y < z'),
+    ('<p>Cut off <a href="https://www.theguardian.com', 'Cut off'),
+    ('', '')
+])
+def test_extract_preview_text(html, expected):
+    """
+    Test that extract_preview strips markup, decodes entities and
+    collapses whitespace.
+    """
+    assert extract_preview(html) == expected
+
+
+def test_extract_preview_char_limit():
+    """
+    Test that extract_preview stops at max_chars visible characters.
+    """
+    html = '<p>' + '<b>abc</b> ' * 1000 + '</p>'
+
+    preview = extract_preview(html, max_chars=10)
+
+    assert preview == 'abc abc ab'
+
+
+def test_extract_preview_byte_limit():
+    """
+    Test that extract_preview stops at max_bytes UTF-8 bytes without
+    splitting a character.
+    """
+    preview = extract_preview('<p>naïve café</p>', max_bytes=11)
+
+    assert preview == 'naïve caf'
+    assert len(preview.encode('utf-8')) <= 11
+    assert extract_preview('<p>ééé</p>', max_bytes=5) == 'éé'
+
+
+def test_extract_preview_word_boundary():
+    """
+    Test that extract_preview drops a word cut off by the limit when
+    word_boundary is set.
+    """
+    html = '<p>The quick brown fox</p>'
+
+    assert extract_preview(html, max_chars=13) == 'The quick bro'
+    assert extract_preview(
+        html, max_chars=13, word_boundary=True) == 'The quick'
+    assert extract_preview(
+        html, max_chars=9, word_boundary=True) == 'The quick'
+    assert extract_preview(
+        '<p>Unbreakable</p>', max_chars=4, word_boundary=True) == 'Unbr'
+
+
+def test_extract_preview_word_boundary_after_whole_word():
+    """
+    Test that a cut landing just after a whole word keeps that word.
+    """
+    assert extract_preview(
+        'plain text here', 11, word_boundary=True) == 'plain text'
+    assert extract_preview(
+        '<p>Hello world</p><p>Next</p>', 12, word_boundary=True) == \
+        'Hello world'
+
+
+def test_extract_preview_word_split_by_tag():
+    """
+    Test that a word split across tags is treated as one word.
+    """
+    html = '<p>The <b>quick</b>ness</p>'
+
+    assert extract_preview(
+        html, max_chars=9, word_boundary=True) == 'The'
+
+
+def test_extract_preview_plain_text_fast_path():
+    """
+    Test that text without markup is cut to length, with its
+    whitespace collapsed and stripped as for markup.
+    """
+    assert extract_preview('Plain  text', max_chars=7) == 'Plain t'
+    assert extract_preview(' Plain\n\ntext ', max_chars=None) == \
+        'Plain text'
+    assert extract_preview(
+        'Plain text', max_chars=7, word_boundary=True) == 'Plain'
+    assert extract_preview('über', max_bytes=3) == 'üb'
+
+
+def test_extract_preview_no_limit():
+    """
+    Test that extract_preview returns all the text with no limits.
+    """
+    html = '<p>' + 'word ' * 300 + '</p>'
+
+    assert extract_preview(html, max_chars=None) == ('word ' * 300).strip()
@@ -0,0 +1,140 @@
+"""This module contains the test suite for
+the RateLimiter class only.
+"""
+
+import asyncio
+import threading
+import pytest
+from src.rate_limiter import (
+    RateLimiter, RateLimitExceeded, parse_retry_after)
+
+
+class FakeClock:
+    """Replaces time.monotonic and time.sleep with a manual clock."""
+
+    def __init__(self, mocker):
+        self.now = 0.0
+        self.sleeps = []
+        mocker.patch('src.rate_limiter.time.monotonic', side_effect=self.time)
+        mocker.patch('src.rate_limiter.time.sleep', side_effect=self.sleep)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_acquire_spaces_requests(mocker):
+    """
+    Test that acquire spaces requests at exactly the configured rate.
+    """
+    clock = FakeClock(mocker)
+    limiter = RateLimiter(per_second=2, per_day=None)
+
+    for _ in range(5):
+        limiter.acquire()
+
+    assert clock.sleeps == [0.5, 0.5, 0.5, 0.5]
+    assert clock.now == 2.0
+
+
+def test_acquire_does_not_wait_after_idle(mocker):
+    """
+    Test that acquire does not wait when the bucket has refilled.
+    """
+    clock = FakeClock(mocker)
+    limiter = RateLimiter(per_second=1, per_day=None)
+
+    limiter.acquire()
+    clock.now += 5
+    limiter.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_daily_budget(mocker):
+    """
+    Test that the daily budget is counted down and then enforced.
+    """
+    FakeClock(mocker)
+    limiter = RateLimiter(per_second=1000, per_day=2)
+
+    limiter.acquire()
+    assert limiter.remaining_today == 1
+    limiter.acquire()
+    assert limiter.remaining_today == 0
+
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire()
+
+
+def test_throttled_uses_retry_after(mocker):
+    """
+    Test that throttled pauses the next request for Retry-After.
+    """
+    clock = FakeClock(mocker)
+    limiter = RateLimiter(per_second=1, per_day=None)
+    limiter.acquire()
+
+    limiter.throttled(retry_after=10)
+    limiter.acquire()
+
+    assert clock.sleeps == [10]
+
+
+def test_throttled_backs_off_adaptively(mocker):
+    """
+    Test that throttled doubles its pause on consecutive 429s without
+    Retry-After, and resets once a request succeeds.
+    """
+    FakeClock(mocker)
+    limiter = RateLimiter(per_second=1, per_day=None)
+
+    assert [limiter.throttled() for _ in range(3)] == [1.0, 2.0, 4.0]
+    limiter.succeeded()
+    assert limiter.throttled() == 1.0
+
+
+def test_acquire_async(mocker):
+    """
+    Test that acquire_async waits with asyncio.sleep.
+    """
+    FakeClock(mocker)
+    mock_sleep = mocker.patch(
+        'asyncio.sleep', side_effect=lambda seconds: None)
+
+    async def acquire_twice(limiter):
+        await limiter.acquire_async()
+        await limiter.acquire_async()
+
+    limiter = RateLimiter(per_second=4, per_day=None)
+    asyncio.run(acquire_twice(limiter))
+
+    mock_sleep.assert_called_once_with(0.25)
+
+
+def test_acquire_is_thread_safe():
+    """
+    Test that concurrent callers share the budget without losing
+    or double counting tokens.
+    """
+    limiter = RateLimiter(per_second=10000, per_day=200, burst=200)
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(200)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.remaining_today == 0
+
+
+def test_parse_retry_after():
+    """
+    Test that parse_retry_after handles seconds, dates and junk.
+    """
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
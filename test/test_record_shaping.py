@@ -0,0 +1,117 @@
+"""This module contains the test suite for the record shaping stage:
+utf8_size(), trim_to_bytes(), shape_record() and shape_batch().
+"""
+
+import json
+import pytest
+from benchmarks.fake_kinesis import FakeKinesis
+from src.format_article import ArticleRecord
+from src.record_shaping import MAX_RECORD_BYTES, shape_batch, \
+    shape_record, trim_to_bytes, utf8_size
+from src.send_to_kinesis import send_batch_to_kinesis, send_to_kinesis
+from src.serializers import decode_payload, encode_payload
+
+
+def record(index, preview):
+    return ArticleRecord('2024-01-01T00:00:00Z', f'Article {index}',
+                         f'https://g/{index}', preview)
+
+
+def test_trim_to_bytes_never_splits_a_character():
+    """
+    Test that text is cut on a UTF-8 byte budget at a character boundary.
+    """
+    assert utf8_size('café') == 5
+    assert trim_to_bytes('café', 4) == 'caf'
+    assert trim_to_bytes('café', 5) == 'café'
+    assert trim_to_bytes('日本語', 7) == '日本'
+    assert trim_to_bytes('abc', -1) == ''
+
+
+def test_shape_record_trims_preview_to_fit():
+    """
+    Test that a record over the limit has its preview shortened until
+    the encoded payload fits, and that the trim is reported, for escaped
+    non-ASCII JSON as well as compressed payloads.
+    """
+    def encode(item):
+        return json.dumps(item.to_dict())
+
+    big = record(1, 'é' * 200000)
+
+    shaped, data, trim = shape_record(big, 100000, encode)
+    assert utf8_size(data) <= 100000
+    assert json.loads(data)['content_preview'] == shaped.content_preview
+    assert trim['webUrl'] == 'https://g/1'
+    assert trim['preview_bytes'] == 400000
+    assert trim['trimmed_preview_bytes'] < 400000
+
+    shaped, data, trim = shape_record(
+        big, 1000, lambda item: encode_payload(item, 'json', 'gzip'))
+    assert len(data) <= 1000
+    assert 0 < trim['trimmed_preview_bytes'] < 400000
+
+    small = record(2, 'short')
+    assert shape_record(small, 1000, encode) == \
+        (small, json.dumps(small.to_dict()), None)
+
+
+def test_shape_record_rejects_records_too_large_without_preview():
+    """
+    Test that a record that cannot fit even without a preview raises
+    ValueError.
+    """
+    with pytest.raises(ValueError, match='exceeds the Kinesis limit'):
+        shape_record({'webTitle': 'x' * 500, 'content_preview': 'y'}, 100,
+                     json.dumps)
+
+
+def test_shape_batch_splits_in_order():
+    """
+    Test that a list that does not fit is split into consecutive
+    payloads that each fit, keeping every record.
+    """
+    records = [record(index, 'x' * 300) for index in range(20)]
+
+    def encode(batch):
+        return encode_payload(batch, 'json', 'gzip')
+
+    assert len(shape_batch(records, 100000, encode)[0]) == 1
+
+    def plain(batch):
+        return json.dumps([item.to_dict() for item in batch])
+
+    batches, trimmed = shape_batch(records, 2000, plain)
+    assert len(batches) > 1
+    assert all(utf8_size(payload) <= 2000 for _, payload in batches)
+    assert [item for chunk, _ in batches for item in chunk] == records
+    assert trimmed == []
+
+
+def test_oversized_sends_succeed_first_time(mocker):
+    """
+    Test that send_to_kinesis() and send_batch_to_kinesis() put data far
+    over the record limit in one attempt, with every record accepted.
+    """
+    kinesis = FakeKinesis(shard_count=2)
+    mocker.patch('src.send_to_kinesis.get_kinesis_client',
+                 return_value=kinesis)
+    preview = 'ü' * 150000
+    records = [record(index, preview) for index in range(8)] + \
+        [record(8, 'ü' * (MAX_RECORD_BYTES // 2))]
+
+    send_to_kinesis(records, 'stream')
+    put = kinesis.records()
+    assert kinesis.calls['put_record'] == len(put) > 1
+    assert all(len(item['Data']) <= MAX_RECORD_BYTES for item in put)
+    assert [article['webTitle'] for item in put
+            for article in json.loads(item['Data'])] == \
+        [f'Article {index}' for index in range(9)]
+
+    summary = send_batch_to_kinesis(
+        [record(9, '日' * MAX_RECORD_BYTES)], 'stream', client=kinesis)
+    assert summary['trimmed'] == 1
+    assert kinesis.calls['put_records'] == 1
+    last = kinesis.records()[-1]['Data']
+    assert len(last) <= MAX_RECORD_BYTES
+    assert decode_payload(last)['webTitle'] == 'Article 9'
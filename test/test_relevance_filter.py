@@ -0,0 +1,84 @@
+"""This module contains the test suite for
+TermMatcher and RelevanceFilter.
+"""
+
+from src.format_article import format_articles
+from src.metrics import MetricsCollector, set_collector
+from src.relevance_filter import RelevanceFilter, TermMatcher
+
+
+def guardian_article(title, trail=None, body=None):
+    fields = {}
+    if trail:
+        fields['trailText'] = trail
+    if body:
+        fields['body'] = body
+    return {'webTitle': title, 'webUrl': f'https://g/{title}',
+            'fields': fields}
+
+
+def test_term_matcher_finds_overlapping_terms():
+    """
+    Test that the automaton finds every term in one pass, including
+    terms that overlap or are suffixes of one another.
+    """
+    matcher = TermMatcher(['he', 'she', 'his', 'hers', 'machine learning'])
+
+    found = matcher.find('Ushers said machine   learning? no: she, his, he')
+
+    assert {matcher.terms[index] for index in found} == {'she', 'his', 'he'}
+    assert matcher.terms[-1] == 'machine learning'
+    assert matcher.find('She writes on Machine learning.') == {1, 4}
+
+
+def test_term_matcher_matches_whole_words_only():
+    """
+    Test that terms inside longer words are not matched.
+    """
+    matcher = TermMatcher(['ai', 'art'])
+
+    assert matcher.find('Said the artist in Spain') == set()
+    assert matcher.find('AI-generated art') == {0, 1}
+    assert TermMatcher([]).find('anything') == set()
+
+
+def test_relevance_filter_scores_include_and_vetoes_exclude():
+    """
+    Test that articles need min_score of weighted include terms and are
+    dropped on any exclude term.
+    """
+    relevance = RelevanceFilter(
+        include={'climate': 2, 'emissions': 1}, exclude=['football'],
+        min_score=3)
+
+    assert relevance.score('Climate emissions targets') == 3
+    assert relevance.score('Climate and football') is None
+    articles = [
+        guardian_article('Climate deal', trail='Emissions to fall'),
+        guardian_article('Climate deal'),
+        guardian_article('Climate football', trail='emissions'),
+    ]
+    kept_articles, kept = relevance.apply(articles, format_articles(articles))
+
+    assert kept_articles == articles[:1]
+    assert [record.webTitle for record in kept] == ['Climate deal']
+    assert (relevance.kept, relevance.dropped) == (1, 2)
+
+
+def test_relevance_filter_searches_preview_and_counts_drops():
+    """
+    Test that the content preview is searched, that without include
+    terms only exclusions apply, and that drops are counted as a metric.
+    """
+    collector = MetricsCollector()
+    set_collector(collector)
+    relevance = RelevanceFilter(exclude=['sponsored content'])
+    articles = [
+        guardian_article('One', body='<p>Sponsored content by a brand</p>'),
+        guardian_article('Two', body='<p>Reporting</p>'),
+    ]
+
+    kept = relevance.filter_records(articles, format_articles(articles))
+
+    assert [record.webTitle for record in kept] == ['Two']
+    assert collector.snapshot()['counters']['articles_dropped'] == 1
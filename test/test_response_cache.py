@@ -0,0 +1,116 @@
+"""This module contains the test suite for
+the ResponseCache class only.
+"""
+
+from src.response_cache import ResponseCache, make_key
+
+params = {
+    'q': 'machine learning',
+    'api-key': 'test-api-key',
+    'show-fields': 'trailText,body',
+    'from-date': '2023-01-01'
+}
+
+response = {'response': {'status': 'ok', 'results': [{'id': 'article-1'}]}}
+
+
+def test_make_key_normalises_params():
+    """
+    Test that make_key ignores the API key, query spacing and the
+    order of show-fields, but not the query's case.
+    """
+    equivalent = {
+        'from-date': '2023-01-01',
+        'show-fields': 'body, trailText',
+        'q': ' machine   learning ',
+        'api-key': 'another-key'
+    }
+
+    assert make_key(params) == make_key(equivalent)
+    assert 'test-api-key' not in make_key(params)
+    assert make_key(params) != make_key(dict(params, page=2))
+    assert make_key({'q': 'brexit AND trade'}) != \
+        make_key({'q': 'brexit and trade'})
+
+
+def test_cache_miss_then_memory_hit():
+    """
+    Test that a stored response is returned from the memory tier.
+    """
+    cache = ResponseCache(path=None)
+
+    assert cache.get(params) is None
+    cache.set(params, response)
+
+    assert cache.get(params) == response
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1}
+
+
+def test_cache_disk_tier_persists(tmp_path):
+    """
+    Test that a response stored by one cache is served from disk by
+    another cache using the same database.
+    """
+    path = str(tmp_path / 'cache.sqlite3')
+    ResponseCache(path=path).set(params, response)
+
+    cache = ResponseCache(path=path)
+    assert cache.get(params) == response
+    assert cache.get(params) == response
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 1, 'misses': 0}
+
+
+def test_cache_entries_expire(tmp_path, mocker):
+    """
+    Test that entries are not returned once their TTL has passed.
+    """
+    clock = mocker.patch('src.response_cache.time.time', return_value=1000)
+    cache = ResponseCache(path=str(tmp_path / 'cache.sqlite3'), ttl=60)
+    cache.set(params, response)
+
+    clock.return_value = 1061
+    assert cache.get(params) is None
+    assert cache.misses == 1
+
+
+def test_cache_memory_tier_evicts_lru():
+    """
+    Test that the memory tier evicts the least recently used entry.
+    """
+    cache = ResponseCache(path=None, max_memory_entries=2)
+    cache.set(dict(params, page=1), {'page': 1})
+    cache.set(dict(params, page=2), {'page': 2})
+    cache.get(dict(params, page=1))
+    cache.set(dict(params, page=3), {'page': 3})
+
+    assert cache.get(dict(params, page=2)) is None
+    assert cache.get(dict(params, page=1)) == {'page': 1}
+    assert cache.get(dict(params, page=3)) == {'page': 3}
+
+
+def test_cache_disk_tier_evicts_by_size(tmp_path, mocker):
+    """
+    Test that the disk tier evicts the least recently used entries
+    once it holds more than max_disk_bytes.
+    """
+    clock = mocker.patch('src.response_cache.time.time', return_value=1000)
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(path=path, max_disk_bytes=250)
+    for page in range(5):
+        clock.return_value += 1
+        cache.set(dict(params, page=page), {'body': 'x' * 80})
+
+    cold = ResponseCache(path=path)
+    assert cold.get(dict(params, page=0)) is None
+    assert cold.get(dict(params, page=4)) == {'body': 'x' * 80}
+
+
+def test_cache_clear(tmp_path):
+    """
+    Test that clear removes entries from both tiers.
+    """
+    cache = ResponseCache(path=str(tmp_path / 'cache.sqlite3'))
+    cache.set(params, response)
+    cache.clear()
+
+    assert cache.get(params) is None
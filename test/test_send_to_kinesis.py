@@ -3,9 +3,17 @@ for the send_to_kinesis() function only.
 """
 
 import pytest
-from src.send_to_kinesis import send_to_kinesis
+from src.send_to_kinesis import (
+    send_to_kinesis, send_batch_to_kinesis, chunk_entries,
+    KinesisPutRecordsError, MAX_RECORD_BYTES, replay_spool,
+    is_transient_error)
+from src.spool import Spool
+from src.format_article import ArticleRecord
+from src.serializers import decode_payload
+from src.aggregation import deaggregate
 from unittest.mock import patch
-from botocore.exceptions import BotoCoreError, ClientError
+from botocore.exceptions import BotoCoreError, ClientError, \
+    EndpointConnectionError, NoCredentialsError
 import json
 
 
@@ -38,6 +46,22 @@ def test_send_to_kinesis_success(mock_boto_client):
     )
 
 
+@patch('boto3.client')
+def test_send_to_kinesis_partition_strategy(mock_boto_client):
+    """
+    Test that send_to_kinesis takes its partition key, and any explicit
+    hash key, from a partitioning strategy.
+    """
+    mock_kinesis = mock_boto_client.return_value
+
+    send_to_kinesis(data, broker_id, partition_key=lambda record: {
+        'PartitionKey': record['webTitle'][:3], 'ExplicitHashKey': '7'})
+
+    mock_kinesis.put_record.assert_called_once_with(
+        StreamName=broker_id, Data=json.dumps(data), PartitionKey='Who',
+        ExplicitHashKey='7')
+
+
 @patch('boto3.client')
 def test_send_to_kinesis_empty_data(mock_boto_client):
     """
@@ -87,3 +111,450 @@ def test_send_to_kinesis_json_error(mock_boto_client):
 
     with pytest.raises(TypeError):
         send_to_kinesis(malformed_data, broker_id)
+
+
+def put_records_response(*error_codes):
+    """Builds a PutRecords response with the given per-record errors."""
+    records = [{'ErrorCode': code} if code else {'SequenceNumber': '1'}
+               for code in error_codes]
+    return {
+        'FailedRecordCount': sum(1 for code in error_codes if code),
+        'Records': records
+    }
+
+
+@patch('boto3.client')
+def test_send_batch_to_kinesis_one_record_per_article(mock_boto_client):
+    """
+    Test that send_batch_to_kinesis sends each article as its own
+    record in a single PutRecords request.
+    """
+    mock_kinesis = mock_boto_client.return_value
+    mock_kinesis.put_records.return_value = put_records_response(None, None)
+
+    summary = send_batch_to_kinesis(
+        data, broker_id, partitioner='guardian_content')
+
+    mock_kinesis.put_records.assert_called_once_with(
+        StreamName=broker_id,
+        Records=[{'Data': json.dumps(article).encode('utf-8'),
+                  'PartitionKey': 'guardian_content'} for article in data]
+    )
+    assert summary == {'user_records': 2, 'records': 2, 'requests': 1,
+                       'retries': 0, 'spooled': 0, 'trimmed': 0}
+
+
+@patch('boto3.client')
+def test_send_batch_to_kinesis_empty_data(mock_boto_client):
+    """
+    Test that send_batch_to_kinesis does not call put_records
+    when there is no data.
+    """
+    assert send_batch_to_kinesis([], broker_id) is None
+    assert mock_boto_client.return_value.put_records.call_count == 0
+
+
+@patch('src.send_to_kinesis.time.sleep')
+def test_send_batch_to_kinesis_retries_only_failed(mock_sleep, mocker):
+    """
+    Test that send_batch_to_kinesis resends only the entries that
+    were throttled, after a backoff.
+    """
+    client = mocker.Mock()
+    client.put_records.side_effect = [
+        put_records_response(
+            None, 'ProvisionedThroughputExceededException'),
+        put_records_response(None)
+    ]
+
+    summary = send_batch_to_kinesis(
+        data, broker_id, client=client, partitioner='guardian_content')
+
+    assert client.put_records.call_count == 2
+    retried = client.put_records.call_args_list[1].kwargs['Records']
+    assert retried == [{'PartitionKey': 'guardian_content',
+                        'Data': json.dumps(data[1]).encode('utf-8')}]
+    assert mock_sleep.call_count == 1
+    assert summary == {'user_records': 2, 'records': 2, 'requests': 1,
+                       'retries': 1, 'spooled': 0, 'trimmed': 0}
+
+
+@patch('src.send_to_kinesis.time.sleep')
+def test_send_batch_to_kinesis_gives_up_after_retries(mock_sleep, mocker):
+    """
+    Test that send_batch_to_kinesis raises KinesisPutRecordsError
+    with the failed entries once retries are exhausted.
+    """
+    client = mocker.Mock()
+    throttled = put_records_response(
+        'ProvisionedThroughputExceededException')
+    client.put_records.side_effect = [
+        put_records_response(
+            None, 'ProvisionedThroughputExceededException'),
+        throttled, throttled]
+
+    with pytest.raises(KinesisPutRecordsError) as err:
+        send_batch_to_kinesis(data, broker_id, client=client, max_retries=2)
+
+    assert client.put_records.call_count == 3
+    assert len(err.value.failed_entries) == 1
+    assert err.value.error_codes == ['ProvisionedThroughputExceededException']  # noqa
+
+
+def test_send_batch_to_kinesis_non_retryable_error(mocker):
+    """
+    Test that send_batch_to_kinesis does not retry entries that
+    failed with a non-retryable error code.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(
+        'KMSAccessDeniedException', None)
+
+    with pytest.raises(KinesisPutRecordsError):
+        send_batch_to_kinesis(data, broker_id, client=client)
+
+    assert client.put_records.call_count == 1
+
+
+def test_send_batch_to_kinesis_client_error(mocker):
+    """
+    Test that send_batch_to_kinesis raises a ClientError when the
+    whole request is rejected.
+    """
+    client = mocker.Mock()
+    client.put_records.side_effect = ClientError(
+        {"Error": {"Code": "ResourceNotFoundException",
+                   "Message": "Stream not found"}}, "put_records")
+
+    with pytest.raises(ClientError):
+        send_batch_to_kinesis(data, broker_id, client=client)
+
+
+def test_send_batch_to_kinesis_partitions_by_article(mocker):
+    """
+    Test that send_batch_to_kinesis gives each article its own
+    partition key by default.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None, None)
+
+    send_batch_to_kinesis(data, broker_id, client=client)
+
+    records = client.put_records.call_args.kwargs['Records']
+    keys = [record['PartitionKey'] for record in records]
+    assert len(set(keys)) == 2
+
+
+def test_send_batch_to_kinesis_custom_partitioner(mocker):
+    """
+    Test that send_batch_to_kinesis passes the keys returned by a
+    partitioning strategy through to PutRecords.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None, None)
+
+    def partitioner(record):
+        return {'PartitionKey': 'pk', 'ExplicitHashKey': '42'}
+
+    send_batch_to_kinesis(
+        data, broker_id, client=client, partitioner=partitioner)
+
+    records = client.put_records.call_args.kwargs['Records']
+    assert all(record['ExplicitHashKey'] == '42' for record in records)
+
+
+@patch('boto3.client')
+def test_send_to_kinesis_custom_partition_key(mock_boto_client):
+    """
+    Test that send_to_kinesis uses the given partition key.
+    """
+    send_to_kinesis(data, broker_id, partition_key='other')
+
+    put_record = mock_boto_client.return_value.put_record
+    assert put_record.call_args.kwargs['PartitionKey'] == 'other'
+
+
+def test_chunk_entries_respects_record_limit():
+    """
+    Test that chunk_entries splits entries at the record count limit.
+    """
+    entries = [{'Data': b'x', 'PartitionKey': 'k'}] * 1201
+
+    chunks = list(chunk_entries(entries))
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 201]
+
+
+def test_chunk_entries_respects_byte_limit():
+    """
+    Test that chunk_entries splits entries at the request size limit.
+    """
+    entry = {'Data': b'x' * (MAX_RECORD_BYTES - 1), 'PartitionKey': 'k'}
+
+    chunks = list(chunk_entries([entry] * 11))
+
+    assert [len(chunk) for chunk in chunks] == [5, 5, 1]
+
+
+def test_chunk_entries_rejects_oversized_record():
+    """
+    Test that chunk_entries raises a ValueError for a record over
+    the 1 MB limit.
+    """
+    entry = {'Data': b'x' * MAX_RECORD_BYTES, 'PartitionKey': 'k'}
+
+    with pytest.raises(ValueError, match='exceeds the Kinesis limit'):
+        list(chunk_entries([entry]))
+
+
+@patch('boto3.client')
+def test_send_to_kinesis_article_records(mock_boto_client, mocker):
+    """
+    Test that send_to_kinesis serializes ArticleRecords straight to the
+    same bytes as the equivalent dicts, without converting them.
+    """
+    records = [ArticleRecord(content_preview='', **article)
+               for article in data]
+    expected = [dict(article, content_preview='') for article in data]
+    mocker.patch.object(ArticleRecord, 'to_dict', side_effect=AssertionError)
+
+    send_to_kinesis(records, broker_id)
+
+    put_record = mock_boto_client.return_value.put_record
+    assert put_record.call_args.kwargs['Data'] == \
+        json.dumps(expected).encode()
+
+
+def test_send_batch_to_kinesis_article_records(mocker):
+    """
+    Test that send_batch_to_kinesis sends ArticleRecords as JSON.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None, None)
+    records = [ArticleRecord(content_preview='', **article)
+               for article in data]
+
+    send_batch_to_kinesis(records, broker_id, client=client)
+
+    sent = client.put_records.call_args.kwargs['Records']
+    assert [json.loads(entry['Data']) for entry in sent] == [
+        record.to_dict() for record in records]
+
+
+@patch('boto3.client')
+def test_send_to_kinesis_compressed(mock_boto_client):
+    """
+    Test that send_to_kinesis writes a framed payload when a
+    compression is chosen.
+    """
+    send_to_kinesis(data, broker_id, compression='gzip')
+
+    put_record = mock_boto_client.return_value.put_record
+    assert decode_payload(put_record.call_args.kwargs['Data']) == data
+
+
+def test_send_batch_to_kinesis_serializer(mocker):
+    """
+    Test that send_batch_to_kinesis encodes each record with the
+    chosen serializer and compression.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None, None)
+
+    send_batch_to_kinesis(data, broker_id, client=client,
+                          serializer='json', compression='gzip')
+
+    sent = client.put_records.call_args.kwargs['Records']
+    assert [decode_payload(entry['Data']) for entry in sent] == data
+
+
+def test_send_batch_to_kinesis_unknown_serializer(mocker):
+    """
+    Test that send_batch_to_kinesis raises a ValueError for an
+    unknown serializer without sending anything.
+    """
+    client = mocker.Mock()
+
+    with pytest.raises(ValueError, match='Unknown serializer'):
+        send_batch_to_kinesis(data, broker_id, client=client,
+                              serializer='pickle')
+
+    client.put_records.assert_not_called()
+
+
+def test_send_batch_to_kinesis_aggregated(mocker):
+    """
+    Test that send_batch_to_kinesis packs articles on the same shard
+    into one aggregated record that deaggregates back to the articles.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None)
+    shard_ranges = [('0', str(2 ** 128 - 1))]
+
+    summary = send_batch_to_kinesis(
+        data, broker_id, client=client, aggregate=True,
+        shard_ranges=shard_ranges)
+
+    sent = client.put_records.call_args.kwargs['Records']
+    assert len(sent) == 1
+    user_records = deaggregate(sent[0]['Data'])
+    assert [json.loads(record['Data']) for record in user_records] == data
+    assert summary['user_records'] == 2 and summary['records'] == 1
+    client.list_shards.assert_not_called()
+
+
+def test_send_batch_to_kinesis_aggregated_fetches_shards(mocker):
+    """
+    Test that send_batch_to_kinesis looks up the shard map when
+    aggregating without one.
+    """
+    client = mocker.Mock()
+    client.list_shards.return_value = {'Shards': [{
+        'ShardId': 'shard-0',
+        'HashKeyRange': {'StartingHashKey': '0',
+                         'EndingHashKey': str(2 ** 128 - 1)},
+        'SequenceNumberRange': {'StartingSequenceNumber': '1'}}]}
+    client.put_records.return_value = put_records_response(None)
+
+    send_batch_to_kinesis(data, broker_id, client=client, aggregate=True)
+
+    client.list_shards.assert_called_once_with(StreamName=broker_id)
+    assert len(client.put_records.call_args.kwargs['Records']) == 1
+
+
+@patch('boto3.client')
+def test_send_to_kinesis_spools_on_failure(mock_boto_client, tmp_path):
+    """
+    Test that with a spool, a record that cannot be sent because of a
+    transient error is kept for replay instead of raising.
+    """
+    mock_boto_client.return_value.put_record.side_effect = \
+        EndpointConnectionError(endpoint_url='https://kinesis')
+    spool = Spool(str(tmp_path))
+
+    summary = send_to_kinesis(data, broker_id, spool=spool)
+
+    assert summary == {'records': 0, 'spooled': 1}
+    published = []
+    spool.replay(published.extend)
+    assert published[0].broker_id == broker_id
+    assert published[0].partition_key == 'guardian_content'
+    assert json.loads(published[0].data) == data
+
+
+def test_send_batch_to_kinesis_spools_failed_entries(mocker, tmp_path):
+    """
+    Test that with a spool, only the entries that still failed after
+    retrying are spooled.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(
+        None, 'ProvisionedThroughputExceededException')
+    spool = Spool(str(tmp_path))
+
+    summary = send_batch_to_kinesis(data, broker_id, client=client,
+                                    partitioner='pk', spool=spool,
+                                    max_retries=0)
+
+    assert summary['records'] == 1
+    assert summary['spooled'] == 1
+    published = []
+    spool.replay(published.extend)
+    assert [json.loads(record.data) for record in published] == [data[1]]
+
+
+@patch('boto3.client')
+def test_send_to_kinesis_raises_permanent_errors_with_spool(
+        mock_boto_client, tmp_path):
+    """
+    Test that with a spool, an error no retry will fix, such as a
+    missing stream, is still raised and nothing is spooled.
+    """
+    mock_boto_client.return_value.put_record.side_effect = ClientError(
+        {'Error': {'Code': 'ResourceNotFoundException'},
+         'ResponseMetadata': {'HTTPStatusCode': 400}}, 'PutRecord')
+    spool = Spool(str(tmp_path))
+
+    with pytest.raises(ClientError):
+        send_to_kinesis(data, broker_id, spool=spool)
+
+    published = []
+    spool.replay(published.extend)
+    assert published == []
+
+
+def test_send_batch_to_kinesis_raises_permanent_failures_with_spool(
+        mocker, tmp_path):
+    """
+    Test that with a spool, entries failing with a non-retryable error
+    code are raised rather than spooled.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(
+        None, 'KMSAccessDeniedException')
+    spool = Spool(str(tmp_path))
+
+    with pytest.raises(KinesisPutRecordsError):
+        send_batch_to_kinesis(data, broker_id, client=client,
+                              partitioner='pk', spool=spool)
+
+    published = []
+    spool.replay(published.extend)
+    assert published == []
+
+
+@pytest.mark.parametrize('err, transient', [
+    (ClientError({'Error': {'Code': 'ThrottlingException'}}, 'PutRecord'),
+     True),
+    (ClientError({'Error': {'Code': 'InternalFailure'},
+                  'ResponseMetadata': {'HTTPStatusCode': 503}}, 'PutRecord'),
+     True),
+    (ClientError({'Error': {'Code': 'AccessDeniedException'},
+                  'ResponseMetadata': {'HTTPStatusCode': 400}}, 'PutRecord'),
+     False),
+    (ClientError({'Error': {'Code': 'ValidationException'}}, 'PutRecord'),
+     False),
+    (EndpointConnectionError(endpoint_url='https://kinesis'), True),
+    (NoCredentialsError(), False),
+    (KinesisPutRecordsError([{}], ['ProvisionedThroughputExceededException']),
+     True),
+    (KinesisPutRecordsError([{}, {}], ['InternalFailure',
+                                       'KMSAccessDeniedException']), False)
+])
+def test_is_transient_error(err, transient):
+    """
+    Test that throttling, 5xx and connection errors are transient and
+    errors no retry will fix are not.
+    """
+    assert is_transient_error(err) is transient
+
+
+def test_replay_spool_sends_in_order(mocker, tmp_path):
+    """
+    Test that replay_spool() sends spooled records with PutRecords, in
+    order, keeping their keys.
+    """
+    client = mocker.Mock()
+    client.put_records.return_value = put_records_response(None, None)
+    spool = Spool(str(tmp_path))
+    spool.append(broker_id, 'pk-1', b'one', explicit_hash_key='7')
+    spool.append(broker_id, 'pk-2', b'two')
+
+    summary = replay_spool(spool, client=client)
+
+    assert summary['replayed'] == 2
+    client.put_records.assert_called_once_with(
+        StreamName=broker_id,
+        Records=[{'PartitionKey': 'pk-1', 'Data': b'one',
+                  'ExplicitHashKey': '7'},
+                 {'PartitionKey': 'pk-2', 'Data': b'two'}])
+
+
+def test_replay_spool_empty_creates_no_client(tmp_path):
+    """
+    Test that replaying an empty spool does not create a Kinesis client.
+    """
+    with patch('boto3.client') as mock_boto_client:
+        replay_spool(Spool(str(tmp_path)))
+
+    mock_boto_client.assert_not_called()
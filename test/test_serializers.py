@@ -0,0 +1,126 @@
+"""This module contains the test suite for
+the payload serializers and codecs only.
+"""
+
+import json
+import sys
+import pytest
+from src.format_article import ArticleRecord
+from src.serializers import (
+    encode_payload, decode_payload, encode_json, get_serializer, get_codec,
+    MAGIC)
+
+articles = [
+    {"webPublicationDate": "2023-11-21T11:11:31Z",
+     "webTitle": "Café society",
+     "webUrl": "https://www.theguardian.com/article-1",
+     "content_preview": "Preview " * 50},
+    {"webPublicationDate": None,
+     "webTitle": "Second",
+     "webUrl": "https://www.theguardian.com/article-2",
+     "content_preview": ""}
+]
+
+
+def available(module):
+    """Returns True if an optional module can be imported."""
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+FORMATS = ['json'] + [name for name in ('orjson', 'msgpack')
+                      if available(name)]
+CODECS = [None, 'gzip'] + (['zstd'] if available('zstandard') else [])
+
+
+@pytest.mark.parametrize('serializer', FORMATS)
+@pytest.mark.parametrize('compression', CODECS)
+def test_round_trip(serializer, compression):
+    """
+    Test that decode_payload reads back every format and codec.
+    """
+    payload = encode_payload(articles, serializer, compression)
+
+    assert isinstance(payload, bytes)
+    assert decode_payload(payload) == articles
+
+
+def test_plain_json_is_unframed():
+    """
+    Test that plain JSON payloads are written without a header, so
+    existing consumers can still read them.
+    """
+    payload = encode_payload(articles)
+
+    assert payload == json.dumps(articles).encode('utf-8')
+    assert decode_payload(payload.decode('utf-8')) == articles
+
+
+def test_framed_header():
+    """
+    Test that other formats carry the format and codec ids.
+    """
+    payload = encode_payload(articles, 'json', 'gzip')
+
+    assert payload[:4] == MAGIC + bytes([1, 1])
+    assert len(payload) < len(json.dumps(articles))
+
+
+@pytest.mark.parametrize('serializer', FORMATS)
+def test_article_records(serializer):
+    """
+    Test that ArticleRecords serialize the same as their dicts.
+    """
+    records = [ArticleRecord(**article) for article in articles]
+
+    assert decode_payload(encode_payload(records, serializer)) == articles
+    assert decode_payload(encode_payload(records[0], serializer)) == \
+        articles[0]
+
+
+def test_encode_json():
+    """
+    Test that encode_json() writes a list of ArticleRecords straight to
+    the bytes json.dumps() gives for their dicts, and other data with
+    json.dumps().
+    """
+    records = [ArticleRecord(**article) for article in articles]
+
+    assert encode_json(records) == json.dumps(articles).encode()
+    assert encode_json(articles) == json.dumps(articles)
+
+
+def test_unknown_names():
+    """
+    Test that unknown serializers and codecs raise a ValueError.
+    """
+    with pytest.raises(ValueError, match='Unknown serializer'):
+        get_serializer('pickle')
+    with pytest.raises(ValueError, match='Unknown compression'):
+        get_codec('lz4')
+
+
+def test_unknown_header_ids():
+    """
+    Test that decode_payload rejects unknown format and codec ids.
+    """
+    with pytest.raises(ValueError, match='format id'):
+        decode_payload(MAGIC + bytes([9, 0]) + b'{}')
+    with pytest.raises(ValueError, match='codec id'):
+        decode_payload(MAGIC + bytes([1, 9]) + b'{}')
+    with pytest.raises(ValueError, match='truncated'):
+        decode_payload(MAGIC)
+
+
+def test_missing_optional_dependency(monkeypatch):
+    """
+    Test that a format whose package is missing raises an ImportError
+    explaining what to install.
+    """
+    monkeypatch.setitem(sys.modules, 'msgpack', None)
+
+    with pytest.raises(ImportError, match='pip install msgpack'):
+        encode_payload(articles, 'msgpack')
@@ -0,0 +1,136 @@
+"""This module contains the test suite for
+the Spool class.
+"""
+
+import os
+import time
+import pytest
+from src.spool import Spool, SpooledRecord
+
+
+def spooled_data(records):
+    return [record.data for record in records]
+
+
+def test_spool_replays_in_order(tmp_path):
+    """
+    Test that spooled records are replayed oldest first with their keys
+    and removed once published.
+    """
+    spool = Spool(str(tmp_path))
+    spool.append('stream', 'pk-1', b'one')
+    spool.append('stream', 'pk-2', 'two', explicit_hash_key='42')
+    spool.close()
+
+    published = []
+    summary = Spool(str(tmp_path)).replay(published.extend)
+
+    assert summary == {'replayed': 2, 'expired': 0}
+    assert published[0] == SpooledRecord(
+        'stream', 'pk-1', b'one', None, published[0].created)
+    assert published[1].explicit_hash_key == '42'
+    assert published[1].data == b'two'
+    assert Spool(str(tmp_path)).replay(published.extend)['replayed'] == 0
+
+
+def test_spool_rolls_segments(tmp_path):
+    """
+    Test that a new segment is started once one is full, and replay
+    still covers every segment in order.
+    """
+    spool = Spool(str(tmp_path), segment_bytes=100)
+    for i in range(10):
+        spool.append('stream', 'pk', f'record {i}'.encode() * 3)
+
+    assert len(os.listdir(tmp_path)) > 1
+
+    published = []
+    spool.replay(published.extend)
+    assert spooled_data(published) == \
+        [f'record {i}'.encode() * 3 for i in range(10)]
+
+
+def test_spool_keeps_unpublished_records_on_failure(tmp_path):
+    """
+    Test that if publishing fails, the records not yet published are
+    kept, in order, and later records are appended after them.
+    """
+    spool = Spool(str(tmp_path))
+    for i in range(5):
+        spool.append('stream', 'pk', str(i))
+
+    def failing(records):
+        if records[0].data == b'2':
+            raise ConnectionError('stream unavailable')
+
+    with pytest.raises(ConnectionError):
+        spool.replay(failing, batch_size=2)
+    spool.append('stream', 'pk', '5')
+
+    published = []
+    spool.replay(published.extend)
+    assert spooled_data(published) == [b'2', b'3', b'4', b'5']
+
+
+def test_spool_discards_expired_records(tmp_path):
+    """
+    Test that records older than max_age are discarded, not replayed.
+    """
+    spool = Spool(str(tmp_path), max_age=60)
+    spool.append('stream', 'pk', 'old', created=time.time() - 120)
+    spool.append('stream', 'pk', 'new')
+
+    published = []
+    summary = spool.replay(published.extend)
+
+    assert summary == {'replayed': 1, 'expired': 1}
+    assert spooled_data(published) == [b'new']
+
+
+def test_spool_size_cap_drops_oldest(tmp_path):
+    """
+    Test that the oldest segments are dropped once the spool is over
+    its size cap.
+    """
+    spool = Spool(str(tmp_path), max_bytes=300, segment_bytes=100)
+    for i in range(20):
+        spool.append('stream', 'pk', f'{i:040d}')
+
+    assert spool.size() <= 300 + 100
+    published = []
+    spool.replay(published.extend)
+    assert spooled_data(published)[-1] == f'{19:040d}'.encode()
+    assert len(published) < 20
+
+
+def test_spool_ignores_torn_write(tmp_path):
+    """
+    Test that a frame cut short by a crash ends the segment without
+    losing the records before it.
+    """
+    spool = Spool(str(tmp_path))
+    spool.append('stream', 'pk', 'kept')
+    spool.append('stream', 'pk', 'torn')
+    spool.close()
+    path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    with open(path, 'r+b') as segment:
+        segment.truncate(os.path.getsize(path) - 2)
+
+    published = []
+    Spool(str(tmp_path)).replay(published.extend)
+    assert spooled_data(published) == [b'kept']
+
+
+def test_spool_batches_fsync(tmp_path, mocker):
+    """
+    Test that appends are fsynced once per sync_every records and on
+    flush.
+    """
+    mock_fsync = mocker.patch('src.spool.os.fsync')
+    spool = Spool(str(tmp_path), sync_every=3)
+    for i in range(7):
+        spool.append('stream', 'pk', str(i))
+    assert mock_fsync.call_count == 2
+
+    spool.flush()
+    assert mock_fsync.call_count == 3
@@ -0,0 +1,128 @@
+"""This module contains the test suite for
+the ResultsStreamParser class only.
+"""
+
+import json
+import pytest
+from src.stream_parser import ResultsStreamParser, iter_results
+
+response = {
+    'response': {
+        'status': 'ok',
+        'userTier': 'developer',
+        'total': 3,
+        'pages': 2,
+        'results': [
+            {
+                'id': 'article-1',
+                'webTitle': 'Braces {inside} [strings] and "quotes"',
+                'tags': [{'id': 'tag-1'}, {'id': 'tag-2'}],
+                'fields': {'body': '<p>café \\ back\\slash</p>' * 10}
+            },
+            {
+                'id': 'article-2',
+                'webTitle': 'Unicode ☃ title',
+                'fields': {'trailText': 'Short'}
+            },
+            {'id': 'article-3', 'isHosted': False, 'score': 1.5e-3}
+        ],
+        'orderBy': 'newest'
+    }
+}
+
+raw = json.dumps(response, indent=1, ensure_ascii=False).encode('utf-8')
+
+
+def chunked(data, size):
+    """Splits data into chunks of the given size."""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, len(raw)])
+def test_iter_results_any_chunk_size(size):
+    """
+    Test that iter_results yields the same articles as json.loads
+    however the response is split, including mid-character.
+    """
+    meta = {}
+
+    articles = list(iter_results(chunked(raw, size), meta=meta))
+
+    assert articles == response['response']['results']
+    assert meta == {'status': 'ok', 'userTier': 'developer', 'total': 3,
+                    'pages': 2, 'orderBy': 'newest'}
+
+
+def test_parser_yields_articles_as_they_complete():
+    """
+    Test that each article is returned by the feed that completes it.
+    """
+    parser = ResultsStreamParser()
+    first_end = raw.index(b'"id": "article-2"')
+
+    first = parser.feed(raw[:first_end])
+    rest = parser.feed(raw[first_end:])
+    parser.close()
+
+    assert [article['id'] for article in first] == ['article-1']
+    assert [article['id'] for article in rest] == ['article-2', 'article-3']
+    assert parser.done
+
+
+def test_parser_truncates_bodies():
+    """
+    Test that bodies longer than max_body_chars are truncated.
+    """
+    articles = list(iter_results(chunked(raw, 5), max_body_chars=12))
+
+    assert articles[0]['fields']['body'] == '<p>café \\ ba'
+    assert articles[1]['fields'] == {'trailText': 'Short'}
+
+
+def test_parser_compacts_buffer():
+    """
+    Test that consumed text is dropped from the buffer on large
+    responses.
+    """
+    results = [{'id': f'article-{i}', 'fields': {'body': 'x' * 1000}}
+               for i in range(500)]
+    data = json.dumps({'response': {'results': results}}).encode('utf-8')
+    parser = ResultsStreamParser()
+
+    count = 0
+    for chunk in chunked(data, 4096):
+        count += len(parser.feed(chunk))
+        assert len(parser._buf) < 80 * 1024
+    parser.close()
+
+    assert count == 500
+
+
+def test_parser_empty_results():
+    """
+    Test that an empty results list yields nothing.
+    """
+    data = b'{"response": {"status": "ok", "results": [], "pages": 0}}'
+    meta = {}
+
+    assert list(iter_results([data], meta=meta)) == []
+    assert meta == {'status': 'ok', 'pages': 0}
+
+
+def test_parser_truncated_response():
+    """
+    Test that a response that ends early raises a ValueError.
+    """
+    with pytest.raises(ValueError, match='ended unexpectedly'):
+        list(iter_results([raw[:len(raw) // 2]]))
+
+
+def test_parser_malformed_response():
+    """
+    Test that a response of the wrong shape raises a ValueError.
+    """
+    with pytest.raises(ValueError, match="an array for 'results'"):
+        list(iter_results([b'{"response": {"results": {}}}']))
+
+    with pytest.raises(ValueError, match="expected '{'"):
+        list(iter_results([b'[]']))
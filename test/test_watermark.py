@@ -0,0 +1,98 @@
+"""This module contains the test suite for
+the incremental polling watermark only.
+"""
+
+from src.watermark import (
+    BoundedIdSet, Watermark, WatermarkStore, iter_new_articles)
+
+
+def article(article_id, published):
+    """Builds a minimal raw Guardian article."""
+    return {'id': article_id, 'webPublicationDate': published}
+
+
+def test_bounded_id_set_forgets_oldest():
+    """
+    Test that BoundedIdSet only remembers the most recent ids.
+    """
+    seen = BoundedIdSet(max_size=2)
+    for article_id in ['a', 'b', 'c']:
+        seen.add(article_id)
+
+    assert 'a' not in seen
+    assert 'b' in seen and 'c' in seen
+    assert len(seen) == 2
+    assert all(len(fingerprint) == 16 for fingerprint in seen.to_list())
+
+
+def test_watermark_advance():
+    """
+    Test that advance records ids and keeps the latest date.
+    """
+    watermark = Watermark()
+    watermark.advance([article('a', '2024-01-02T10:00:00Z'),
+                       article('b', '2024-01-01T10:00:00Z')])
+
+    assert watermark.latest == '2024-01-02T10:00:00Z'
+    assert watermark.date_from == '2024-01-02'
+    assert not watermark.is_new(article('b', None))
+    assert watermark.is_older(article('c', '2024-01-01T23:59:59Z'))
+
+
+def test_watermark_store_round_trip(tmp_path):
+    """
+    Test that WatermarkStore persists state per query.
+    """
+    store = WatermarkStore(path=str(tmp_path / 'watermarks.json'))
+    watermark = Watermark()
+    watermark.advance([article('a', '2024-01-02T10:00:00Z')])
+    store.save('test', watermark)
+
+    loaded = WatermarkStore(path=store.path).get('test')
+    assert loaded.latest == '2024-01-02T10:00:00Z'
+    assert not loaded.is_new(article('a', None))
+    assert WatermarkStore(path=store.path).get('other').latest is None
+
+
+def test_watermark_store_ignores_corrupt_file(tmp_path):
+    """
+    Test that WatermarkStore starts afresh from a corrupt file.
+    """
+    path = tmp_path / 'watermarks.json'
+    path.write_text('{not json')
+
+    assert WatermarkStore(path=str(path)).get('test').latest is None
+
+
+def test_iter_new_articles_pages_oldest_first_from_mark(mocker):
+    """
+    Test that iter_new_articles pages oldest first from the mark's
+    date, skipping articles older than the mark and seen articles.
+    """
+    watermark = Watermark()
+    watermark.advance([article('b', '2024-01-02T10:00:00Z')])
+    mock_api = mocker.patch('src.watermark.iter_articles', return_value=iter([
+        article('a', '2024-01-02T09:00:00Z'),
+        article('b', '2024-01-02T10:00:00Z'),
+        article('c', '2024-01-02T11:00:00Z'),
+        article('d', '2024-01-02T12:00:00Z')
+    ]))
+
+    new = list(iter_new_articles('test', watermark, max_articles=1))
+
+    assert [item['id'] for item in new] == ['c']
+    assert mock_api.call_args.args == ('test', '2024-01-02')
+    assert mock_api.call_args.kwargs['order_by'] == 'oldest'
+
+
+def test_iter_new_articles_max_articles(mocker):
+    """
+    Test that iter_new_articles stops after max_articles.
+    """
+    mocker.patch('src.watermark.iter_articles', return_value=iter([
+        article('c', '2024-01-03T00:00:00Z'),
+        article('b', '2024-01-02T00:00:00Z')]))
+
+    new = list(iter_new_articles('test', Watermark(), max_articles=1))
+
+    assert [item['id'] for item in new] == ['c']